@@ -0,0 +1,344 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+逐题答案采集
+答题过程中前端按小批量上报答案，先进入进程内写后队列，由后台线程每隔几十毫秒把各请求的答案
+合并到一个事务写入 answer_sessions 表，写入后请求才返回；同时维护各维度的分数和与题数，最终提交时
+只需汇总已算好的结果。刷新或崩溃后可从服务器恢复已作答的题目
+"""
+
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+
+from answer_store import UNANSWERED, decode_answer, encode_answer, get_sheet_layout, load_sheet_layouts
+from database import TRANSIENT_ERRORS, begin, is_postgres, lock_key
+from employees import legacy_company_sql
+from scoring import get_scoring_plan
+
+logger = logging.getLogger(__name__)
+
+# 后台线程合并写入的间隔（秒）：请求等待写入后才返回，间隔即最长的额外等待时间
+FLUSH_INTERVAL = 0.05
+# 请求等待写入的最长时间（秒）
+SAVE_TIMEOUT = 10
+
+
+def ensure_answer_session_tables(conn):
+    """创建答题进度表（幂等）；PostgreSQL 的表结构见 postgres_schema.sql"""
+    if is_postgres(conn):
+        return
+    c = conn.cursor()
+    columns = [row[1] for row in c.execute('PRAGMA table_info(answer_sessions)')]
+    # 早期的答题进度表以工号为主键：改为 (公司名称, 员工工号)，按工号补上员工所属公司
+    if columns and '公司名称' not in columns:
+        c.execute('ALTER TABLE answer_sessions RENAME TO answer_sessions_old')
+    c.execute('''CREATE TABLE IF NOT EXISTS answer_sessions (
+        公司名称 TEXT NOT NULL,
+        员工工号 TEXT NOT NULL,
+        题库版本 INTEGER NOT NULL,
+        评分版本 INTEGER NOT NULL,
+        答案 BLOB NOT NULL,
+        维度分数 TEXT NOT NULL,
+        维度题数 TEXT NOT NULL,
+        更新时间 TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (公司名称, 员工工号)
+    )''')
+    if columns and '公司名称' not in columns:
+        c.execute(f'''INSERT OR REPLACE INTO answer_sessions
+            SELECT {legacy_company_sql('o.员工工号')}, o.员工工号, o.题库版本, o.评分版本, o.答案, o.维度分数, o.维度题数, o.更新时间
+            FROM answer_sessions_old o''')
+        c.execute('DROP TABLE answer_sessions_old')
+    conn.commit()
+
+
+class AnswerSession:
+    """单个员工的答题进度及各维度累计分"""
+
+    __slots__ = ('company', 'emp_no', 'layout', 'config_version', 'blob', 'sums', 'counts')
+
+    def __init__(self, company, emp_no, layout, config_version, blob, sums, counts):
+        self.company = company
+        self.emp_no = emp_no
+        self.layout = layout
+        self.config_version = config_version
+        self.blob = bytearray(blob)
+        self.sums = sums
+        self.counts = counts
+
+    @classmethod
+    def empty(cls, company, emp_no, plan, layout):
+        n = len(plan.slots)
+        return cls(company, emp_no, layout, plan.config_version, bytes(len(layout.ids)), [0] * n, [0] * n)
+
+    def rebase(self, plan, layout):
+        """题库或评分配置已变化：按题号迁移已作答内容并重新累计"""
+        answers = self.layout.unpack(self.blob)
+        self.layout = layout
+        self.config_version = plan.config_version
+        self.blob = bytearray(layout.pack(answers))
+        self.sums, self.counts = plan.tally(layout.unpack(self.blob))
+
+    def apply(self, plan, answers):
+        """写入一批答案；同一题重复上报时先扣除旧答案的得分再计入新答案"""
+        layout = self.layout
+        for ans in answers:
+            pos = layout.index.get(ans.get('id'))
+            if pos is None:
+                continue
+            is_rating = layout.rating[pos]
+            new = encode_answer(ans.get('answer'), is_rating)
+            old = self.blob[pos]
+            if new == old:
+                continue
+            entry = plan.lookup(layout.ids[pos])
+            if entry is not None:
+                slots, scorer = entry
+                if old != UNANSWERED:
+                    self._add(slots, -scorer(decode_answer(old, is_rating)), -1)
+                if new != UNANSWERED:
+                    self._add(slots, scorer(decode_answer(new, is_rating)), 1)
+            self.blob[pos] = new
+
+    def _add(self, slots, value, count):
+        for slot in slots:
+            self.sums[slot] += value
+            self.counts[slot] += count
+
+    def missing(self, ids):
+        """ids 中尚未保存答案的题号"""
+        index = self.layout.index
+        return [q_id for q_id in ids
+                if q_id in index and self.blob[index[q_id]] == UNANSWERED]
+
+    def answered(self):
+        """已作答题目 [{id, answer}, ...]"""
+        return self.layout.unpack(self.blob)
+
+
+def load_session(conn, company, emp_no, plan, layout):
+    """读取答题进度，版本不一致时自动迁移；不存在或已随提交关闭时返回 None"""
+    try:
+        row = conn.execute('''SELECT 题库版本, 评分版本, 答案, 维度分数, 维度题数
+            FROM answer_sessions WHERE 公司名称 = ? AND 员工工号 = ? AND 已提交 = 0''', (company, emp_no)).fetchone()
+    except sqlite3.OperationalError:
+        # 尚未有人逐题上报过答案
+        return None
+    if row is None:
+        return None
+    bank_version, config_version, blob, sums, counts = row
+    if bank_version == layout.version:
+        session_layout = layout
+    else:
+        session_layout = load_sheet_layouts(conn).get(bank_version)
+        if session_layout is None:
+            logger.warning(f"员工 {emp_no} 的答题进度缺少题库版本 {bank_version} 的布局，已丢弃")
+            return None
+    session = AnswerSession(company, emp_no, session_layout, config_version, blob,
+                            json.loads(sums), json.loads(counts))
+    if session_layout is not layout or config_version != plan.config_version:
+        session.rebase(plan, layout)
+    return session
+
+
+def save_session(conn, session):
+    conn.execute('''INSERT INTO answer_sessions
+        (公司名称, 员工工号, 题库版本, 评分版本, 答案, 维度分数, 维度题数, 更新时间)
+        VALUES (?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+        ON CONFLICT (公司名称, 员工工号) DO UPDATE SET
+            题库版本 = excluded.题库版本, 评分版本 = excluded.评分版本, 答案 = excluded.答案,
+            维度分数 = excluded.维度分数, 维度题数 = excluded.维度题数, 更新时间 = excluded.更新时间''', (
+        session.company, session.emp_no, session.layout.version, session.config_version, bytes(session.blob),
+        json.dumps(session.sums), json.dumps(session.counts)
+    ))
+
+
+def close_session(conn, company, emp_no):
+    """提交答卷时关闭答题进度：清空已保存的答案并标记为已提交。提交前发出、提交后才到达的答案
+    不再写入（见 AnswerWriteBehind），员工重新登录后才重新接收答案（不提交事务）"""
+    conn.execute('''INSERT INTO answer_sessions (公司名称, 员工工号, 题库版本, 评分版本, 答案, 维度分数, 维度题数, 已提交, 更新时间)
+        VALUES (?, ?, 0, 0, ?, '[]', '[]', 1, CURRENT_TIMESTAMP)
+        ON CONFLICT (公司名称, 员工工号) DO UPDATE SET
+            答案 = excluded.答案, 维度分数 = excluded.维度分数, 维度题数 = excluded.维度题数,
+            已提交 = 1, 更新时间 = excluded.更新时间''', (company, emp_no, b''))
+
+
+def reopen_session(conn, company, emp_no):
+    """员工登录开始新的答题：删除上次提交留下的已关闭进度，未提交的进度保留用于继续答题（不提交事务）"""
+    conn.execute('DELETE FROM answer_sessions WHERE 公司名称 = ? AND 员工工号 = ? AND 已提交 = 1',
+                 (company, emp_no))
+
+
+def is_session_closed(conn, company, emp_no):
+    return conn.execute('SELECT 1 FROM answer_sessions WHERE 公司名称 = ? AND 员工工号 = ? AND 已提交 = 1',
+                        (company, emp_no)).fetchone() is not None
+
+
+def clear_answer_sessions(conn):
+    """删除全部答题进度"""
+    conn.execute('DELETE FROM answer_sessions')
+
+
+class AnswerWriteBehind:
+    """进程内写后队列：后台线程按固定间隔把各请求上报的答案合并到一个事务写入，写入后请求才返回
+
+    请求确认时答案已在共享的数据库（或分片）中，最终提交由任一工作进程处理都能看到全部答案。
+    写入时员工的答题进度已随提交关闭的答案不再写入，迟到的请求不会在提交后重新生成答题进度
+    """
+
+    def __init__(self, db, interval=FLUSH_INTERVAL):
+        # db 为存储仓库，按公司分片时答题进度写入员工所在的分片
+        self.db = db
+        self.interval = interval
+        self._queue = queue.Queue()
+        # 队列中有答案时置位；后台线程等待一个合并间隔后取出全部答案写入
+        self._ready = threading.Event()
+        self._start_lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        # 后台线程长期持有的连接：存储仓库 -> 连接
+        self._conns = {}
+
+    def submit(self, company, emp_no, answers):
+        """放入一批答案，返回 Future，写入后得到 True，答题进度已关闭而未写入时得到 False"""
+        self._ensure_thread()
+        future = Future()
+        self._queue.put(((company, emp_no), answers, future))
+        self._ready.set()
+        return future
+
+    def save(self, company, emp_no, answers, timeout=SAVE_TIMEOUT):
+        """放入一批答案并等待写入，返回值同 submit()；写入失败或超时时抛出异常"""
+        return self.submit(company, emp_no, answers).result(timeout)
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def _ensure_thread(self):
+        # fork 出的子进程中没有父进程的后台线程，需要重新启动
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or self._pid != os.getpid() or not self._thread.is_alive():
+                self._pid = os.getpid()
+                self._conns = {}
+                self._thread = threading.Thread(target=self._run, name='answer-write-behind', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            self._ready.wait()
+            # 等待一个合并间隔，让同一时间段的答案在一个事务内写入
+            time.sleep(self.interval)
+            # 先清除再写入：写入期间新放入的答案会重新置位
+            self._ready.clear()
+            self._flush()
+
+    def _connection(self, db):
+        conn = self._conns.get(db)
+        if conn is None:
+            conn = self._conns[db] = db.connect()
+        return conn
+
+    def _discard(self, db):
+        """出错后关闭连接（可能已断开，如数据库重启），下次写入时重新打开"""
+        conn = self._conns.pop(db, None)
+        if conn is not None:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+    def _retry(self, items):
+        # 数据库繁忙等临时错误：放回队列等待下次写入，调用方继续等待
+        for item in items:
+            self._queue.put(item)
+        self._ready.set()
+
+    def _flush(self):
+        """把队列中的答案合并写入数据库（只在后台线程中执行）"""
+        batch = []
+        while True:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        if not batch:
+            return
+
+        try:
+            # 评分计划和答卷布局取自主库
+            conn = self._connection(self.db)
+            plan = get_scoring_plan(conn)
+            layout = get_sheet_layout(conn)
+            # 读取评分计划等时可能已隐式开始事务
+            if conn.in_transaction:
+                conn.commit()
+        except TRANSIENT_ERRORS as e:
+            logger.warning(f"读取评分计划失败，稍后重试: {e}")
+            self._discard(self.db)
+            self._retry(batch)
+            return
+        except Exception as e:
+            logger.error(f"写入答题进度失败: {e}")
+            self._discard(self.db)
+            for *_, future in batch:
+                future.set_exception(e)
+            return
+
+        # 分片只在员工登录时创建：尚无分片的公司没有员工，其答案不写入
+        by_shard = {}
+        for item in batch:
+            shard = self.db.existing_shard(item[0][0])
+            if shard is None:
+                item[2].set_result(False)
+                continue
+            by_shard.setdefault(shard, []).append(item)
+
+        # 各分片各自一个事务，一个分片繁忙不影响其他分片写入
+        for shard, items in by_shard.items():
+            try:
+                written = self._save_sessions(self._connection(shard), plan, layout, items)
+            except TRANSIENT_ERRORS as e:
+                logger.warning(f"写入答题进度失败，稍后重试: {e}")
+                self._retry(items)
+                continue
+            except Exception as e:
+                logger.error(f"写入答题进度失败: {e}")
+                self._discard(shard)
+                for *_, future in items:
+                    future.set_exception(e)
+                continue
+            for key, _, future in items:
+                future.set_result(key in written)
+
+    @staticmethod
+    def _save_sessions(conn, plan, layout, items):
+        """在一个事务中把一批答案合并写入答题进度，返回写入了答案的员工 {(公司名称, 员工工号)}"""
+        grouped = {}
+        for key, answers, _ in items:
+            grouped.setdefault(key, []).extend(answers)
+        written = set()
+        begin(conn, immediate=True)
+        try:
+            for (company, emp_no), answers in sorted(grouped.items()):
+                # 多个进程同时写同一员工的进度时排队，避免读改写互相覆盖
+                lock_key(conn, 'answer_sessions', company, emp_no)
+                if is_session_closed(conn, company, emp_no):
+                    logger.info(f"员工 {emp_no} 已提交答卷，忽略迟到的答案")
+                    continue
+                session = (load_session(conn, company, emp_no, plan, layout)
+                           or AnswerSession.empty(company, emp_no, plan, layout))
+                session.apply(plan, answers)
+                save_session(conn, session)
+                written.add((company, emp_no))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        return written
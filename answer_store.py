@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+答卷存储
+每份答卷按题号顺序压缩为一个字节一题的 BLOB，并记录题库版本，
+用于后续重新评分、审计和题目分析
+"""
+
+import json
+import threading
+
+from database import is_postgres
+from employees import legacy_company_sql
+from question_bank import get_bank_version
+from scoring import RATING_TYPES
+
+# 字节编码：0 表示未作答，0xFF 表示无法识别的答案，其余为规范化后的单个 ASCII 字符
+UNANSWERED = 0
+INVALID = 0xFF
+
+_layout_lock = threading.Lock()
+_layout = None
+
+
+def ensure_answer_sheet_tables(conn):
+    """创建答卷表及题序布局表（幂等）；PostgreSQL 的表结构见 postgres_schema.sql"""
+    if is_postgres(conn):
+        return
+    c = conn.cursor()
+    c.execute('''CREATE TABLE IF NOT EXISTS answer_sheets (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        公司名称 TEXT NOT NULL DEFAULT '',
+        员工工号 TEXT NOT NULL,
+        题库版本 INTEGER NOT NULL,
+        评分版本 INTEGER,
+        答案 BLOB NOT NULL,
+        创建时间 TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )''')
+    # 早期创建的答卷表缺少评分版本字段
+    c.execute('PRAGMA table_info(answer_sheets)')
+    columns = [col[1] for col in c.fetchall()]
+    if '评分版本' not in columns:
+        c.execute('ALTER TABLE answer_sheets ADD COLUMN 评分版本 INTEGER')
+    # 早期的答卷只按工号记录，按工号补上员工所属公司
+    if '公司名称' not in columns:
+        c.execute("ALTER TABLE answer_sheets ADD COLUMN 公司名称 TEXT NOT NULL DEFAULT ''")
+        c.execute(f"UPDATE answer_sheets SET 公司名称 = {legacy_company_sql('answer_sheets.员工工号')}")
+    # 每个题库版本的题号顺序，解包旧答卷时使用
+    c.execute('''CREATE TABLE IF NOT EXISTS answer_sheet_layouts (
+        题库版本 INTEGER PRIMARY KEY,
+        题号 TEXT NOT NULL,
+        评分题 TEXT NOT NULL
+    )''')
+    c.execute('DROP INDEX IF EXISTS idx_answer_sheets_gonghao')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_answer_sheets_employee ON answer_sheets(公司名称, 员工工号)')
+    conn.commit()
+
+
+class SheetLayout:
+    """某个题库版本下的答卷字节布局"""
+
+    __slots__ = ('version', 'ids', 'index', 'rating')
+
+    def __init__(self, version, ids, rating):
+        self.version = version
+        self.ids = tuple(ids)
+        self.index = {q_id: pos for pos, q_id in enumerate(self.ids)}
+        # rating[pos] 为真表示该题按1-5分制作答
+        self.rating = tuple(bool(flag) for flag in rating)
+
+    def pack(self, answers):
+        """[{id, answer}, ...] -> bytes，同一题重复作答时以最后一次为准"""
+        buf = bytearray(len(self.ids))
+        index = self.index
+        rating = self.rating
+        for ans in answers:
+            pos = index.get(ans['id'])
+            if pos is None:
+                continue
+            buf[pos] = encode_answer(ans['answer'], rating[pos])
+        return bytes(buf)
+
+    def unpack(self, blob):
+        """bytes -> [{id, answer}, ...]，与 pack 前的评分结果一致"""
+        answers = []
+        for q_id, code, is_rating in zip(self.ids, blob, self.rating):
+            if code == UNANSWERED:
+                continue
+            answers.append({'id': q_id, 'answer': decode_answer(code, is_rating)})
+        return answers
+
+
+def decode_answer(code, is_rating):
+    """单字节 -> 答案值（INVALID 解码为 None，计分时按无效答案处理）"""
+    if code == INVALID:
+        return None
+    if is_rating:
+        return code - 0x30
+    return chr(code)
+
+
+def encode_answer(answer_value, is_rating):
+    """按计分时的规范化规则把答案压成一个字节"""
+    if is_rating:
+        try:
+            return 0x30 + max(1, min(5, int(answer_value)))
+        except (TypeError, ValueError, OverflowError):
+            return INVALID
+    key = str(answer_value).strip().upper()
+    if len(key) == 1 and 0x21 <= ord(key) <= 0x7E:
+        return ord(key)
+    return INVALID
+
+
+def _build_layout(conn, version):
+    """按题号顺序为题库中的每道题分配位置（含选项格式有误、出题时被跳过的题目）"""
+    rows = conn.execute('SELECT id, 题目类型 FROM questions ORDER BY id').fetchall()
+    return SheetLayout(version, [r[0] for r in rows], [r[1] in RATING_TYPES for r in rows])
+
+
+def get_sheet_layout(conn):
+    """返回当前题库版本的答卷布局，题库变化时才重新构建"""
+    global _layout
+    version = get_bank_version(conn)
+    layout = _layout
+    if layout is not None and layout.version == version:
+        return layout
+    with _layout_lock:
+        if _layout is None or _layout.version != version:
+            layout = _build_layout(conn, version)
+            conn.execute('''INSERT INTO answer_sheet_layouts (题库版本, 题号, 评分题) VALUES (?, ?, ?)
+                ON CONFLICT DO NOTHING''',
+                         (version, json.dumps(layout.ids), json.dumps([int(f) for f in layout.rating])))
+            conn.commit()
+            _layout = layout
+        return _layout
+
+
+def read_sheet_layout(conn):
+    """只读地返回当前题库版本的答卷布局（供题目接口使用）：尚未缓存时直接构建，不保存也不缓存"""
+    version = get_bank_version(conn)
+    layout = _layout
+    if layout is not None and layout.version == version:
+        return layout
+    return _build_layout(conn, version)
+
+
+def load_sheet_layouts(conn):
+    """读取全部历史题库版本的答卷布局 {题库版本: SheetLayout}"""
+    layouts = {}
+    for version, ids, rating in conn.execute('SELECT 题库版本, 题号, 评分题 FROM answer_sheet_layouts'):
+        layouts[version] = SheetLayout(version, json.loads(ids), json.loads(rating))
+    return layouts
+
+
+def save_answer_sheet(conn, 公司名称, 员工工号, layout, blob, config_version=None):
+    """保存一份答卷及评分所用的配置版本（不提交事务，由调用方统一提交）"""
+    conn.execute('INSERT INTO answer_sheets (公司名称, 员工工号, 题库版本, 评分版本, 答案) VALUES (?, ?, ?, ?, ?)',
+                 (公司名称, 员工工号, layout.version, config_version, blob))
+
+
+def clear_answer_sheets(conn):
+    """删除全部答卷"""
+    conn.execute('DELETE FROM answer_sheets')
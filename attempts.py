@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测评记录
+每次提交在 assessment_attempts 表中追加一行得分，不再改写员工行的全部得分列；重新测评时
+历次记录都保留，可用于对比同一员工多次测评的变化。employees.最新测评ID 指向员工最近一次的
+记录，读取当前得分时按主键关联这一行；管理端用于筛选的列（EMPLOYEE_FILTER_COLUMNS）另在员工行上
+冗余保存最新一次的取值，筛选时沿员工表的复合索引分页。表结构由 migrations.py 的第 12、15 个迁移创建
+"""
+
+from database import lock_key
+from scoring import EMPLOYEE_SCORE_COLUMNS
+
+# 员工行关联其最新测评记录，员工别名为 e、测评记录别名为 a
+LATEST_ATTEMPT_JOIN = 'LEFT JOIN assessment_attempts a ON a.id = e.最新测评ID'
+# 员工行上冗余保存的最新测评的列，最新测评指针或其得分变化时同步
+EMPLOYEE_FILTER_COLUMNS = ('行为模式类型',)
+_SYNC_FILTER_COLUMNS = ', '.join(
+    f'{col} = (SELECT a.{col} FROM assessment_attempts a WHERE a.id = employees.最新测评ID)'
+    for col in EMPLOYEE_FILTER_COLUMNS)
+
+
+def record_attempt(conn, 公司名称, 员工工号, values, config_version=None):
+    """追加一次测评得分（顺序同 EMPLOYEE_SCORE_COLUMNS），关联该员工最近保存的答卷，
+    并把员工的最新测评指向它；员工不存在时不写入。返回是否写入（不提交事务）"""
+    # 同一员工的两次提交并发时排队，最新测评指向后提交的一次
+    lock_key(conn, 'assessment_attempts', 公司名称, 员工工号)
+    columns = ', '.join(EMPLOYEE_SCORE_COLUMNS)
+    placeholders = ', '.join('?' * len(EMPLOYEE_SCORE_COLUMNS))
+    written = conn.execute(f'''INSERT INTO assessment_attempts (公司名称, 员工工号, 答卷ID, 评分版本, {columns})
+        SELECT ?, ?, (SELECT MAX(id) FROM answer_sheets WHERE 公司名称 = ? AND 员工工号 = ?), ?, {placeholders}
+        WHERE EXISTS (SELECT 1 FROM employees WHERE 公司名称 = ? AND 工号 = ?)''',
+                           (公司名称, 员工工号, 公司名称, 员工工号, config_version) + tuple(values)
+                           + (公司名称, 员工工号)).rowcount
+    if written:
+        update_latest_attempts(conn, [(公司名称, 员工工号)])
+    return bool(written)
+
+
+def update_latest_attempts(conn, keys):
+    """把 keys 中各员工 (公司名称, 工号) 的最新测评指向其编号最大的测评记录，并同步冗余的筛选列（不提交事务）"""
+    keys = list(keys)
+    conn.executemany('''UPDATE employees SET 最新测评ID = (SELECT MAX(id) FROM assessment_attempts
+        WHERE 公司名称 = ? AND 员工工号 = ?) WHERE 公司名称 = ? AND 工号 = ?''',
+                     [(company, emp_no, company, emp_no) for company, emp_no in keys])
+    conn.executemany(f'UPDATE employees SET {_SYNC_FILTER_COLUMNS} WHERE 公司名称 = ? AND 工号 = ?', keys)
+
+
+def sync_filter_columns(conn):
+    """按各员工的最新测评重新填写冗余的筛选列，测评记录的得分被整体改写（重新评分）后调用（不提交事务）"""
+    conn.execute(f'UPDATE employees SET {_SYNC_FILTER_COLUMNS} WHERE 最新测评ID IS NOT NULL')
+
+
+def list_attempts(conn, 公司名称, 员工工号):
+    """一位员工的全部测评记录，按提交先后排序"""
+    c = conn.execute(f'''SELECT id, 评分版本, 提交时间, {", ".join(EMPLOYEE_SCORE_COLUMNS)}
+        FROM assessment_attempts WHERE 公司名称 = ? AND 员工工号 = ? ORDER BY id''', (公司名称, 员工工号))
+    cols = [d[0] for d in c.description]
+    rows = [dict(zip(cols, r)) for r in c.fetchall()]
+    for row in rows:
+        # PostgreSQL 返回 datetime，统一为与 SQLite 相同的文本格式
+        row['提交时间'] = str(row['提交时间']) if row['提交时间'] is not None else None
+    return rows
+
+
+def clear_attempts(conn):
+    """删除全部测评记录"""
+    conn.execute('DELETE FROM assessment_attempts')
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+评分与提交性能基准测试
+基于真实的125道题库生成随机答卷，分别测量：
+  score   - 仅评分（ScoringPlan.score）
+  submit  - 通过 Flask 测试客户端完整调用 /api/submit（临时 SQLite 数据库）
+在 1 / 100 / 10000 份答卷规模下报告吞吐量、p50/p99 延迟与峰值内存，并与基线文件对比
+
+用法：
+    python benchmark.py                      # 运行并与基线对比
+    python benchmark.py --sizes 1 100        # 指定规模
+    python benchmark.py --save-baseline      # 把本次结果写为新基线
+"""
+
+import argparse
+import contextlib
+import gc
+import json
+import logging
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+BASELINE_FILE = os.path.join(BASE_DIR, 'benchmark_baseline.json')
+DEFAULT_SIZES = (1, 100, 10000)
+# 吞吐量低于基线的该比例视为性能回退
+DEFAULT_TOLERANCE = 0.2
+# 样本太少时波动很大，只展示对比结果，不判定回退
+MIN_COMPARE_COUNT = 100
+
+
+def generate_sheets(question_rows, count, seed=42):
+    """按题目类型生成随机答卷 [[{id, answer}, ...], ...]"""
+    rng = random.Random(seed)
+    choices = []
+    for q_id, q_type, options in question_rows:
+        if q_type in ('评分', '反向题'):
+            choices.append((q_id, [1, 2, 3, 4, 5]))
+        else:
+            n = max(2, options.count(';') + 1)
+            choices.append((q_id, [chr(65 + i) for i in range(n)]))
+    return [[{'id': q_id, 'answer': rng.choice(values)} for q_id, values in choices]
+            for _ in range(count)]
+
+
+def _percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    k = min(len(sorted_values) - 1, max(0, int(round(pct / 100 * (len(sorted_values) - 1)))))
+    return sorted_values[k]
+
+
+def measure(run_one, items, with_memory=True):
+    """逐个执行 run_one(item)，返回吞吐量、延迟分位数与峰值内存"""
+    gc.collect()
+    latencies = []
+    start = time.perf_counter()
+    for item in items:
+        t0 = time.perf_counter_ns()
+        run_one(item)
+        latencies.append(time.perf_counter_ns() - t0)
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    result = {
+        'count': len(items),
+        'throughput': round(len(items) / elapsed, 1) if elapsed > 0 else 0.0,
+        'p50_ms': round(_percentile(latencies, 50) / 1e6, 4),
+        'p99_ms': round(_percentile(latencies, 99) / 1e6, 4),
+    }
+    if with_memory:
+        # 单独再跑一遍测峰值内存，避免 tracemalloc 影响计时
+        gc.collect()
+        tracemalloc.start()
+        try:
+            for item in items:
+                run_one(item)
+            result['peak_mem_kb'] = round(tracemalloc.get_traced_memory()[1] / 1024, 1)
+        finally:
+            tracemalloc.stop()
+    return result
+
+
+@contextlib.contextmanager
+def temp_workspace():
+    """在临时目录中初始化数据库并加载应用（new_app 使用相对路径的 new_questions.db）"""
+    old_cwd = os.getcwd()
+    workdir = tempfile.mkdtemp(prefix='ceping-bench-')
+    sys.path.insert(0, BASE_DIR)
+    try:
+        os.chdir(workdir)
+        with contextlib.redirect_stdout(open(os.devnull, 'w', encoding='utf-8')):
+            from init_database import init_database
+            init_database()
+        import new_app
+        # 基准测试只关心评分路径本身，关闭逐请求的 INFO 日志
+        logging.getLogger().setLevel(logging.WARNING)
+        yield new_app
+    finally:
+        os.chdir(old_cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def run_benchmarks(sizes, with_memory=True):
+    import sqlite3
+    results = {}
+    with temp_workspace() as new_app:
+        from scoring import get_scoring_plan
+        conn = sqlite3.connect('new_questions.db')
+        rows = conn.execute('SELECT id, 题目类型, 选项 FROM questions ORDER BY id').fetchall()
+        plan = get_scoring_plan(conn)
+        conn.close()
+        snapshot = os.path.join(os.getcwd(), 'snapshot.db')
+        shutil.copy('new_questions.db', snapshot)
+
+        client = new_app.app.test_client()
+        for size in sizes:
+            sheets = generate_sheets(rows, size)
+
+            results[f'score/{size}'] = measure(plan.score, sheets, with_memory)
+
+            # 每个规模使用干净的数据库，登录不计入耗时；先关闭应用复用的连接再替换数据库文件
+            new_app.repo.close()
+            shutil.copy(snapshot, 'new_questions.db')
+            emp_nos = [f'B{i:06d}' for i in range(size)]
+            for emp_no in emp_nos:
+                client.post('/api/login', json={'公司名称': '基准测试', '员工名称': emp_no, '员工工号': emp_no})
+            payloads = [{'公司名称': '基准测试', '员工工号': emp_no, 'answers': sheet}
+                        for emp_no, sheet in zip(emp_nos, sheets)]
+
+            def submit_one(payload):
+                response = client.post('/api/submit', json=payload)
+                if response.status_code != 200:
+                    raise RuntimeError(f'/api/submit 返回 {response.status_code}: {response.get_data(as_text=True)}')
+
+            results[f'submit/{size}'] = measure(submit_one, payloads, with_memory)
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """与基线对比吞吐量，返回回退的项目列表"""
+    regressions = []
+    for key, result in results.items():
+        base = baseline.get(key)
+        if not base or not base.get('throughput'):
+            result['vs_baseline'] = None
+            continue
+        ratio = result['throughput'] / base['throughput']
+        result['vs_baseline'] = round(ratio, 3)
+        if ratio < 1 - tolerance and result['count'] >= MIN_COMPARE_COUNT:
+            regressions.append(key)
+    return regressions
+
+
+def print_report(results, regressions):
+    header = f"{'项目':<14}{'数量':>8}{'吞吐量/秒':>14}{'p50(ms)':>12}{'p99(ms)':>12}{'峰值内存(KB)':>16}{'对比基线':>10}"
+    print(header)
+    print('-' * len(header))
+    for key, r in results.items():
+        ratio = r.get('vs_baseline')
+        ratio_text = '-' if ratio is None else f'{ratio:.2f}x'
+        if key in regressions:
+            ratio_text += ' ✗'
+        print(f"{key:<14}{r['count']:>8}{r['throughput']:>14}{r['p50_ms']:>12}{r['p99_ms']:>12}"
+              f"{r.get('peak_mem_kb', '-'):>16}{ratio_text:>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='评分与提交性能基准测试')
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(DEFAULT_SIZES), help='答卷数量')
+    parser.add_argument('--baseline', default=BASELINE_FILE, help='基线文件路径')
+    parser.add_argument('--save-baseline', action='store_true', help='把本次结果写为基线')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE, help='允许的吞吐量下降比例')
+    parser.add_argument('--no-memory', action='store_true', help='跳过峰值内存测量')
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.sizes, with_memory=not args.no_memory)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f).get('results', {})
+    regressions = compare(results, baseline, args.tolerance)
+    print_report(results, regressions)
+
+    if args.save_baseline:
+        stored = {key: {k: v for k, v in r.items() if k != 'vs_baseline'} for key, r in results.items()}
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump({
+                'python': sys.version.split()[0],
+                'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+                'results': stored
+            }, f, ensure_ascii=False, indent=2)
+        print(f'✓ 基线已保存到 {args.baseline}')
+    elif regressions:
+        print(f"✗ 性能回退: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+离线批量评分导入
+纸质测评或离线终端收集的答卷事后导入：读取 CSV 或 JSONL，由进程池使用与 /api/submit
+相同的评分计划并行评分，主进程按大批次单事务写入 employees、answer_sheets 和 assessment_attempts，最后重建常模
+
+输入格式（每份答卷都需要 公司名称、员工名称、员工工号，也接受 姓名/工号 作为列名）：
+  JSONL：每行一个对象，answers 为 [{"id": 1, "answer": "A"}, ...] 或 {"1": "A", ...}
+  CSV：表头中的题号列写作 1、Q1 或 题1，空单元格视为未作答
+
+用法：python bulk_score.py answers.csv [--db new_questions.db] [--workers 8] [--batch-size 20000] [--dry-run]
+"""
+
+import argparse
+import csv
+import json
+import logging
+import multiprocessing
+import os
+import re
+import sqlite3
+import sys
+import time
+
+from answer_store import get_sheet_layout
+from attempts import update_latest_attempts
+from migrations import migrate
+from norms import rebuild_norms
+from scoring import EMPLOYEE_SCORE_COLUMNS, employee_score_values, get_scoring_plan
+
+logger = logging.getLogger(__name__)
+
+DB_NAME = 'new_questions.db'
+# 每个进程池任务包含的答卷数
+CHUNK_SIZE = 2000
+# 每个写入事务包含的答卷数
+DEFAULT_BATCH_SIZE = 20000
+# 最多打印的错误行数
+MAX_REPORTED_ERRORS = 20
+
+QUESTION_COLUMN = re.compile(r'^(?:Q|题)?\s*(\d+)$', re.IGNORECASE)
+IDENTITY_FIELDS = {
+    '公司名称': ('公司名称',),
+    '员工名称': ('员工名称', '姓名'),
+    '员工工号': ('员工工号', '工号'),
+}
+
+# 工作进程内的评分上下文，由 _init_worker 填充
+_worker = {}
+
+
+def _pick(record, names):
+    for name in names:
+        value = record.get(name)
+        if value is not None and str(value).strip():
+            return str(value).strip()
+    return ''
+
+
+def _identity(record):
+    identity = {field: _pick(record, names) for field, names in IDENTITY_FIELDS.items()}
+    missing = [field for field, value in identity.items() if not value]
+    if missing:
+        raise ValueError(f"缺少 {'、'.join(missing)}")
+    return identity['员工工号'], identity['员工名称'], identity['公司名称']
+
+
+def _answers_from_json(raw):
+    if isinstance(raw, dict):
+        return [{'id': int(q_id), 'answer': value} for q_id, value in raw.items()]
+    if isinstance(raw, list):
+        return [{'id': int(ans['id']), 'answer': ans.get('answer')} for ans in raw]
+    raise ValueError('answers 必须是数组或对象')
+
+
+def parse_jsonl_line(line):
+    """JSONL 的一行 -> (工号, 姓名, 公司名称, answers)"""
+    record = json.loads(line)
+    if not isinstance(record, dict):
+        raise ValueError('每行必须是 JSON 对象')
+    emp_no, name, company = _identity(record)
+    return emp_no, name, company, _answers_from_json(record.get('answers'))
+
+
+def csv_columns(header):
+    """解析表头，返回 ({字段: 列号}, [(列号, 题号), ...])"""
+    header = [h.strip().lstrip('﻿') for h in header]
+    fields = {h: i for i, h in enumerate(header) if h}
+    questions = []
+    for i, h in enumerate(header):
+        match = QUESTION_COLUMN.match(h)
+        if match:
+            questions.append((i, int(match.group(1))))
+    if not questions:
+        raise ValueError('CSV 表头中没有题号列')
+    return fields, questions
+
+
+def parse_csv_row(row, fields, questions):
+    """CSV 的一行 -> (工号, 姓名, 公司名称, answers)"""
+    record = {name: row[i] for name, i in fields.items() if i < len(row)}
+    emp_no, name, company = _identity(record)
+    answers = [{'id': q_id, 'answer': row[i].strip()}
+               for i, q_id in questions if i < len(row) and row[i].strip()]
+    return emp_no, name, company, answers
+
+
+def _init_worker(db_path, csv_header):
+    conn = sqlite3.connect(db_path, timeout=30)
+    try:
+        _worker['plan'] = get_scoring_plan(conn)
+        _worker['layout'] = get_sheet_layout(conn)
+    finally:
+        conn.close()
+    _worker['csv'] = csv_columns(csv_header) if csv_header is not None else None
+
+
+def _score_chunk(chunk):
+    """在工作进程中解析并评分一批原始记录，返回 (结果列表, 错误列表)"""
+    plan = _worker['plan']
+    layout = _worker['layout']
+    csv_layout = _worker['csv']
+    results = []
+    errors = []
+    for line_no, raw in chunk:
+        try:
+            if csv_layout is None:
+                emp_no, name, company, answers = parse_jsonl_line(raw)
+            else:
+                emp_no, name, company, answers = parse_csv_row(raw, *csv_layout)
+            if not answers:
+                raise ValueError('没有作答记录')
+            scores = plan.score(answers)
+            results.append((emp_no, name, company, employee_score_values(scores), layout.pack(answers)))
+        except Exception as e:
+            errors.append((line_no, f'{type(e).__name__}: {e}'))
+    return results, errors
+
+
+def read_chunks(path, fmt, chunk_size=CHUNK_SIZE):
+    """按块读取原始记录 [(行号, 原始内容), ...]，CSV 的表头通过第一个返回值给出"""
+    f = open(path, 'r', encoding='utf-8-sig', newline='')
+    header = None
+    if fmt == 'csv':
+        reader = csv.reader(f)
+        header = next(reader, None)
+        if header is None:
+            f.close()
+            raise ValueError('CSV 文件为空')
+        csv_columns(header)
+        rows = ((reader.line_num, row) for row in reader if any(cell.strip() for cell in row))
+    else:
+        rows = ((i, line) for i, line in enumerate(f, 1) if line.strip())
+
+    def chunks():
+        try:
+            chunk = []
+            for item in rows:
+                chunk.append(item)
+                if len(chunk) >= chunk_size:
+                    yield chunk
+                    chunk = []
+            if chunk:
+                yield chunk
+        finally:
+            f.close()
+
+    return header, chunks()
+
+
+def _existing_employees(conn, keys):
+    """keys 中已存在的 (公司名称, 工号)"""
+    keys = set(keys)
+    emp_nos = sorted({emp_no for _, emp_no in keys})
+    existing = set()
+    for i in range(0, len(emp_nos), 500):
+        part = emp_nos[i:i + 500]
+        placeholders = ','.join('?' * len(part))
+        existing.update(r for r in conn.execute(
+            f'SELECT 公司名称, 工号 FROM employees WHERE 工号 IN ({placeholders})', part) if r in keys)
+    return existing
+
+
+def write_batch(conn, results, layout_version, config_version):
+    """单事务写入一批评分结果：不存在的 (公司名称, 工号) 新建、已存在的更新姓名；每份答卷都追加原始答卷
+    和一条测评记录，员工的最新测评指向其最后一份"""
+    # 同一批次内重复的员工以最后一份的姓名为准
+    latest = {}
+    for item in results:
+        latest[(item[2], item[0])] = item
+    updated = len(_existing_employees(conn, latest))
+
+    score_columns = ', '.join(EMPLOYEE_SCORE_COLUMNS)
+    placeholders = ', '.join('?' * (4 + len(EMPLOYEE_SCORE_COLUMNS)))
+    try:
+        conn.executemany('''INSERT INTO employees (姓名, 工号, 公司名称) VALUES (?, ?, ?)
+            ON CONFLICT (公司名称, 工号) DO UPDATE SET 姓名 = excluded.姓名''',
+                         [(name, emp_no, company) for emp_no, name, company, _, _ in latest.values()])
+        c = conn.cursor()
+        attempts = []
+        for emp_no, _, company, values, blob in results:
+            c.execute('''INSERT INTO answer_sheets (公司名称, 员工工号, 题库版本, 评分版本, 答案)
+                VALUES (?, ?, ?, ?, ?)''', (company, emp_no, layout_version, config_version, blob))
+            # 测评记录关联刚写入的答卷
+            attempts.append((company, emp_no, c.lastrowid, config_version) + values)
+        conn.executemany(f'''INSERT INTO assessment_attempts (公司名称, 员工工号, 答卷ID, 评分版本, {score_columns})
+            VALUES ({placeholders})''', attempts)
+        update_latest_attempts(conn, latest)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return updated, len(latest) - updated
+
+
+def bulk_score(path, db_path=DB_NAME, fmt=None, workers=None, batch_size=DEFAULT_BATCH_SIZE, dry_run=False):
+    """导入并评分，返回统计信息 {scored, updated, inserted, errors}"""
+    if fmt is None:
+        fmt = 'csv' if path.lower().endswith('.csv') else 'jsonl'
+    workers = workers or os.cpu_count() or 1
+
+    conn = sqlite3.connect(db_path, timeout=30)
+    try:
+        # 工作进程只读数据库，布局等需要写入的准备工作在主进程完成
+        migrate(conn)
+        plan = get_scoring_plan(conn)
+        layout = get_sheet_layout(conn)
+        # 仅对本连接生效：批量导入时减少 fsync
+        conn.execute('PRAGMA synchronous = NORMAL')
+
+        header, chunks = read_chunks(path, fmt)
+        stats = {'scored': 0, 'updated': 0, 'inserted': 0, 'errors': []}
+        pending = []
+
+        def flush():
+            if pending and not dry_run:
+                updated, inserted = write_batch(conn, pending, layout.version, plan.config_version)
+                stats['updated'] += updated
+                stats['inserted'] += inserted
+            pending.clear()
+
+        with multiprocessing.Pool(workers, initializer=_init_worker, initargs=(db_path, header)) as pool:
+            for results, errors in pool.imap(_score_chunk, chunks):
+                stats['scored'] += len(results)
+                stats['errors'].extend(errors)
+                pending.extend(results)
+                if len(pending) >= batch_size:
+                    flush()
+                    logger.info(f"已写入 {stats['scored']} 份答卷")
+        flush()
+
+        if not dry_run and stats['scored']:
+            rebuild_norms(conn)
+            conn.commit()
+        return stats
+    finally:
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='离线答卷批量评分导入')
+    parser.add_argument('file', help='CSV 或 JSONL 答卷文件')
+    parser.add_argument('--db', default=DB_NAME, help='数据库文件路径')
+    parser.add_argument('--format', choices=['csv', 'jsonl'], help='文件格式，默认按扩展名判断')
+    parser.add_argument('--workers', type=int, help='评分进程数，默认为 CPU 核数')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help='每个写入事务的答卷数')
+    parser.add_argument('--dry-run', action='store_true', help='只评分不写入数据库')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    start = time.perf_counter()
+    try:
+        stats = bulk_score(args.file, args.db, args.format, args.workers, args.batch_size, args.dry_run)
+    except (OSError, ValueError) as e:
+        print(f'✗ {e}')
+        sys.exit(1)
+    elapsed = time.perf_counter() - start
+
+    for line_no, message in stats['errors'][:MAX_REPORTED_ERRORS]:
+        print(f'✗ 第 {line_no} 行: {message}')
+    if len(stats['errors']) > MAX_REPORTED_ERRORS:
+        print(f"✗ ……共 {len(stats['errors'])} 行错误")
+    print(f"✓ 评分 {stats['scored']} 份答卷，更新 {stats['updated']} 人，新建 {stats['inserted']} 人，"
+          f"耗时 {elapsed:.1f} 秒{'（未写入数据库）' if args.dry_run else ''}")
+    if stats['errors']:
+        sys.exit(2)
+
+
+if __name__ == '__main__':
+    main()
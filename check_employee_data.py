@@ -13,8 +13,9 @@ def check_employee_data():
     
     print("🔍 检查员工数据...")
     
-    # 检查所有员工数据
-    c.execute('SELECT 工号, 姓名, 管理能力, 性格特质分数, 行为模式分数, 通用能力 FROM employees ORDER BY 创建时间 DESC')
+    # 检查所有员工数据（得分取自最新一次测评）
+    c.execute('''SELECT e.工号, e.姓名, a.管理能力, a.性格特质分数, a.行为模式分数, a.通用能力 FROM employees e
+        LEFT JOIN assessment_attempts a ON a.id = e.最新测评ID ORDER BY e.创建时间 DESC''')
     employees = c.fetchall()
     
     print("员工数据详情:")
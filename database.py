@@ -0,0 +1,338 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+数据库连接管理
+每个线程（gunicorn 工作进程或线程）保持一个长期连接，请求之间复用，不再每个请求重新打开数据库。
+连接统一设置 WAL 日志、synchronous=NORMAL、内存映射和忙等待超时，并启用较大的语句缓存，
+同一条 SQL 只编译一次。
+
+请求结束时 release() 回滚未提交的事务（提前返回或出错时不会把半个事务留给下一个请求），
+连接本身保留；写操作使用 transaction() 上下文，正常结束时提交、出错时回滚。
+
+PostgreSQL 使用同样接口的 PostgresConnectionManager：连接从进程内连接池借出、请求结束时
+归还。连接经过包装，SQL 仍使用 ? 占位符，执行时转换为 psycopg2 的 %s
+"""
+
+import functools
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+try:
+    import psycopg2
+    import psycopg2.extensions
+    import psycopg2.extras
+    import psycopg2.pool
+except ImportError:  # 只使用 SQLite 时无需安装
+    psycopg2 = None
+
+DB_NAME = 'new_questions.db'
+# 数据库被锁定时的最长等待时间（毫秒）
+BUSY_TIMEOUT_MS = 30000
+# 内存映射读取的上限（字节）
+MMAP_SIZE = 256 * 1024 * 1024
+# 每个连接缓存的已编译语句数
+CACHED_STATEMENTS = 256
+# 以这些前缀开头的数据库地址使用 PostgreSQL
+POSTGRES_SCHEMES = ('postgres://', 'postgresql://')
+# 每个进程的 PostgreSQL 连接池大小
+POOL_MIN_CONNECTIONS = 1
+POOL_MAX_CONNECTIONS = 20
+# 连接池借满时等待归还的最长时间（秒）
+POOL_TIMEOUT = 30
+
+# 数据库繁忙、连接中断等可重试的错误
+TRANSIENT_ERRORS = (sqlite3.OperationalError,) + ((psycopg2.OperationalError,) if psycopg2 else ())
+# 两种数据库的全部数据库错误
+DATABASE_ERRORS = (sqlite3.Error,) + ((psycopg2.Error,) if psycopg2 else ())
+
+
+def is_postgres_url(target):
+    return str(target).startswith(POSTGRES_SCHEMES)
+
+
+def is_postgres(conn):
+    """连接是否为 PostgreSQL（建表、触发器等非通用语句据此选择写法）"""
+    return isinstance(conn, PostgresConnection)
+
+
+def begin(conn, immediate=False):
+    """显式开始事务：SQLite 的 immediate 事务立即获取写锁；PostgreSQL 按行加锁，由首条语句隐式开始"""
+    if not is_postgres(conn):
+        conn.execute('BEGIN IMMEDIATE' if immediate else 'BEGIN')
+
+
+def lock_key(conn, *key):
+    """在当前事务内独占一个业务键，事务结束时释放：PostgreSQL 取事务级咨询锁；
+    SQLite 的 immediate 事务已独占整个数据库的写锁，无需处理"""
+    if is_postgres(conn):
+        conn.execute('SELECT pg_advisory_xact_lock(hashtextextended(?, 0))', ('\x1f'.join(map(str, key)),))
+
+
+def database_key(conn):
+    """连接所对应数据库的标识，用于按数据库区分的进程内缓存"""
+    if is_postgres(conn):
+        return conn.dsn
+    for _, name, path in conn.execute('PRAGMA database_list'):
+        if name == 'main':
+            return path
+    return ''
+
+
+def connect(path=DB_NAME, **kwargs):
+    """打开一个已调优的新连接，供命令行工具和后台线程使用"""
+    conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT_MS / 1000, cached_statements=CACHED_STATEMENTS, **kwargs)
+    conn.execute(f'PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}')
+    # WAL 模式下读写互不阻塞；该设置保存在数据库文件中
+    conn.execute('PRAGMA journal_mode = WAL')
+    # WAL 模式下 NORMAL 只在检查点时 fsync，断电最多丢失最近的事务，不会损坏数据库
+    conn.execute('PRAGMA synchronous = NORMAL')
+    conn.execute(f'PRAGMA mmap_size = {MMAP_SIZE}')
+    return conn
+
+
+class ConnectionManager:
+    """按线程保持长期连接的连接管理器"""
+
+    def __init__(self, path=DB_NAME):
+        self.path = path
+        self._local = threading.local()
+        # fork 前打开的连接不能在子进程中使用或关闭，保留引用避免被回收时关闭
+        self._inherited = []
+
+    def connect(self):
+        """打开一个独立的新连接，供后台线程长期持有"""
+        return connect(self.path)
+
+    def connection(self):
+        """返回当前线程的连接，首次调用或 fork 后重新打开"""
+        local = self._local
+        conn = getattr(local, 'conn', None)
+        if conn is not None and local.pid != os.getpid():
+            self._inherited.append(conn)
+            conn = None
+        if conn is None:
+            conn = local.conn = connect(self.path)
+            local.pid = os.getpid()
+        return conn
+
+    @contextmanager
+    def transaction(self, immediate=False):
+        """事务上下文：正常结束时提交，出错时回滚；immediate 为真时立即获取写锁"""
+        conn = self.connection()
+        if immediate and not conn.in_transaction:
+            begin(conn, immediate=True)
+        try:
+            yield conn
+        except BaseException:
+            conn.rollback()
+            raise
+        conn.commit()
+
+    def release(self):
+        """请求结束时调用：回滚当前线程连接上未提交的事务"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and conn.in_transaction and self._local.pid == os.getpid():
+            conn.rollback()
+
+    def close(self):
+        """关闭当前线程的连接"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            self._local.conn = None
+            if self._local.pid == os.getpid():
+                conn.close()
+
+
+@functools.lru_cache(maxsize=CACHED_STATEMENTS)
+def _postgres_sql(sql):
+    """? 占位符 -> %s，语句中原有的 % 转义为 %%（SQL 字面量中不能出现 ?）"""
+    return sql.replace('%', '%%').replace('?', '%s')
+
+
+if psycopg2 is not None:
+    # BYTEA 默认读出为 memoryview，转为 bytes 与 SQLite 的 BLOB 一致
+    _BYTES = psycopg2.extensions.new_type(
+        psycopg2.BINARY.values, 'BYTEA_BYTES',
+        lambda value, cur: None if value is None else bytes(psycopg2.BINARY(value, cur)))
+
+
+class PostgresCursor:
+    """psycopg2 游标包装，接口与 sqlite3.Cursor 相同"""
+
+    __slots__ = ('_cursor',)
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def execute(self, sql, params=()):
+        if params:
+            self._cursor.execute(_postgres_sql(sql), params)
+        else:
+            self._cursor.execute(sql)
+        return self
+
+    def executemany(self, sql, seq_of_params):
+        # 按页合并发送，避免逐行往返
+        psycopg2.extras.execute_batch(self._cursor, _postgres_sql(sql), seq_of_params)
+        return self
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+
+class PostgresConnection:
+    """psycopg2 连接包装，接口与 sqlite3.Connection 相同"""
+
+    __slots__ = ('raw',)
+
+    def __init__(self, raw):
+        self.raw = raw
+        psycopg2.extensions.register_type(_BYTES, raw)
+
+    @property
+    def dsn(self):
+        return self.raw.dsn
+
+    @property
+    def in_transaction(self):
+        return self.raw.info.transaction_status != psycopg2.extensions.TRANSACTION_STATUS_IDLE
+
+    def cursor(self):
+        return PostgresCursor(self.raw.cursor())
+
+    def execute(self, sql, params=()):
+        return self.cursor().execute(sql, params)
+
+    def executemany(self, sql, seq_of_params):
+        return self.cursor().executemany(sql, seq_of_params)
+
+    @contextmanager
+    def autocommit(self):
+        """临时切换为自动提交（CREATE INDEX CONCURRENTLY 等不能在事务中执行的语句）"""
+        if self.in_transaction:
+            self.raw.commit()
+        self.raw.autocommit = True
+        try:
+            yield self
+        finally:
+            self.raw.autocommit = False
+
+    def commit(self):
+        self.raw.commit()
+
+    def rollback(self):
+        self.raw.rollback()
+
+    def close(self):
+        self.raw.close()
+
+
+class PostgresConnectionManager:
+    """PostgreSQL 连接管理器：每个进程一个连接池，请求期间每个线程借用一个连接"""
+
+    def __init__(self, dsn, min_connections=POOL_MIN_CONNECTIONS, max_connections=POOL_MAX_CONNECTIONS):
+        if psycopg2 is None:
+            raise RuntimeError('使用 PostgreSQL 需要安装 psycopg2：pip install psycopg2-binary')
+        self.dsn = dsn
+        self.min_connections = min_connections
+        self.max_connections = max_connections
+        self._local = threading.local()
+        self._pool_lock = threading.Lock()
+        self._pool = None
+        self._slots = None
+        self._pid = None
+        # fork 前建立的连接池不能在子进程中使用或关闭
+        self._inherited = []
+
+    def _get_pool(self):
+        if self._pool is not None and self._pid == os.getpid():
+            return self._pool
+        with self._pool_lock:
+            if self._pool is None or self._pid != os.getpid():
+                if self._pool is not None:
+                    self._inherited.append(self._pool)
+                self._pool = psycopg2.pool.ThreadedConnectionPool(
+                    self.min_connections, self.max_connections, self.dsn)
+                # 连接池借满时 getconn 直接报错，用信号量让请求排队等待
+                self._slots = threading.BoundedSemaphore(self.max_connections)
+                self._pid = os.getpid()
+        return self._pool
+
+    def connect(self):
+        """打开一个不占用连接池的独立连接，供后台线程长期持有"""
+        if psycopg2 is None:
+            raise RuntimeError('使用 PostgreSQL 需要安装 psycopg2：pip install psycopg2-binary')
+        return PostgresConnection(psycopg2.connect(self.dsn))
+
+    def connection(self):
+        """返回当前线程借用的连接，首次调用时从连接池借出"""
+        local = self._local
+        conn = getattr(local, 'conn', None)
+        if conn is not None and local.pid == os.getpid():
+            return conn
+        pool = self._get_pool()
+        slots = self._slots
+        if not slots.acquire(timeout=POOL_TIMEOUT):
+            raise psycopg2.pool.PoolError(f'{POOL_TIMEOUT} 秒内未能从连接池借到连接')
+        try:
+            conn = PostgresConnection(pool.getconn())
+        except BaseException:
+            slots.release()
+            raise
+        local.conn = conn
+        local.pid = os.getpid()
+        local.slots = slots
+        return conn
+
+    @contextmanager
+    def transaction(self, immediate=False):
+        """事务上下文：正常结束时提交，出错时回滚"""
+        conn = self.connection()
+        try:
+            yield conn
+        except BaseException:
+            conn.rollback()
+            raise
+        conn.commit()
+
+    def release(self):
+        """请求结束时调用：回滚未提交的事务并把连接还给连接池"""
+        local = self._local
+        conn = getattr(local, 'conn', None)
+        if conn is None or local.pid != os.getpid():
+            return
+        local.conn = None
+        broken = conn.raw.closed
+        try:
+            if not broken and conn.in_transaction:
+                conn.rollback()
+        except psycopg2.Error:
+            broken = True
+        finally:
+            # 连接已断开时不再放回池中复用
+            self._pool.putconn(conn.raw, close=broken)
+            local.slots.release()
+
+    def close(self):
+        """归还当前线程的连接并关闭本进程的连接池"""
+        self.release()
+        with self._pool_lock:
+            if self._pool is not None and self._pid == os.getpid():
+                self._pool.closeall()
+            self._pool = None
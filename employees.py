@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+员工身份
+员工由 (公司名称, 工号) 唯一确定，不同公司可以使用相同的工号。登录用一条
+INSERT ... ON CONFLICT DO UPDATE 完成新建或更新姓名，并发登录不会产生重复行；
+答卷、答题进度和常模成员也都按同一个键记录
+
+用法：python employees.py migrate [--db new_questions.db]   # 合并重复员工并建立唯一索引
+"""
+
+import argparse
+import sqlite3
+import sys
+
+from database import is_postgres
+
+DB_NAME = 'new_questions.db'
+EMPLOYEE_KEY_INDEX = 'uq_employees_company_gonghao'
+
+
+def legacy_company_sql(emp_no_column):
+    """早期的表只记录了工号：按工号查员工所属公司的子查询（同一工号有多条时取最新一条）"""
+    return (f"COALESCE((SELECT e.公司名称 FROM employees e WHERE e.工号 = {emp_no_column} "
+            f"ORDER BY e.id DESC LIMIT 1), '')")
+
+
+def ensure_employee_key(conn):
+    """合并 (公司名称, 工号) 相同的重复员工并建立唯一索引（幂等），返回删除的行数"""
+    if is_postgres(conn):
+        # PostgreSQL 建表时即带唯一约束（见 postgres_schema.sql）
+        return 0
+    c = conn.cursor()
+    if c.execute("SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = ?",
+                 (EMPLOYEE_KEY_INDEX,)).fetchone():
+        return 0
+    c.execute("UPDATE employees SET 公司名称 = '' WHERE 公司名称 IS NULL")
+    # 每组保留最早的一行：旧版本登录和提交都按工号更新所有重复行，最早一行的姓名和得分总是最新的
+    removed = c.execute('''DELETE FROM employees
+        WHERE id NOT IN (SELECT MIN(id) FROM employees GROUP BY 公司名称, 工号)''').rowcount
+    c.execute(f'CREATE UNIQUE INDEX {EMPLOYEE_KEY_INDEX} ON employees(公司名称, 工号)')
+    conn.commit()
+    return removed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='员工唯一键迁移')
+    parser.add_argument('command', choices=['migrate'], help='migrate：合并重复员工并建立 (公司名称, 工号) 唯一索引')
+    parser.add_argument('--db', default=DB_NAME, help='数据库文件路径')
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db)
+    try:
+        removed = ensure_employee_key(conn)
+    except sqlite3.Error as e:
+        print(f'✗ {e}')
+        sys.exit(1)
+    finally:
+        conn.close()
+    print(f'✓ 已建立员工唯一索引，合并重复记录 {removed} 条')
+
+
+if __name__ == '__main__':
+    main()
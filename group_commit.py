@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+单写线程组提交
+每个工作进程一个专用写线程：请求线程把写操作（接收连接的函数）放入队列后等待，写线程每隔
+几毫秒把队列中的写操作合并到一个事务中提交，提交完成后再逐个通知调用方。一次获取写锁、
+一次 fsync 完成一批写入，突发提交时不再因为争抢写锁而出现 "database is locked"。
+
+每个写操作在独立的保存点中执行，单个写操作出错只回滚它自己，不影响同批的其他写入；
+写操作内不能提交事务。SQLite 写连接使用 synchronous=FULL：每批只 fsync 一次，调用方收到确认时
+数据已落盘；PostgreSQL 下同样把一批写操作合并为一次提交
+"""
+
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from database import begin, is_postgres
+
+logger = logging.getLogger(__name__)
+
+# 第一个写操作到达后等待同批其他写操作的时间（秒）
+GROUP_COMMIT_DELAY = 0.002
+# 每批最多合并的写操作数
+MAX_BATCH_SIZE = 256
+# 调用方等待提交确认的最长时间（秒）
+WRITE_TIMEOUT = 30
+# 批大小分布的统计区间上限
+BATCH_SIZE_BUCKETS = (1, 4, 16, 64, MAX_BATCH_SIZE)
+
+
+class GroupCommitWriter:
+    """单写线程组提交队列"""
+
+    def __init__(self, db, delay=GROUP_COMMIT_DELAY, max_batch=MAX_BATCH_SIZE):
+        # db 为连接管理器或存储仓库，写线程持有其打开的独立连接
+        self.db = db
+        self.delay = delay
+        self.max_batch = max_batch
+        self._queue = queue.Queue()
+        self._start_lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._stats_lock = threading.Lock()
+        self._stats = self._empty_stats()
+
+    @staticmethod
+    def _empty_stats():
+        return {
+            'batches': 0,
+            'batched_writes': 0,
+            'writes': 0,
+            'failed_writes': 0,
+            'failed_batches': 0,
+            'max_batch_size': 0,
+            'max_queue_depth': 0,
+            'commit_seconds': 0.0,
+            'batch_sizes': {size: 0 for size in BATCH_SIZE_BUCKETS},
+        }
+
+    def submit(self, fn):
+        """放入一个写操作 fn(conn)，返回 Future，事务提交后得到 fn 的返回值"""
+        self._ensure_thread()
+        future = Future()
+        self._queue.put((fn, future))
+        depth = self._queue.qsize()
+        if depth > self._stats['max_queue_depth']:
+            with self._stats_lock:
+                self._stats['max_queue_depth'] = max(self._stats['max_queue_depth'], depth)
+        return future
+
+    def execute(self, fn, timeout=WRITE_TIMEOUT):
+        """放入写操作并等待提交，返回 fn 的返回值；fn 出错或提交失败时抛出对应异常"""
+        return self.submit(fn).result(timeout)
+
+    def _ensure_thread(self):
+        # fork 出的子进程中没有父进程的写线程，需要重新启动
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or self._pid != os.getpid() or not self._thread.is_alive():
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name='group-commit-writer', daemon=True)
+                self._thread.start()
+
+    def _connect(self):
+        conn = self.db.connect()
+        if not is_postgres(conn):
+            conn.execute('PRAGMA synchronous = FULL')
+        return conn
+
+    def _run(self):
+        conn = self._connect()
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.delay
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                try:
+                    batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if not self._commit(conn, batch):
+                # 整批失败时连接可能已断开（如数据库重启），重新打开后继续处理后续写操作
+                try:
+                    conn.close()
+                    conn = self._connect()
+                except Exception as e:
+                    logger.error(f"组提交写连接重新打开失败: {e}")
+
+    def _commit(self, conn, batch):
+        """在一个事务中执行一批写操作，提交后通知各调用方；整批失败时返回 False"""
+        start = time.perf_counter()
+        outcomes = []
+        try:
+            begin(conn, immediate=True)
+            for fn, future in batch:
+                conn.execute('SAVEPOINT group_write')
+                try:
+                    outcomes.append((future, fn(conn), None))
+                except Exception as e:
+                    conn.execute('ROLLBACK TO group_write')
+                    outcomes.append((future, None, e))
+                conn.execute('RELEASE group_write')
+            conn.commit()
+        except Exception as e:
+            # 获取写锁或提交失败：整批均未写入
+            logger.error(f"组提交失败，{len(batch)} 个写操作未写入: {e}")
+            if conn.in_transaction:
+                conn.rollback()
+            with self._stats_lock:
+                self._stats['failed_batches'] += 1
+                self._stats['failed_writes'] += len(batch)
+            for _, future in batch:
+                future.set_exception(e)
+            return False
+
+        elapsed = time.perf_counter() - start
+        failed = sum(1 for _, _, error in outcomes if error is not None)
+        with self._stats_lock:
+            stats = self._stats
+            stats['batches'] += 1
+            stats['batched_writes'] += len(batch)
+            stats['writes'] += len(batch) - failed
+            stats['failed_writes'] += failed
+            stats['max_batch_size'] = max(stats['max_batch_size'], len(batch))
+            stats['commit_seconds'] += elapsed
+            for size in BATCH_SIZE_BUCKETS:
+                if len(batch) <= size:
+                    stats['batch_sizes'][size] += 1
+                    break
+        for future, result, error in outcomes:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+        return True
+
+    def metrics(self):
+        """队列深度与批大小统计"""
+        with self._stats_lock:
+            stats = dict(self._stats, batch_sizes=dict(self._stats['batch_sizes']))
+        batches = stats['batches']
+        batched_writes = stats.pop('batched_writes')
+        commit_seconds = stats.pop('commit_seconds')
+        stats['queue_depth'] = self._queue.qsize()
+        stats['mean_batch_size'] = round(batched_writes / batches, 2) if batches else 0
+        stats['mean_commit_ms'] = round(commit_seconds * 1000 / batches, 3) if batches else 0
+        # 区间上限 -> 批次数，键转为字符串便于 JSON 输出
+        stats['batch_sizes'] = {f'<={size}': n for size, n in stats['batch_sizes'].items()}
+        return stats
@@ -8,6 +8,9 @@
 import sqlite3
 import os
 
+from migrations import migrate
+from question_options import parse_options, dump_options
+
 def init_database():
     """初始化数据库"""
     # 删除已存在的数据库文件
@@ -21,43 +24,9 @@ def init_database():
     
     print("开始创建数据库...")
     
-    # 创建问题表
-    c.execute('''CREATE TABLE IF NOT EXISTS questions (
-        id INTEGER PRIMARY KEY,
-        题目 TEXT NOT NULL,
-        选项 TEXT NOT NULL,
-        题目类型 TEXT NOT NULL,
-        正确答案 TEXT
-    )''')
-    print("✓ 创建问题表成功")
-    
-    # 创建人员表
-    c.execute('''CREATE TABLE IF NOT EXISTS employees (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        姓名 TEXT NOT NULL,
-        工号 TEXT NOT NULL,
-        公司名称 TEXT,
-        管理能力 INTEGER DEFAULT 0,
-        战略思维 INTEGER DEFAULT 0,
-        团队领导 INTEGER DEFAULT 0,
-        执行管控 INTEGER DEFAULT 0,
-        跨部门协作 INTEGER DEFAULT 0,
-        外向性 INTEGER DEFAULT 0,
-        宜人性 INTEGER DEFAULT 0,
-        开放性 INTEGER DEFAULT 0,
-        责任心 INTEGER DEFAULT 0,
-        行为模式类型 TEXT,
-        行为模式分数 INTEGER DEFAULT 0,
-        性格特质类型 TEXT,
-        性格特质分数 INTEGER DEFAULT 0,
-        通用能力 INTEGER DEFAULT 0,
-        言语理解 INTEGER DEFAULT 0,
-        数量分析 INTEGER DEFAULT 0,
-        逻辑推理 INTEGER DEFAULT 0,
-        空间认知 INTEGER DEFAULT 0,
-        创建时间 TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-    )''')
-    print("✓ 创建人员表成功")
+    # 按迁移创建全部表、触发器与索引
+    applied = migrate(conn)
+    print(f"✓ 创建数据库结构成功（迁移版本 {applied[-1]}）")
     
     # 完整的240道题目数据
     questions = [
@@ -215,14 +184,18 @@ def init_database():
         (125, "立方体在左上光源下的阴影方向：", "A) 右下延伸;B) 左下延伸;C) 正下投影;D) 无阴影", "单选", "A")
     ]
     
-    c.executemany('INSERT INTO questions (id, 题目, 选项, 题目类型, 正确答案) VALUES (?, ?, ?, ?, ?)', questions)
+    # 载入时解析选项，格式错误的题目直接拒绝
+    rows = []
+    for q_id, content, options_text, question_type, correct in questions:
+        try:
+            options = parse_options(question_type, options_text, correct)
+        except ValueError as e:
+            conn.close()
+            raise ValueError(f"题目 {q_id} 选项格式错误: {e}") from e
+        rows.append((q_id, content, options_text, question_type, correct, dump_options(options)))
+    c.executemany('INSERT INTO questions (id, 题目, 选项, 题目类型, 正确答案, 选项结构) VALUES (?, ?, ?, ?, ?, ?)', rows)
     print(f"✓ 插入{len(questions)}道示例题目成功")
     
-    # 创建索引
-    c.execute('CREATE INDEX IF NOT EXISTS idx_questions_id ON questions(id)')
-    c.execute('CREATE INDEX IF NOT EXISTS idx_employees_gonghao ON employees(工号)')
-    print("✓ 创建索引成功")
-    
     # 提交更改并关闭连接
     conn.commit()
     conn.close()
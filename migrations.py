@@ -0,0 +1,552 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+数据库结构迁移
+所有表结构变更按版本号登记在 MIGRATIONS 中，已应用的版本记录在 schema_version 表里。
+应用启动时调用 migrate()：多个 gunicorn 工作进程同时启动时，通过跨进程锁
+（SQLite 为数据库旁的锁文件，PostgreSQL 为咨询锁）保证只有一个进程执行，其他进程等待后
+直接使用新结构；已是最新版本时只做一次查询，不再在每次启动或请求时执行建表语句。
+
+大表重建（修改列类型等）分批复制，每批一个短事务，迁移期间其他进程仍可读写；
+索引也在迁移中创建，PostgreSQL 下使用 CREATE INDEX CONCURRENTLY 不阻塞写入。
+
+新增迁移时在文件末尾追加一个更大的版本号，已发布的迁移不要修改；每个迁移都应可重复执行
+（中途失败时下次启动会从头重跑该步骤）
+
+用法：
+    python migrations.py status [--db new_questions.db]   # 查看已应用与待应用的迁移
+    python migrations.py migrate [--db new_questions.db]  # 应用全部待执行的迁移
+    --db 也可以是 postgresql:// 开头的地址
+"""
+
+import argparse
+import logging
+import os
+import sys
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+
+from answer_capture import ensure_answer_session_tables
+from answer_store import ensure_answer_sheet_tables
+from attempts import EMPLOYEE_FILTER_COLUMNS, sync_filter_columns
+from database import DATABASE_ERRORS, DB_NAME, begin, database_key, is_postgres
+from employees import ensure_employee_key
+from norms import NORM_COLUMNS, ensure_norm_tables, rebuild_norms
+from question_bank import ensure_version_tracking
+from question_options import ensure_structured_options
+from scoring import EMPLOYEE_SCORE_COLUMNS, EMPLOYEE_SCORE_FIELDS
+from scoring_config import ensure_scoring_config_tables
+
+try:
+    import fcntl
+except ImportError:  # Windows 开发环境只有单进程，不加锁
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+SCHEMA_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'postgres_schema.sql')
+# PostgreSQL 迁移咨询锁的键
+ADVISORY_LOCK_KEY = 0x636570696E67
+# 大表重建时每批复制的行数，以及两批之间让出写锁的时间（秒）
+CHUNK_SIZE = 2000
+CHUNK_PAUSE = 0.01
+# PostgreSQL 下等待其他进程完成迁移时的轮询间隔（秒）
+LOCK_POLL_INTERVAL = 0.2
+
+Migration = namedtuple('Migration', ['version', 'name', 'apply'])
+MIGRATIONS = []
+
+# 员工表的标准结构（SQLite），得分列统一为 REAL
+EMPLOYEES_TABLE_SQL = '''CREATE TABLE IF NOT EXISTS {table} (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    姓名 TEXT NOT NULL,
+    工号 TEXT NOT NULL,
+    公司名称 TEXT NOT NULL DEFAULT '',
+    管理能力 REAL DEFAULT 0,
+    战略思维 REAL DEFAULT 0,
+    团队领导 REAL DEFAULT 0,
+    执行管控 REAL DEFAULT 0,
+    跨部门协作 REAL DEFAULT 0,
+    性格特质分数 REAL DEFAULT 0,
+    外向性 REAL DEFAULT 0,
+    宜人性 REAL DEFAULT 0,
+    开放性 REAL DEFAULT 0,
+    责任心 REAL DEFAULT 0,
+    性格特质类型 TEXT,
+    行为模式类型 TEXT,
+    行为模式分数 REAL DEFAULT 0,
+    通用能力 REAL DEFAULT 0,
+    言语理解 REAL DEFAULT 0,
+    数量分析 REAL DEFAULT 0,
+    逻辑推理 REAL DEFAULT 0,
+    空间认知 REAL DEFAULT 0,
+    创建时间 TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+)'''
+
+# 第 12 个迁移之后的员工表：得分移到 assessment_attempts，员工行只保留身份信息和最新测评指针
+EMPLOYEE_PROFILE_TABLE_SQL = '''CREATE TABLE IF NOT EXISTS {table} (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    姓名 TEXT NOT NULL,
+    工号 TEXT NOT NULL,
+    公司名称 TEXT NOT NULL DEFAULT '',
+    最新测评ID INTEGER,
+    创建时间 TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+)'''
+
+
+def migration(version, name):
+    """登记一个迁移步骤，版本号必须递增"""
+    def register(fn):
+        if MIGRATIONS and version <= MIGRATIONS[-1].version:
+            raise ValueError(f'迁移版本号必须递增: {version}')
+        MIGRATIONS.append(Migration(version, name, fn))
+        return fn
+    return register
+
+
+# 迁移工具
+
+@contextmanager
+def migration_lock(conn):
+    """跨进程迁移锁，同一数据库同时只有一个进程执行迁移"""
+    if is_postgres(conn):
+        # 会话级咨询锁，在事务外轮询获取：阻塞等待的语句本身是一个未结束的事务，
+        # 持锁进程的 CREATE INDEX CONCURRENTLY 会等它结束而形成死锁
+        with conn.autocommit():
+            waiting = False
+            while not conn.execute('SELECT pg_try_advisory_lock(?)', (ADVISORY_LOCK_KEY,)).fetchone()[0]:
+                if not waiting:
+                    logger.info('其他进程正在执行数据库迁移，等待完成')
+                    waiting = True
+                time.sleep(LOCK_POLL_INTERVAL)
+        try:
+            yield
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            with conn.autocommit():
+                conn.execute('SELECT pg_advisory_unlock(?)', (ADVISORY_LOCK_KEY,))
+        return
+    path = database_key(conn)
+    if fcntl is None or not path:
+        yield
+        return
+    with open(f'{path}.migrate.lock', 'a') as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            logger.info('其他进程正在执行数据库迁移，等待完成')
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def create_index(conn, name, table, columns, unique=False):
+    """创建索引（幂等）：PostgreSQL 下并发创建不阻塞写入，SQLite 下在一个短事务中创建"""
+    kind = 'UNIQUE INDEX' if unique else 'INDEX'
+    if not is_postgres(conn):
+        conn.execute(f'CREATE {kind} IF NOT EXISTS {name} ON {table}({columns})')
+        conn.commit()
+        return
+    # 并发创建中途失败会留下无效索引，IF NOT EXISTS 会跳过它，需要先删除
+    row = conn.execute('''SELECT i.indisvalid FROM pg_class c JOIN pg_index i ON i.indexrelid = c.oid
+        WHERE c.relname = ?''', (name,)).fetchone()
+    with conn.autocommit():
+        if row is not None and not row[0]:
+            conn.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {name}')
+        conn.execute(f'CREATE {kind} CONCURRENTLY IF NOT EXISTS {name} ON {table}({columns})')
+
+
+def drop_index(conn, name):
+    """删除索引（幂等），PostgreSQL 下并发删除不阻塞读写"""
+    if not is_postgres(conn):
+        conn.execute(f'DROP INDEX IF EXISTS {name}')
+        conn.commit()
+        return
+    with conn.autocommit():
+        conn.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {name}')
+
+
+def rebuild_table_online(conn, table, create_sql, chunk_size=CHUNK_SIZE, drop_columns=()):
+    """按新的建表语句重建 SQLite 表（修改列类型、约束或删除列时使用），不长时间占用写锁，返回复制的行数
+
+    1. 建新表，并在旧表上建触发器，把迁移期间其他进程的增删改同步到新表
+    2. 按 id 分批复制旧数据，每批一个短事务；触发器已同步的行比旧数据新，复制时跳过
+    3. 在一个短事务中删除旧表、把新表改名并重建原有索引
+    create_sql 中的表名写作 {table}；旧表中新结构没有的列原样保留，drop_columns 中的列除外
+    （引用这些列的索引需事先删除）
+    """
+    new = f'{table}__rebuild'
+    c = conn.cursor()
+    old_columns = [(row[1], row[2]) for row in c.execute(f'PRAGMA table_info({table})')
+                   if row[1] not in drop_columns]
+    indexes = [row[0] for row in c.execute(
+        "SELECT sql FROM sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL", (table,))]
+
+    # 清理上次中断留下的新表和触发器
+    for event in ('insert', 'update', 'delete'):
+        c.execute(f'DROP TRIGGER IF EXISTS {new}_{event}')
+    c.execute(f'DROP TABLE IF EXISTS {new}')
+    c.execute(create_sql.format(table=new))
+    new_columns = {row[1] for row in c.execute(f'PRAGMA table_info({new})')}
+    for name, column_type in old_columns:
+        if name not in new_columns:
+            c.execute(f'ALTER TABLE {new} ADD COLUMN {name} {column_type}')
+
+    columns = ', '.join(name for name, _ in old_columns)
+    values = ', '.join(f'NEW.{name}' for name, _ in old_columns)
+    c.execute(f'''CREATE TRIGGER {new}_insert AFTER INSERT ON {table} BEGIN
+        INSERT OR REPLACE INTO {new} ({columns}) VALUES ({values});
+    END''')
+    c.execute(f'''CREATE TRIGGER {new}_update AFTER UPDATE ON {table} BEGIN
+        DELETE FROM {new} WHERE id = OLD.id;
+        INSERT OR REPLACE INTO {new} ({columns}) VALUES ({values});
+    END''')
+    c.execute(f'''CREATE TRIGGER {new}_delete AFTER DELETE ON {table} BEGIN
+        DELETE FROM {new} WHERE id = OLD.id;
+    END''')
+    conn.commit()
+
+    # 触发器建立之后新增的行 id 都大于 max_id，已由触发器同步
+    max_id = c.execute(f'SELECT MAX(id) FROM {table}').fetchone()[0] or 0
+    copied = 0
+    for low in range(0, max_id, chunk_size):
+        begin(conn, immediate=True)
+        copied += c.execute(f'''INSERT INTO {new} ({columns})
+            SELECT {columns} FROM {table} WHERE id > ? AND id <= ?
+            ON CONFLICT DO NOTHING''', (low, low + chunk_size)).rowcount
+        conn.commit()
+        time.sleep(CHUNK_PAUSE)
+
+    begin(conn, immediate=True)
+    for event in ('insert', 'update', 'delete'):
+        c.execute(f'DROP TRIGGER {new}_{event}')
+    c.execute(f'DROP TABLE {table}')
+    c.execute(f'ALTER TABLE {new} RENAME TO {table}')
+    for sql in indexes:
+        c.execute(sql)
+    conn.commit()
+    return copied
+
+
+# 迁移步骤
+# 1~8 把原先分散在各模块、每次启动执行的建表与升级逻辑纳入版本管理，对已有数据库是幂等的
+
+@migration(1, '基础表：题目、员工、管理员')
+def create_base_tables(conn):
+    c = conn.cursor()
+    if is_postgres(conn):
+        # PostgreSQL 的完整表结构
+        with open(SCHEMA_FILE, 'r', encoding='utf-8') as f:
+            c.execute(f.read())
+        conn.commit()
+        return
+    c.execute('''CREATE TABLE IF NOT EXISTS questions (
+        id INTEGER PRIMARY KEY,
+        题目 TEXT NOT NULL,
+        选项 TEXT NOT NULL,
+        题目类型 TEXT NOT NULL,
+        正确答案 TEXT,
+        选项结构 TEXT
+    )''')
+    c.execute(EMPLOYEES_TABLE_SQL.format(table='employees'))
+    c.execute('''CREATE TABLE IF NOT EXISTS admins (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT UNIQUE NOT NULL,
+        password TEXT NOT NULL
+    )''')
+    conn.commit()
+
+
+@migration(2, '员工唯一键 (公司名称, 工号)')
+def employee_key(conn):
+    ensure_employee_key(conn)
+
+
+@migration(3, '题目选项结构化')
+def structured_options(conn):
+    ensure_structured_options(conn)
+
+
+@migration(4, '题库版本跟踪')
+def bank_version(conn):
+    ensure_version_tracking(conn)
+
+
+@migration(5, '答卷存储')
+def answer_sheets(conn):
+    ensure_answer_sheet_tables(conn)
+
+
+@migration(6, '版本化评分配置')
+def scoring_configs(conn):
+    ensure_scoring_config_tables(conn)
+
+
+@migration(7, '逐题答题进度')
+def answer_sessions(conn):
+    ensure_answer_session_tables(conn)
+
+
+@migration(8, '常模直方图')
+def norms(conn):
+    ensure_norm_tables(conn)
+
+
+@migration(9, '员工得分列统一为 REAL')
+def unify_score_columns(conn):
+    # init_database.py 曾把得分列建为 INTEGER，new_app.py 建为 REAL（通用能力各列除外）：
+    # INTEGER 列会把 3.0 存成整数 3，读出类型不一致；PostgreSQL 建表时即为 DOUBLE PRECISION
+    if is_postgres(conn):
+        return
+    types = {row[1]: row[2].upper() for row in conn.execute('PRAGMA table_info(employees)')}
+    if all(types.get(col) == 'REAL' for col in NORM_COLUMNS):
+        return
+    copied = rebuild_table_online(conn, 'employees', EMPLOYEES_TABLE_SQL)
+    logger.info(f"员工表已重建，复制 {copied} 行")
+
+
+@migration(10, '查询索引')
+def employee_indexes(conn):
+    # 按工号查询（早期数据补公司名称等）、管理端按创建时间排序、按题型筛选题目
+    create_index(conn, 'idx_employees_gonghao', 'employees', '工号')
+    create_index(conn, 'idx_employees_create_time', 'employees', '创建时间')
+    create_index(conn, 'idx_questions_type', 'questions', '题目类型')
+    # 与主键重复
+    conn.execute('DROP INDEX IF EXISTS idx_questions_id')
+    conn.commit()
+
+
+@migration(11, '员工列表分页索引')
+def employee_page_indexes(conn):
+    # 管理端员工列表按 (创建时间, id) 倒序分页，公司、DISC 类型筛选各一个以其为后缀的复合索引，
+    # 筛选后仍可沿索引顺序读取一页；(创建时间, id) 索引取代原单列索引
+    create_index(conn, 'idx_employees_created', 'employees', '创建时间, id')
+    create_index(conn, 'idx_employees_company_created', 'employees', '公司名称, 创建时间, id')
+    create_index(conn, 'idx_employees_disc_created', 'employees', '行为模式类型, 创建时间, id')
+    drop_index(conn, 'idx_employees_create_time')
+
+
+def _table_columns(conn, table):
+    if is_postgres(conn):
+        rows = conn.execute('''SELECT column_name FROM information_schema.columns
+            WHERE table_schema = current_schema() AND table_name = ?''', (table,)).fetchall()
+        return {row[0] for row in rows}
+    return {row[1] for row in conn.execute(f'PRAGMA table_info({table})')}
+
+
+@migration(12, '追加式测评记录')
+def assessment_attempts(conn):
+    # 每次提交在 assessment_attempts 中追加一行得分，员工行只保留指向最新一次的 最新测评ID（见 attempts.py）。
+    # 已有员工的当前得分迁入测评记录并关联其最新一份答卷，随后删除员工表的得分列
+    postgres = is_postgres(conn)
+    score_columns = ',\n'.join(
+        f"    {col} {'TEXT' if dim is None else 'DOUBLE PRECISION DEFAULT 0' if postgres else 'REAL DEFAULT 0'}"
+        for col, _, dim in EMPLOYEE_SCORE_FIELDS)
+    c = conn.cursor()
+    if postgres:
+        c.execute(f'''CREATE TABLE IF NOT EXISTS assessment_attempts (
+    id BIGSERIAL PRIMARY KEY,
+    公司名称 TEXT NOT NULL DEFAULT '',
+    员工工号 TEXT NOT NULL,
+    答卷ID BIGINT,
+    评分版本 INTEGER,
+{score_columns},
+    提交时间 TIMESTAMP DEFAULT (now() AT TIME ZONE 'utc')
+)''')
+    else:
+        c.execute(f'''CREATE TABLE IF NOT EXISTS assessment_attempts (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    公司名称 TEXT NOT NULL DEFAULT '',
+    员工工号 TEXT NOT NULL,
+    答卷ID INTEGER,
+    评分版本 INTEGER,
+{score_columns},
+    提交时间 TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+)''')
+    employee_columns = _table_columns(conn, 'employees')
+    if postgres:
+        c.execute('ALTER TABLE employees ADD COLUMN IF NOT EXISTS 最新测评ID BIGINT')
+    elif '最新测评ID' not in employee_columns:
+        c.execute('ALTER TABLE employees ADD COLUMN 最新测评ID INTEGER')
+    conn.commit()
+    # 员工的历次测评，以及写入时查找其编号最大的一次
+    create_index(conn, 'idx_attempts_employee', 'assessment_attempts', '公司名称, 员工工号, id')
+
+    legacy = [col for col in EMPLOYEE_SCORE_COLUMNS if col in employee_columns]
+    if legacy:
+        # 提交过答卷或有非零得分的员工（答卷表出现之前提交的只有得分）各迁入一条测评记录
+        columns = ', '.join(EMPLOYEE_SCORE_COLUMNS)
+        tested = ' OR '.join(f'e.{col} <> 0' for col in NORM_COLUMNS)
+        begin(conn, immediate=True)
+        copied = c.execute(f'''INSERT INTO assessment_attempts (公司名称, 员工工号, 答卷ID, 评分版本, 提交时间, {columns})
+            SELECT e.公司名称, e.工号, s.id, s.评分版本, COALESCE(s.创建时间, e.创建时间),
+                {", ".join(f"e.{col}" for col in EMPLOYEE_SCORE_COLUMNS)}
+            FROM employees e LEFT JOIN answer_sheets s ON s.id = (SELECT MAX(id) FROM answer_sheets
+                WHERE 公司名称 = e.公司名称 AND 员工工号 = e.工号)
+            WHERE e.最新测评ID IS NULL AND (s.id IS NOT NULL OR {tested})''').rowcount
+        c.execute('''UPDATE employees SET 最新测评ID = (SELECT MAX(id) FROM assessment_attempts a
+            WHERE a.公司名称 = employees.公司名称 AND a.员工工号 = employees.工号)
+            WHERE 最新测评ID IS NULL AND EXISTS (SELECT 1 FROM assessment_attempts a
+                WHERE a.公司名称 = employees.公司名称 AND a.员工工号 = employees.工号)''')
+        # 常模改为按测评记录统计
+        rebuild_norms(conn)
+        conn.commit()
+        logger.info(f"已把 {copied} 名员工的得分迁入测评记录")
+
+    # 行为模式类型移到测评记录后，员工表上以其为前缀的分页索引不再使用
+    drop_index(conn, 'idx_employees_disc_created')
+    if legacy:
+        if postgres:
+            for col in legacy:
+                c.execute(f'ALTER TABLE employees DROP COLUMN IF EXISTS {col}')
+            conn.commit()
+        else:
+            copied = rebuild_table_online(conn, 'employees', EMPLOYEE_PROFILE_TABLE_SQL, drop_columns=legacy)
+            logger.info(f"员工表已重建，复制 {copied} 行")
+
+
+@migration(13, '报告生成任务')
+def report_jobs(conn):
+    # 管理端的报告生成任务队列（见 report_jobs.py）；任务编号为 UUID，时间为 Unix 时间戳，两种数据库比较方式一致
+    real = 'DOUBLE PRECISION' if is_postgres(conn) else 'REAL'
+    conn.execute(f'''CREATE TABLE IF NOT EXISTS report_jobs (
+    id TEXT PRIMARY KEY,
+    公司名称 TEXT NOT NULL,
+    员工工号 TEXT NOT NULL,
+    状态 TEXT NOT NULL,
+    尝试次数 INTEGER NOT NULL DEFAULT 0,
+    领取者 TEXT,
+    租约到期 {real},
+    报告 TEXT,
+    原文 TEXT,
+    错误 TEXT,
+    创建时间 {real} NOT NULL,
+    完成时间 {real}
+)''')
+    conn.commit()
+    # 工作线程按状态领取最早的任务；登记时查找同一员工未完成的任务
+    create_index(conn, 'idx_report_jobs_status', 'report_jobs', '状态, 创建时间')
+    create_index(conn, 'idx_report_jobs_employee', 'report_jobs', '公司名称, 员工工号')
+
+
+@migration(14, '分析报告缓存')
+def report_cache(conn):
+    # 按得分、模板、提示词版本和模型的哈希缓存生成的报告（见 report_cache.py）
+    real = 'DOUBLE PRECISION' if is_postgres(conn) else 'REAL'
+    conn.execute(f'''CREATE TABLE IF NOT EXISTS report_cache (
+    缓存键 TEXT PRIMARY KEY,
+    报告 TEXT NOT NULL,
+    原文 TEXT NOT NULL,
+    模型 TEXT NOT NULL,
+    创建时间 {real} NOT NULL
+)''')
+    conn.commit()
+
+
+@migration(15, '员工行冗余最新测评的筛选列')
+def employee_filter_columns(conn):
+    # 第 12 个迁移后按行为模式类型筛选需逐行关联测评记录，不能再沿 (行为模式类型, 创建时间, id) 索引分页：
+    # 在员工行上冗余保存最新测评的行为模式类型（见 attempts.py），恢复该索引
+    columns = _table_columns(conn, 'employees')
+    for col in EMPLOYEE_FILTER_COLUMNS:
+        if is_postgres(conn):
+            conn.execute(f'ALTER TABLE employees ADD COLUMN IF NOT EXISTS {col} TEXT')
+        elif col not in columns:
+            conn.execute(f'ALTER TABLE employees ADD COLUMN {col} TEXT')
+    conn.commit()
+    begin(conn, immediate=True)
+    sync_filter_columns(conn)
+    conn.commit()
+    create_index(conn, 'idx_employees_disc_created', 'employees', '行为模式类型, 创建时间, id')
+
+
+@migration(16, '答题进度的提交标记')
+def answer_session_closed(conn):
+    # 提交答卷时把答题进度标记为已提交而不是删除，迟到的逐题答案不会重新生成进度（见 answer_capture.py）
+    if is_postgres(conn):
+        conn.execute('ALTER TABLE answer_sessions ADD COLUMN IF NOT EXISTS 已提交 INTEGER NOT NULL DEFAULT 0')
+    elif '已提交' not in _table_columns(conn, 'answer_sessions'):
+        conn.execute('ALTER TABLE answer_sessions ADD COLUMN 已提交 INTEGER NOT NULL DEFAULT 0')
+    conn.commit()
+
+
+# 执行
+
+def _applied_versions(conn):
+    try:
+        rows = conn.execute('SELECT 版本 FROM schema_version').fetchall()
+    except DATABASE_ERRORS:
+        # 尚未执行过任何迁移
+        conn.rollback()
+        return set()
+    return {row[0] for row in rows}
+
+
+def pending_migrations(conn, target=None):
+    """尚未应用的迁移（按版本号排序）"""
+    applied = _applied_versions(conn)
+    return [m for m in MIGRATIONS
+            if m.version not in applied and (target is None or m.version <= target)]
+
+
+def migrate(conn, target=None):
+    """应用全部待执行的迁移（可指定目标版本），返回本次应用的版本号列表"""
+    if not pending_migrations(conn, target):
+        if conn.in_transaction:
+            conn.commit()
+        return []
+    applied = []
+    with migration_lock(conn):
+        conn.execute('''CREATE TABLE IF NOT EXISTS schema_version (
+            版本 INTEGER PRIMARY KEY,
+            名称 TEXT NOT NULL,
+            应用时间 TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )''')
+        conn.commit()
+        # 等锁期间其他进程可能已完成迁移，拿到锁后重新检查
+        for m in pending_migrations(conn, target):
+            start = time.perf_counter()
+            logger.info(f"应用数据库迁移 {m.version}：{m.name}")
+            m.apply(conn)
+            conn.execute('INSERT INTO schema_version (版本, 名称) VALUES (?, ?)', (m.version, m.name))
+            conn.commit()
+            applied.append(m.version)
+            logger.info(f"迁移 {m.version} 完成，耗时 {time.perf_counter() - start:.2f} 秒")
+    return applied
+
+
+def main():
+    parser = argparse.ArgumentParser(description='数据库结构迁移')
+    parser.add_argument('command', choices=['status', 'migrate'], help='status：查看迁移状态；migrate：应用待执行的迁移')
+    parser.add_argument('--db', default=DB_NAME, help='数据库文件路径或 postgresql:// 地址')
+    parser.add_argument('--target', type=int, help='只迁移到指定版本')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    from repository import open_repository
+    repo = open_repository(args.db)
+    conn = repo.connect()
+    try:
+        if args.command == 'status':
+            applied = _applied_versions(conn)
+            for m in MIGRATIONS:
+                print(f"{'✓' if m.version in applied else ' '} {m.version:>3}  {m.name}")
+            return
+        versions = migrate(conn, args.target)
+    except DATABASE_ERRORS + (ValueError,) as e:
+        print(f'✗ 迁移失败: {e}')
+        sys.exit(1)
+    finally:
+        conn.close()
+    if versions:
+        print(f'✓ 已应用迁移 {", ".join(map(str, versions))}')
+    else:
+        print('✓ 数据库已是最新版本')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,15 +1,31 @@
-from flask import Flask, request, jsonify, make_response, render_template, send_file
+from flask import Flask, Response, request, jsonify, make_response, render_template, send_file
 from flask_cors import CORS
-import sqlite3
 import logging
 import json
 import requests
-from datetime import datetime
-import re
+from datetime import datetime, timedelta
 import csv
 import io
 import pandas as pd
 import os
+import threading
+
+from repository import open_repository, EMPLOYEE_PAGE_SIZE, MAX_EMPLOYEE_PAGE_SIZE
+from group_commit import GroupCommitWriter
+from snapshot import SnapshotReplica
+from report_jobs import ReportWorkerPool, enqueue_job, get_job, clear_jobs, iter_job_events
+from report_stream import MarkdownStripper, iter_chat_deltas, strip_markdown
+from report_cache import report_cache_key, get_cached_report, save_cached_report, clear_report_cache
+from question_options import ensure_structured_options
+from question_payload import get_question_payload, get_question_sections
+from question_bundle import get_question_bundle
+from wire_format import WIRE_FORMAT_HEADER, WIRE_FORMAT_VERSION, decode_body, decode_packed_answers, get_packed_scorer
+from answer_capture import AnswerWriteBehind, close_session, load_session, reopen_session
+from answer_store import get_sheet_layout
+from scoring import get_scoring_plan, employee_score_values, EMPLOYEE_SCORE_COLUMNS
+from scoring_config import load_raw_config, publish_scoring_config
+from rescore import rescore_all
+from norms import NORM_COLUMNS, record_scores, percentile_ranks, describe_percentiles
 
 app = Flask(__name__)
 CORS(app)
@@ -22,6 +38,22 @@ class Config:
     DEEPSEEK_API_KEY = os.environ.get('DEEPSEEK_API_KEY', 'sk-d7f98fb5f40d4e669906aa439bfa1e74')
     ADMIN_USERNAME = os.environ.get('ADMIN_USERNAME', 'admin')
     ADMIN_PASSWORD = os.environ.get('ADMIN_PASSWORD', 'admin123')
+    DATABASE_PATH = os.environ.get('DATABASE_PATH', 'new_questions.db')
+    # postgresql:// 开头时使用 PostgreSQL，未设置时使用 DATABASE_PATH 指向的 SQLite 文件
+    DATABASE_URL = os.environ.get('DATABASE_URL') or DATABASE_PATH
+    # PostgreSQL 每个工作进程的连接池上限
+    DATABASE_POOL_SIZE = int(os.environ.get('DATABASE_POOL_SIZE', '20'))
+    # 为 1 时登录和提交的写入交给单写线程组提交，多个 gunicorn 工作进程突发写入时减少写锁争用
+    GROUP_COMMIT = os.environ.get('GROUP_COMMIT', '0') == '1'
+    # 设置后员工数据按公司分片存放在该目录下的 SQLite 文件中（见 sharding.py），主库只存题库等公共数据
+    SHARD_DIR = os.environ.get('SHARD_DIR') or None
+    # 设置后管理端的员工列表、导出和报告读取该只读快照文件（见 snapshot.py），仅未分片的 SQLite
+    SNAPSHOT_PATH = os.environ.get('SNAPSHOT_PATH') or None
+    # 快照刷新间隔（秒），以及每累计多少次写入后提前刷新（0 表示只按时间刷新）
+    SNAPSHOT_INTERVAL = float(os.environ.get('SNAPSHOT_INTERVAL', '60'))
+    SNAPSHOT_WRITES = int(os.environ.get('SNAPSHOT_WRITES', '0'))
+    # 每个工作进程生成分析报告的后台线程数（见 report_jobs.py）
+    REPORT_WORKERS = int(os.environ.get('REPORT_WORKERS', '2'))
 
 # 设置配置
 app.config.from_object(Config)
@@ -37,68 +69,93 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# 存储仓库：SQLite 每个线程复用一个长期连接，PostgreSQL 每个进程一个连接池
+repo = open_repository(app.config['DATABASE_URL'], max_connections=app.config['DATABASE_POOL_SIZE'],
+                       shard_dir=app.config['SHARD_DIR'])
+
+# 只读快照：管理端的分析类读取（员工列表、导出）使用 read_repo，启用快照时为只读副本；报告按主库的最新得分生成
+snapshot = None
+if app.config['SNAPSHOT_PATH']:
+    if repo.dialect != 'sqlite' or app.config['SHARD_DIR']:
+        raise ValueError('只读快照只支持未分片的 SQLite')
+    snapshot = SnapshotReplica(app.config['DATABASE_URL'], app.config['SNAPSHOT_PATH'],
+                               app.config['SNAPSHOT_INTERVAL'], app.config['SNAPSHOT_WRITES'])
+read_repo = snapshot.repo if snapshot is not None else repo
+
+# 逐题答案的写后队列
+answer_writer = AnswerWriteBehind(repo)
+
+# 单写线程组提交，GROUP_COMMIT=1 时启用；按公司分片时每个分片各有一个写线程
+group_writer = GroupCommitWriter(repo)
+shard_writers = {}
+shard_writers_lock = threading.Lock()
+
+def get_group_writer(db):
+    """存储仓库 db 的组提交写线程"""
+    if db is repo:
+        return group_writer
+    with shard_writers_lock:
+        writer = shard_writers.get(db.name)
+        if writer is None:
+            writer = shard_writers[db.name] = GroupCommitWriter(db)
+        return writer
+
+def run_write(fn, 公司名称=None, create_shard=False):
+    """执行写操作 fn(conn) 并返回其结果：启用组提交时由写线程合并提交，否则在当前线程的连接上单独提交。
+    按公司分片时写入 公司名称 所在的分片；只有新建员工时（create_shard 为真）才创建分片，
+    其他写入遇到尚不存在的分片时不执行 fn（该公司还没有员工），返回 None"""
+    if 公司名称 is None:
+        db = repo
+    elif create_shard:
+        db = repo.shard(公司名称)
+    else:
+        db = repo.existing_shard(公司名称)
+        if db is None:
+            return None
+    if app.config['GROUP_COMMIT']:
+        result = get_group_writer(db).execute(fn)
+    else:
+        with db.transaction(immediate=True) as conn:
+            result = fn(conn)
+    if snapshot is not None:
+        snapshot.note_write()
+    return result
+
+@app.teardown_appcontext
+def release_db(exc):
+    """请求结束时回滚未提交的事务，连接留给下一个请求（PostgreSQL 归还连接池）"""
+    repo.release()
+    if snapshot is not None:
+        read_repo.release()
+
 def init_db():
     """初始化数据库"""
-    conn = sqlite3.connect('new_questions.db')
-    c = conn.cursor()
-    
-    # 创建问题表
-    c.execute('''CREATE TABLE IF NOT EXISTS questions (
-        id INTEGER PRIMARY KEY,
-        题目 TEXT NOT NULL,
-        选项 TEXT NOT NULL,
-        题目类型 TEXT NOT NULL,
-        正确答案 TEXT
-    )''')
-    
-    # 创建人员表 - 删除职业兴趣相关字段
-    c.execute('''CREATE TABLE IF NOT EXISTS employees (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        姓名 TEXT NOT NULL,
-        工号 TEXT NOT NULL,
-        公司名称 TEXT,
-        管理能力 REAL DEFAULT 0,
-        战略思维 REAL DEFAULT 0,
-        团队领导 REAL DEFAULT 0,
-        执行管控 REAL DEFAULT 0,
-        跨部门协作 REAL DEFAULT 0,
-        性格特质分数 REAL DEFAULT 0,
-        外向性 REAL DEFAULT 0,
-        宜人性 REAL DEFAULT 0,
-        开放性 REAL DEFAULT 0,
-        责任心 REAL DEFAULT 0,
-        性格特质类型 TEXT,
-        行为模式类型 TEXT,
-        行为模式分数 REAL DEFAULT 0,
-        通用能力 INTEGER DEFAULT 0,
-        言语理解 INTEGER DEFAULT 0,
-        数量分析 INTEGER DEFAULT 0,
-        逻辑推理 INTEGER DEFAULT 0,
-        空间认知 INTEGER DEFAULT 0,
-        创建时间 TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-    )''')
-
-    # 管理员表
-    c.execute('''CREATE TABLE IF NOT EXISTS admins (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        username TEXT UNIQUE NOT NULL,
-        password TEXT NOT NULL
-    )''')
-    # 初始化默认管理员
-    c.execute('SELECT COUNT(*) FROM admins')
-    count = c.fetchone()[0]
-    if count == 0:
-        c.execute('INSERT INTO admins (username, password) VALUES (?, ?)', (
-            app.config['ADMIN_USERNAME'], app.config['ADMIN_PASSWORD']
-        ))
-    
-    conn.commit()
-    conn.close()
+    repo.ensure_schema(app.config['ADMIN_USERNAME'], app.config['ADMIN_PASSWORD'])
+    # 解析直接修改题库后尚未结构化的选项，请求路径只读取结果
+    try:
+        ensure_structured_options(repo.connection())
+    except ValueError as e:
+        logger.error(f"题目选项解析失败，相关题目不会出现在题目列表中: {e}")
+    if snapshot is not None:
+        snapshot.ensure_snapshot()
+    # 不把连接带入 gunicorn 预加载后 fork 出的工作进程
+    repo.close()
+
+# 导入时即完成迁移：gunicorn 直接导入 new_app:app，不经过 __main__；
+# 多个工作进程同时导入时由迁移锁保证只有一个执行，已是最新版本时只做一次查询
+init_db()
 
 @app.route('/')
 def index():
-    """主页"""
-    return render_template('index.html')
+    """主页，内联当前题库静态文件的地址，前端优先从静态文件加载题目"""
+    bundle_url = None
+    try:
+        bundle = get_question_bundle(repo.connection())
+        if bundle is not None:
+            bundle_url = bundle.url
+    except Exception as e:
+        logger.error(f"获取题库静态文件失败: {str(e)}")
+    return render_template('index.html', question_bundle=bundle_url)
 
 @app.route('/api/login', methods=['POST'])
 def login():
@@ -112,317 +169,219 @@ def login():
         if not all([公司名称, 员工名称, 员工工号]):
             return jsonify({"msg": "请填写完整信息"}), 400
         
-        conn = sqlite3.connect('new_questions.db')
-        c = conn.cursor()
-        
-        # 检查是否已存在该员工
-        c.execute('SELECT id FROM employees WHERE 工号 = ?', (员工工号,))
-        existing = c.fetchone()
+        # 员工以 (公司名称, 工号) 唯一确定：不存在时新建，已存在时更新姓名
+        def upsert_employee(conn):
+            repo.upsert_employee(conn, 公司名称, 员工工号, 员工名称)
+            # 上次提交后关闭的答题进度不再拒收答案，未提交的进度保留用于继续答题
+            reopen_session(conn, 公司名称, 员工工号)
         
-        if existing:
-            # 更新现有记录
-            c.execute('''UPDATE employees SET 姓名 = ?, 公司名称 = ? WHERE 工号 = ?''', 
-                     (员工名称, 公司名称, 员工工号))
-        else:
-            # 创建新记录
-            c.execute('''INSERT INTO employees (姓名, 工号, 公司名称) VALUES (?, ?, ?)''', 
-                     (员工名称, 员工工号, 公司名称))
+        run_write(upsert_employee, 公司名称, create_shard=True)
         
-        conn.commit()
-        conn.close()
-        
-        return jsonify({"msg": "登录成功", "员工工号": 员工工号})
+        return jsonify({"msg": "登录成功", "公司名称": 公司名称, "员工工号": 员工工号})
         
     except Exception as e:
         logger.error(f"登录失败: {str(e)}")
         return jsonify({"msg": "登录失败", "error": str(e)}), 500
 
+def cached_payload_response(payload):
+    """按条件请求头返回预先序列化的响应，客户端缓存仍有效时返回 304"""
+    if request.if_none_match:
+        not_modified = payload.matches(request.if_none_match)
+    else:
+        since = request.if_modified_since
+        not_modified = since is not None and payload.last_modified <= since
+    
+    encoding, body, etag = payload.select(request.accept_encodings)
+    if not_modified:
+        response = make_response('', 304)
+    else:
+        response = make_response(body)
+        response.content_type = 'application/json; charset=utf-8'
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+    response.set_etag(etag)
+    response.last_modified = payload.last_modified
+    # 题库可能更新，每次都向服务器确认
+    response.headers['Cache-Control'] = 'no-cache'
+    response.vary.add('Accept-Encoding')
+    return response
+
+def read_json_body():
+    """读取 JSON 请求体，支持 Content-Encoding: gzip；解压或解析失败时抛出 ValueError"""
+    encoding = request.headers.get('Content-Encoding')
+    if not encoding:
+        return request.json
+    return json.loads(decode_body(request.get_data(), encoding))
+
 @app.route('/api/questions', methods=['GET'])
 def get_questions():
-    """获取所有题目"""
+    """获取所有题目
+
+    响应体按题库版本缓存为字节串；客户端携带的 ETag 或 If-Modified-Since 仍有效时返回 304。
+    带 section 或 cursor 参数时按测评类别分段返回，响应中的 next_cursor 指向下一段；
+    format=compact 时返回不含正确答案的紧凑列格式
+    """
     try:
-        conn = sqlite3.connect('new_questions.db')
-        c = conn.cursor()
-        c.execute('SELECT id, 题目, 选项, 题目类型, 正确答案 FROM questions ORDER BY id')
-        
-        all_data = []
-        for row in c.fetchall():
-            question_type = row[3]  # 题目类型
-            options_text = row[2]   # 选项文本
-            
-            # 根据题目类型处理选项格式
-            if question_type in ['情境题', '双向选择题']:
-                # 情境题和双向选择题使用分号分隔，格式：A=内容;B=内容;C=内容;D=内容
-                if ';' in options_text:
-                    options = options_text.split(';')
-                else:
-                    options = [options_text]  # 单个选项
-            elif question_type == '反向题':
-                # 反向题使用逗号分隔，格式：1=非常不符合，2=不太符合，3=一般，4=较符合，5=非常符合
-                if '，' in options_text:
-                    options = options_text.split('，')
-                elif ',' in options_text:
-                    options = options_text.split(',')
-                else:
-                    options = [options_text]
-            else:
-                # 其他题目类型（评分题、单选题）
-                if ';' in options_text:
-                    options = options_text.split(';')
-                elif '，' in options_text:
-                    options = options_text.split('，')
-                elif ',' in options_text:
-                    options = options_text.split(',')
-                else:
-                    options = [options_text]
-            
-            all_data.append({
-                "id": row[0],
-                "content": row[1],
-                "options": options,
-                "question_type": row[3],
-                "correct_answer": row[4]
-            })
+        sectioned = 'section' in request.args or 'cursor' in request.args
+        compact = request.args.get('format') == 'compact'
+        conn = repo.connection()
+        if sectioned:
+            sections = get_question_sections(conn)
+        else:
+            payload = get_question_payload(conn, compact)
         
-        conn.close()
-        return jsonify(all_data)
+        if sectioned:
+            try:
+                index = sections.locate(request.args.get('section'), request.args.get('cursor'))
+            except ValueError as e:
+                return jsonify({"msg": str(e), "restart_cursor": sections.cursor(0)}), 409
+            if index is None:
+                return jsonify({"msg": "分段不存在", "sections": sections.names}), 404
+            payload = (sections.compact_payloads if compact else sections.payloads)[index]
+        
+        response = cached_payload_response(payload)
+        if compact:
+            response.headers[WIRE_FORMAT_HEADER] = str(WIRE_FORMAT_VERSION)
+        return response
         
     except Exception as e:
         logger.error(f"获取题目失败: {str(e)}")
         return jsonify({"msg": "获取题目失败", "error": str(e)}), 500
 
-@app.route('/api/submit', methods=['POST'])
-def submit_answers():
-    """提交答案并计算得分 - 简化版本"""
+@app.route('/api/answers', methods=['POST'])
+def save_answers():
+    """答题过程中逐批上报答案，由后台线程与同一时间段的其他请求合并写入后返回"""
     try:
-        data = request.json
+        try:
+            data = read_json_body() or {}
+        except ValueError as e:
+            return jsonify({"msg": "请求体格式错误", "error": str(e)}), 400
         answers = data.get('answers', [])
+        公司名称 = data.get('公司名称', '')
         员工工号 = data.get('员工工号', '')
         
-        if not answers or not 员工工号:
+        if not 公司名称 or not 员工工号 or not isinstance(answers, list) or not answers:
             return jsonify({"msg": "缺少必要参数"}), 400
         
-        conn = sqlite3.connect('new_questions.db')
-        c = conn.cursor()
-        
-        # 获取题目信息
-        question_info = {}
-        c.execute('SELECT id, 题目类型, 正确答案 FROM questions')
-        for row in c.fetchall():
-            question_info[row[0]] = {
-                'type': row[1],
-                'correct': row[2] if row[2] and row[2].strip() else 'A'
-            }
-        
-        logger.info(f"开始处理 {len(answers)} 个答案")
+        try:
+            saved = answer_writer.save(公司名称, 员工工号, answers)
+        except TimeoutError:
+            return jsonify({"msg": "保存超时，请稍后重试"}), 503
+        if not saved:
+            return jsonify({"msg": "答题进度已关闭（答卷已提交或员工不存在），请重新登录后再答题"}), 409
+        return jsonify({"msg": "已保存", "count": len(answers)})
         
-        # 完整的维度映射 - 删除职业兴趣部分
-        dimension_maps = {
-            '管理能力': {
-                '战略与决策': [1, 2, 3, 4, 5],
-                '团队领导': [6, 7, 8, 9, 10],
-                '沟通影响': [11, 12, 13, 14, 15],
-                '执行管控': [16, 17, 18, 19, 20],
-                '学习创新': [21, 22, 23, 24, 25]
-            },
-            '性格特质': {
-                '外向性': [26, 32, 34],
-                '宜人性': [35, 37, 44],
-                '开放性': [28, 42],
-                '责任心': [27, 29, 30, 31, 36, 40, 43, 45]
-            },
-            'DISC行为模式': {
-                'D型支配型': [46, 47, 48, 49, 50],
-                'I型影响型': [51, 52, 53, 54, 55],
-                'S型稳健型': [56, 57, 58, 59, 60],
-                'C型谨慎型': [61, 62, 63, 64, 65]
-            },
-            '通用能力': {
-                '言语理解': list(range(66, 81)),
-                '数量分析': list(range(81, 96)),
-                '逻辑推理': list(range(96, 111)),
-                '空间认知': list(range(111, 126))
-            }
-        }
+    except Exception as e:
+        logger.error(f"保存答题进度失败: {str(e)}")
+        return jsonify({"msg": "保存失败", "error": str(e)}), 500
+
+@app.route('/api/answers', methods=['GET'])
+def get_answers():
+    """获取已保存的答题进度，用于刷新页面后继续答题"""
+    try:
+        公司名称 = request.args.get('公司名称', '')
+        员工工号 = request.args.get('员工工号', '')
+        if not 公司名称 or not 员工工号:
+            return jsonify({"msg": "缺少公司名称或员工工号"}), 400
+        
+        shard = repo.existing_shard(公司名称)
+        if shard is None:
+            return jsonify({"answers": [], "count": 0})
+        conn = repo.connection()
+        plan, layout = get_scoring_plan(conn), get_sheet_layout(conn)
+        session = load_session(shard.connection(), 公司名称, 员工工号, plan, layout)
+        answered = session.answered() if session is not None else []
+        return jsonify({"answers": answered, "count": len(answered)})
         
-        # 反向题列表 - 更新为新的管理能力反向题
-        reverse_questions = [3, 5, 7, 10, 12, 15, 17, 20, 22, 25, 27, 30, 33, 36, 39, 41]
+    except Exception as e:
+        logger.error(f"获取答题进度失败: {str(e)}")
+        return jsonify({"msg": "获取失败", "error": str(e)}), 500
+
+@app.route('/api/submit', methods=['POST'])
+def submit_answers():
+    """提交答案并计算得分 - 简化版本
+
+    incremental 为真时表示答案已通过 /api/answers 逐批上报，只需汇总服务器端累计的维度得分；
+    ids 为前端已作答的题号，用于确认所有答案均已落库。
+    请求头带 X-Wire-Format 时 answers 为按题库位置排列的压缩答案（见 wire_format.py），
+    layout 为前端题目所属的题库版本；请求体可用 gzip 压缩
+    """
+    try:
+        wire_format = request.headers.get(WIRE_FORMAT_HEADER)
+        if wire_format and wire_format != str(WIRE_FORMAT_VERSION):
+            return jsonify({"msg": f"不支持的传输格式版本: {wire_format}"}), 400
+        try:
+            data = read_json_body()
+        except ValueError as e:
+            return jsonify({"msg": "请求体格式错误", "error": str(e)}), 400
+        answers = data.get('answers', [])
+        公司名称 = data.get('公司名称', '')
+        员工工号 = data.get('员工工号', '')
+        incremental = bool(data.get('incremental')) and not wire_format
         
-        # 情境题分值映射 - 根据新设计文档
-        situation_scores = {
-            1: {'A': 2, 'B': 5, 'C': 3, 'D': 1},  # 战略主动性
-            4: {'A': 3, 'B': 5, 'C': 2, 'D': 1},  # 问题洞察力
-            6: {'A': 3, 'B': 5, 'C': 2, 'D': 1},  # 激励与辅导
-            9: {'A': 2, 'B': 5, 'C': 3, 'D': 1},  # 冲突处理
-            11: {'A': 3, 'B': 5, 'C': 4, 'D': 1}, # 沟通策略
-            14: {'A': 5, 'B': 3, 'C': 2, 'D': 1}, # 跨部门沟通
-            16: {'A': 3, 'B': 5, 'C': 2, 'D': 1}, # 执行判断
-            19: {'A': 5, 'B': 4, 'C': 2, 'D': 3}, # 规则意识
-            21: {'A': 4, 'B': 5, 'C': 3, 'D': 1}, # 学习意愿
-            24: {'A': 2, 'B': 5, 'C': 1, 'D': 4}  # 复原力
-        }
+        if not 公司名称 or not 员工工号 or not (answers or incremental):
+            return jsonify({"msg": "缺少必要参数"}), 400
         
-        # 双向选择题分值映射 - 根据新设计文档
-        dual_choice_scores = {
-            2: {'A': 3, 'B': 5},   # 战略敏感度
-            8: {'A': 5, 'B': 4},   # 领导风格
-            13: {'A': 4, 'B': 5},  # 沟通方式
-            18: {'A': 4, 'B': 5},  # 执行灵活度
-            23: {'A': 4, 'B': 5}   # 创新倾向
-        }
+        conn = repo.connection()
         
-        # 计算各维度得分
-        scores = {}
+        # 预编译的评分计划，题库未变化时直接复用
+        plan = get_scoring_plan(conn)
+        layout = get_sheet_layout(conn)
         
-        def calculate_score(q_id, answer_value, q_info):
-            """根据题目类型计算得分"""
-            q_type = q_info.get('type', '')
-            
-            # 情境题：使用预设分值映射
-            if q_type == '情境题':
-                if q_id in situation_scores:
-                    answer_key = str(answer_value).strip().upper()
-                    return situation_scores[q_id].get(answer_key, 1)
-                return 3  # 默认分数
-            
-            # 双向选择题：使用预设分值映射
-            elif q_type == '双向选择题':
-                if q_id in dual_choice_scores:
-                    answer_key = str(answer_value).strip().upper()
-                    return dual_choice_scores[q_id].get(answer_key, 3)
-                return 3  # 默认分数
-            
-            # 反向题：1-5分制，需要反转
-            elif q_type == '反向题':
-                try:
-                    score = int(answer_value)
-                    score = max(1, min(5, score))
-                    # 反向计分：1→5, 2→4, 3→3, 4→2, 5→1
-                    return 6 - score
-                except:
-                    return 3  # 默认分数
-            
-            # 普通评分题：1-5分制
-            elif q_type == '评分':
-                try:
-                    score = int(answer_value)
-                    score = max(1, min(5, score))
-                    return score
-                except:
-                    return 3  # 默认分数
-                    
-            # 单选题：正确得1分，错误得0分
-            elif q_type == '单选':
-                try:
-                    user_ans = str(answer_value).strip().upper()
-                    correct_ans = str(q_info.get('correct', 'A')).strip().upper()
-                    return 1 if user_ans == correct_ans else 0
-                except:
-                    return 0
+        if wire_format:
+            if data.get('layout') != layout.version:
+                return jsonify({"msg": "题库已更新，请重新加载题目", "layout": layout.version}), 409
+            try:
+                blob = decode_packed_answers(layout, answers)
+            except ValueError as e:
+                return jsonify({"msg": "答案格式错误", "error": str(e)}), 400
             
-            return 0
-        
-        for category, dims in dimension_maps.items():
-            cat_scores = {}
-            all_scores = []
+            # 直接对答卷字节查表累计，不构造逐题字典
+            logger.info(f"开始处理 {len(blob)} 位压缩答案")
+            scores = plan.aggregate(*get_packed_scorer(plan, layout).tally(blob))
+        elif incremental:
+            # 逐批上报的答案在确认前已写入数据库，由任一工作进程汇总都能看到
+            shard = repo.existing_shard(公司名称)
+            session = load_session(shard.connection(), 公司名称, 员工工号, plan, layout) if shard is not None else None
+            if session is not None and answers:
+                session.apply(plan, answers)
+            missing = session.missing(data.get('ids', [])) if session is not None else None
+            if session is None or missing:
+                return jsonify({"msg": "答案尚未全部保存", "missing": missing}), 409
             
-            for dim, ids in dims.items():
-                dim_scores = []
-                
-                for ans in answers:
-                    q_id = ans['id']
-                    if q_id in ids:
-                        q_info = question_info.get(q_id, {})
-                        score = calculate_score(q_id, ans['answer'], q_info)
-                        dim_scores.append(score)
-                        all_scores.append(score)
-                
-                # 计算维度平均分
-                if dim_scores:
-                    if category == '通用能力':
-                        # 通用能力改为5分制：正确率转换为1-5分
-                        correct_rate = sum(dim_scores) / len(dim_scores)
-                        # 将0-1的正确率映射到1-5分制
-                        dim_avg = round(1 + correct_rate * 4, 2)
-                    else:
-                        # 其他使用1-5分制
-                        dim_avg = round(sum(dim_scores) / len(dim_scores), 2)
-                else:
-                    dim_avg = 1 if category == '通用能力' else 0
-                    
-                cat_scores[dim] = dim_avg
+            logger.info(f"汇总 {len(session.answered())} 个逐题上报的答案")
+            scores = plan.aggregate(session.sums, session.counts)
+            blob = bytes(session.blob)
+        else:
+            logger.info(f"开始处理 {len(answers)} 个答案")
             
-            # 计算类别总分
-            if all_scores:
-                if category == '通用能力':
-                    # 通用能力改为5分制：正确率转换为1-5分
-                    correct_rate = sum(all_scores) / len(all_scores)
-                    total_score = round(1 + correct_rate * 4, 2)
-                else:
-                    total_score = round(sum(all_scores) / len(all_scores), 2)
-            else:
-                total_score = 1 if category == '通用能力' else 0
-                
-            cat_scores['total'] = total_score
-            scores[category] = cat_scores
-            logger.info(f"{category}: {total_score}分")
+            # 单次遍历计算各维度得分
+            scores = plan.score(answers)
+            blob = layout.pack(answers)
         
-        # 确定DISC行为类型（取最高分）
-        def get_max_type(data_dict):
-            """确定最高分的维度类型"""
-            try:
-                if not data_dict:
-                    return '综合型'
-                # 只考虑数值类型的键值对
-                numeric_items = {}
-                for k, v in data_dict.items():
-                    if k != 'total' and isinstance(v, (int, float)):
-                        numeric_items[k] = v
-                
-                if not numeric_items:
-                    return '综合型'
-                
-                max_val = max(numeric_items.values())
-                max_keys = [k for k, v in numeric_items.items() if v == max_val]
-                return '/'.join(max_keys[:2]) if max_keys else '综合型'
-            except:
-                return '综合型'
+        for category, cat_scores in scores.items():
+            logger.info(f"{category}: {cat_scores['total']}分")
         
         # 更新数据库 - 包含新的管理能力维度
-        c.execute('''UPDATE employees SET 
-            管理能力 = ?, 战略思维 = ?, 团队领导 = ?, 执行管控 = ?, 跨部门协作 = ?,
-            性格特质分数 = ?, 外向性 = ?, 宜人性 = ?, 开放性 = ?, 责任心 = ?, 性格特质类型 = ?,
-            行为模式类型 = ?, 行为模式分数 = ?,
-            通用能力 = ?, 言语理解 = ?, 数量分析 = ?, 逻辑推理 = ?, 空间认知 = ?
-            WHERE 工号 = ?''', (
-            scores['管理能力']['total'],
-            scores['管理能力']['战略与决策'],
-            scores['管理能力']['团队领导'],
-            scores['管理能力']['执行管控'],
-            scores['管理能力'].get('沟通影响', 0),  # 新维度，可能不存在
-            scores['性格特质']['total'],
-            scores['性格特质']['外向性'],
-            scores['性格特质']['宜人性'],
-            scores['性格特质']['开放性'],
-            scores['性格特质']['责任心'],
-            get_max_type(scores['性格特质']),
-            get_max_type(scores['DISC行为模式']),
-            scores['DISC行为模式']['total'],
-            scores.get('通用能力', {}).get('total', 0),
-            scores.get('通用能力', {}).get('言语理解', 0),
-            scores.get('通用能力', {}).get('数量分析', 0),
-            scores.get('通用能力', {}).get('逻辑推理', 0),
-            scores.get('通用能力', {}).get('空间认知', 0),
-            员工工号
-        ))
+        values = employee_score_values(scores)
         
-        conn.commit()
-        conn.close()
+        def write_scores(conn):
+            # 提交后关闭答题进度（包括改为整卷提交时遗留的进度）：提交前发出、之后才到达的答案不再写入
+            close_session(conn, 公司名称, 员工工号)
+            # 追加压缩后的原始答卷（便于重新评分和审计）和本次测评得分，不改写员工行的得分
+            recorded = repo.save_attempt(conn, 公司名称, 员工工号, layout, blob, plan.config_version, values)
+            
+            # 同一事务内更新常模直方图
+            if recorded:
+                record_scores(conn, 公司名称, 员工工号, dict(zip(EMPLOYEE_SCORE_COLUMNS, values)))
+        
+        run_write(write_scores, 公司名称)
         
         logger.info("评分计算完成")
         
-        return jsonify({
+        response = jsonify({
             "msg": "提交成功",
+            "评分版本": plan.config_version,
             "scores": {
                 "管理能力": scores['管理能力']['total'],
                 "性格特质": scores['性格特质']['total'],
@@ -430,6 +389,9 @@ def submit_answers():
                 "通用能力": scores['通用能力']['total']
             }
         })
+        if wire_format:
+            response.headers[WIRE_FORMAT_HEADER] = str(WIRE_FORMAT_VERSION)
+        return response
         
     except Exception as e:
         import traceback
@@ -438,87 +400,20 @@ def submit_answers():
         logger.error(f"错误堆栈: {error_trace}")
         return jsonify({"msg": "提交失败", "error": str(e)}), 500
 
-@app.route('/api/generate-report', methods=['POST'])
-def generate_report():
-    """生成报告"""
+# 报告使用的模型；修改 build_report_prompt 的拼接方式时把 REPORT_PROMPT_VERSION 加一，已缓存的报告随之不再命中
+REPORT_MODEL = "deepseek-chat"
+REPORT_PROMPT_VERSION = 2
+DEEPSEEK_API_URL = "https://api.deepseek.com/v1/chat/completions"
+# 报告中的日期占位符：不交给 DeepSeek 填写，返回报告时才替换为当天日期，缓存的报告中保留占位符
+REPORT_DATE_PLACEHOLDERS = ("[测评时间]", "[生成时间]")
+
+def load_report_template():
+    """报告模板 templates/report.template.md 的内容"""
     try:
-        data = request.json
-        员工工号 = data.get('员工工号', '')
-        
-        if not 员工工号:
-            return jsonify({"msg": "缺少员工工号"}), 400
-        
-        conn = sqlite3.connect('new_questions.db')
-        c = conn.cursor()
-        
-        # 获取员工信息
-        c.execute('''SELECT * FROM employees WHERE 工号 = ?''', (员工工号,))
-        employee = c.fetchone()
-        
-        if not employee:
-            return jsonify({"msg": "员工不存在"}), 404
-        
-        # 获取字段名
-        columns = [description[0] for description in c.description]
-        employee_data = dict(zip(columns, employee))
-        
-        conn.close()
-        
-        # 调用DeepSeek API生成报告
-        def call_deepseek_api(data):
-            api_key = app.config['DEEPSEEK_API_KEY']
-            api_url = "https://api.deepseek.com/v1/chat/completions"
-            
-            logger.info(f"开始调用DeepSeek API，数据长度: {len(data)}")
-            logger.info(f"API Key: {api_key[:20]}...")
-            
-            headers = {
-                "Content-Type": "application/json",
-                "Authorization": f"Bearer {api_key}"
-            }
-            
-            payload = {
-                "model": "deepseek-chat",
-                "messages": [
-                    {
-                        "role": "user",
-                        "content": data
-                    }
-                ]
-            }
-            
-            try:
-                response = requests.post(api_url, json=payload, headers=headers, timeout=180)
-                logger.info(f"DeepSeek API响应状态码: {response.status_code}")
-                
-                if response.status_code == 200:
-                    result = response.json()
-                    logger.info("DeepSeek API调用成功")
-                    return result
-                else:
-                    error_msg = f"API调用失败，状态码: {response.status_code}, 响应: {response.text}"
-                    logger.error(error_msg)
-                    return f"Error: {response.status_code} - {response.text}"
-                    
-            except requests.exceptions.Timeout:
-                error_msg = "DeepSeek API调用超时"
-                logger.error(error_msg)
-                return f"Error: Timeout - {error_msg}"
-            except requests.exceptions.RequestException as e:
-                error_msg = f"DeepSeek API网络请求异常: {str(e)}"
-                logger.error(error_msg)
-                return f"Error: Network - {error_msg}"
-            except Exception as e:
-                error_msg = f"DeepSeek API调用异常: {str(e)}"
-                logger.error(error_msg)
-                return f"Error: Exception - {error_msg}"
-        
-        # 读取报告模板
-        try:
-            with open('templates/report.template.md', 'r', encoding='utf-8') as file:
-                template_content = file.read()
-        except FileNotFoundError:
-            template_content = """
+        with open('templates/report.template.md', 'r', encoding='utf-8') as f:
+            return f.read()
+    except FileNotFoundError:
+        return """
 员工个人特征和能力综合分析报告
 一、员工基本信息
 姓名：{姓名}
@@ -544,22 +439,22 @@ def generate_report():
 
 请根据以上数据生成详细的分析报告。
 """
-        
-        # 获取当前时间
-        current_time = datetime.now().strftime("%Y年%m月%d日")
-        
-        # 准备数据 - 更新为新结构
-        data_text = f"""
+
+def build_report_prompt(employee_data, template_content, norm_text):
+    """生成报告的提示词：员工信息、各项得分、常模百分位和报告模板
+
+    提示词中不含日期，相同得分生成的报告可以跨日复用（见 fill_report_dates）
+    """
+    data_text = f"""
 员工信息：
 姓名：{employee_data['姓名']}
 工号：{employee_data['工号']}
 公司名称：{employee_data['公司名称']}
-测评时间：{current_time}
 
 能力评估结果：
 管理能力总分：{employee_data['管理能力']}分
 - 战略思维：{employee_data['战略思维']}分
-- 团队领导：{employee_data['团队领导']}分  
+- 团队领导：{employee_data['团队领导']}分
 - 执行管控：{employee_data['执行管控']}分
 - 跨部门协作：{employee_data['跨部门协作']}分
 
@@ -578,37 +473,95 @@ DISC行为模式：
 - 数量分析：{employee_data['数量分析']}分
 - 逻辑推理：{employee_data['逻辑推理']}分
 - 空间认知：{employee_data['空间认知']}分
-"""
+{norm_text}"""
+    placeholders = "、".join(REPORT_DATE_PLACEHOLDERS)
+    return (f"现在我需要你来按以下模板，生成报告：{data_text}\n\n"
+            f"模板中的{placeholders}请原样保留，不要替换为日期。\n\n模板：{template_content}")
+
+def fill_report_dates(text):
+    """把报告中的日期占位符替换为当天日期"""
+    current_time = datetime.now().strftime("%Y年%m月%d日")
+    for placeholder in REPORT_DATE_PLACEHOLDERS:
+        text = text.replace(placeholder, current_time)
+    return text
+
+def call_deepseek_report(prompt, progress=None):
+    """以流式调用 DeepSeek 生成报告，返回 Markdown 原文；调用失败时抛出 RuntimeError。
+    接收过程中每收到完整的行，把当前去除 Markdown 的部分报告交给 progress（见 ReportWorkerPool）"""
+    api_key = app.config['DEEPSEEK_API_KEY']
+    logger.info(f"开始调用DeepSeek API，数据长度: {len(prompt)}")
+
+    headers = {"Content-Type": "application/json", "Authorization": f"Bearer {api_key}"}
+    payload = {"model": REPORT_MODEL, "messages": [{"role": "user", "content": prompt}], "stream": True}
+
+    try:
+        # 流式响应的超时为相邻两段之间的等待时间
+        response = requests.post(DEEPSEEK_API_URL, json=payload, headers=headers, timeout=180, stream=True)
+        logger.info(f"DeepSeek API响应状态码: {response.status_code}")
+        if response.status_code != 200:
+            error_msg = f"Error: {response.status_code} - {response.text}"
+        else:
+            stripper = MarkdownStripper()
+            for delta in iter_chat_deltas(response):
+                stripper.feed(delta)
+                # 只在收到完整的行时更新进度，写入频率由 ReportWorkerPool 进一步限制
+                if progress and '\n' in delta:
+                    progress(lambda: stripper.text)
+            logger.info("DeepSeek API调用成功")
+            return stripper.raw
+    except requests.exceptions.Timeout:
+        error_msg = "Error: Timeout - DeepSeek API调用超时"
+    except requests.exceptions.RequestException as e:
+        error_msg = f"Error: Network - DeepSeek API网络请求异常: {str(e)}"
+    except Exception as e:
+        error_msg = f"Error: Exception - DeepSeek API调用异常: {str(e)}"
+    logger.error(error_msg)
+    raise RuntimeError(f"调用DeepSeek失败: {error_msg}")
+
+def employee_report_cache_key(employee_data, template_content):
+    """员工报告的缓存键（见 report_cache.py）"""
+    return report_cache_key(employee_data, template_content, REPORT_MODEL, REPORT_PROMPT_VERSION)
+
+def generate_report_content(employee_data, progress=None):
+    """生成员工的分析报告，返回 (去除 Markdown 的正文, 原文)；调用 DeepSeek 失败时抛出 RuntimeError。
+    考生端和管理端共用：得分、模板、提示词和模型都未变化时直接返回缓存的报告，生成成功后写入缓存。
+    employee_data 应读自主库，只读副本可能尚未包含最近一次提交的得分"""
+    template_content = load_report_template()
+    cache_key = employee_report_cache_key(employee_data, template_content)
+    cached = get_cached_report(repo.connection(), cache_key)
+    if cached is None:
+        company = employee_data['公司名称']
+        norm_text = describe_percentiles(repo.existing_shard(company).connection(), employee_data, repo.norm_tables())
+        # 生成中的部分报告同样替换日期占位符
+        report_progress = (lambda get_text: progress(lambda: fill_report_dates(get_text()))) if progress else None
+        raw = call_deepseek_report(build_report_prompt(employee_data, template_content, norm_text), report_progress)
+        cached = strip_markdown(raw), raw
+        with repo.transaction(immediate=True) as conn:
+            save_cached_report(conn, cache_key, cached[0], raw, REPORT_MODEL)
+    return tuple(fill_report_dates(text) for text in cached)
+
+@app.route('/api/generate-report', methods=['POST'])
+def generate_report():
+    """生成报告"""
+    try:
+        data = request.json
+        公司名称 = data.get('公司名称', '')
+        员工工号 = data.get('员工工号', '')
         
-        # 替换模板中的时间占位符
-        template_with_time = template_content.replace("[测评时间]", current_time).replace("[生成时间]", current_time)
+        if not 公司名称 or not 员工工号:
+            return jsonify({"msg": "缺少公司名称或员工工号"}), 400
         
-        input_data = f"现在我需要你来按以下模板，生成报告：{data_text}\n\n模板：{template_with_time}"
-        result = call_deepseek_api(input_data)
+        # 获取员工信息
+        employee_data = repo.get_employee(公司名称, 员工工号)
         
-        # 将Markdown清洗为纯文本
-        def strip_markdown(md: str) -> str:
-            if not isinstance(md, str):
-                return ''
-            text = md
-            text = re.sub(r"(?m)^\s{0,3}#{1,6}\s*", "", text)
-            text = re.sub(r"\*\*(.*?)\*\*", r"\1", text)
-            text = re.sub(r"\*(.*?)\*", r"\1", text)
-            text = re.sub(r"_(.*?)_", r"\1", text)
-            text = re.sub(r"(?m)^\s*[-•]\s*", "", text)
-            text = re.sub(r"`{1,3}(.*?)`{1,3}", r"\1", text)
-            text = re.sub(r"(?s)```.*?```", "", text)
-            text = re.sub(r"(?m)^---+$", "", text)
-            text = re.sub(r"\r", "", text)
-            text = re.sub(r"\n{3,}", "\n\n", text)
-            return text.strip()
+        if not employee_data:
+            return jsonify({"msg": "员工不存在"}), 404
         
-        if isinstance(result, dict) and result.get('choices'):
-            raw = result['choices'][0]['message'].get('content', '')
-            clean = strip_markdown(raw)
-            return jsonify({"content": clean, "raw": raw})
-        else:
-            return jsonify({"msg": "调用DeepSeek失败", "error": str(result)}), 500
+        try:
+            content, raw = generate_report_content(employee_data)
+        except RuntimeError as e:
+            return jsonify({"msg": "调用DeepSeek失败", "error": str(e)}), 500
+        return jsonify({"content": content, "raw": raw})
         
     except Exception as e:
         logger.error(f"生成报告失败: {str(e)}")
@@ -623,12 +576,7 @@ def admin_login():
         password = data.get('password', '').strip()
         if not username or not password:
             return jsonify({"msg": "缺少账号或密码"}), 400
-        conn = sqlite3.connect('new_questions.db')
-        c = conn.cursor()
-        c.execute('SELECT id FROM admins WHERE username=? AND password=?', (username, password))
-        row = c.fetchone()
-        conn.close()
-        if row:
+        if repo.check_admin(username, password):
             return jsonify({"msg": "登录成功"})
         return jsonify({"msg": "账号或密码错误"}), 401
     except Exception as e:
@@ -636,152 +584,254 @@ def admin_login():
         return jsonify({"msg": "登录失败", "error": str(e)}), 500
 
 # 列出员工
+def employee_list_query(args):
+    """管理端员工列表的查询参数 -> list_employees 的参数，格式错误时抛出 ValueError
+
+    公司名称、行为模式类型精确匹配；开始日期/结束日期为 YYYY-MM-DD（含当天）；
+    min_<评分列>/max_<评分列> 为得分下限/上限；limit 为每页条数；cursor 为上一页返回的 next_cursor
+    """
+    query = {}
+    for key in ('公司名称', '行为模式类型'):
+        value = args.get(key, '').strip()
+        if value:
+            query[key] = value
+    # 结束日期含当天，转换为次日零点之前
+    for key, name, days in (('开始日期', '开始时间', 0), ('结束日期', '结束时间', 1)):
+        value = args.get(key, '').strip()
+        if value:
+            try:
+                day = datetime.strptime(value, '%Y-%m-%d')
+            except ValueError:
+                raise ValueError(f'{key}格式应为 YYYY-MM-DD')
+            query[name] = (day + timedelta(days=days)).strftime('%Y-%m-%d')
+    for prefix, name in (('min_', '最低分'), ('max_', '最高分')):
+        bounds = {}
+        for key, value in args.items():
+            if not key.startswith(prefix) or not value.strip():
+                continue
+            col = key[len(prefix):]
+            if col not in NORM_COLUMNS:
+                raise ValueError(f'未知的评分列: {col}')
+            try:
+                bounds[col] = float(value)
+            except ValueError:
+                raise ValueError(f'{key} 应为数字')
+        if bounds:
+            query[name] = bounds
+    try:
+        limit = int(args.get('limit', EMPLOYEE_PAGE_SIZE))
+    except ValueError:
+        raise ValueError('limit 应为整数')
+    query['limit'] = max(1, min(limit, MAX_EMPLOYEE_PAGE_SIZE))
+    if args.get('cursor'):
+        query['after'] = args['cursor']
+    return query
+
 @app.route('/api/admin/employees', methods=['GET'])
 def admin_list_employees():
+    """员工列表，按创建时间倒序分页：返回 {employees, next_cursor}，next_cursor 为空表示没有下一页"""
     try:
-        conn = sqlite3.connect('new_questions.db')
-        c = conn.cursor()
-        c.execute('SELECT id, 工号, 姓名, 管理能力, 战略思维, 团队领导, 执行管控, 跨部门协作, 性格特质分数, 外向性, 宜人性, 开放性, 责任心, 性格特质类型, 行为模式类型, 行为模式分数, 通用能力, 言语理解, 数量分析, 逻辑推理, 空间认知 FROM employees ORDER BY 创建时间 DESC')
-        cols = [d[0] for d in c.description]
-        rows = [dict(zip(cols, r)) for r in c.fetchall()]
-        conn.close()
-        return jsonify(rows)
+        try:
+            query = employee_list_query(request.args)
+            rows, next_cursor = read_repo.list_employees(**query)
+        except ValueError as e:
+            return jsonify({"msg": str(e)}), 400
+        norm_tables = read_repo.norm_tables()
+        # 百分位直接查缓存的累计分布，未提交答卷的员工不计算
+        for row in rows:
+            if row.pop('已测评'):
+                row['百分位'], row['公司百分位'] = percentile_ranks(norm_tables, row, row['公司名称'])
+        result = {"employees": rows, "next_cursor": next_cursor}
+        if snapshot is not None:
+            result['snapshot'] = snapshot.status()
+        return jsonify(result)
     except Exception as e:
         logger.error(f"获取员工列表失败: {e}")
         return jsonify({"msg": "获取失败", "error": str(e)}), 500
 
-# 管理员生成报告（复用现有逻辑，但只允许此接口）
+# 管理员生成报告：在报告任务的工作线程中执行（见 report_jobs.py）
+def generate_admin_report(company, emp_no, progress=None):
+    """生成员工的分析报告，返回 (去除 Markdown 的正文, 原文)；员工不存在或调用 DeepSeek 失败时抛出 RuntimeError"""
+    employee_data = repo.get_employee(company, emp_no)
+    if not employee_data:
+        raise RuntimeError("员工不存在")
+    return generate_report_content(employee_data, progress)
+
+# 报告生成线程，每个工作进程各一组，进程重启后继续执行表中未完成的任务
+report_workers = ReportWorkerPool(repo, generate_admin_report, app.config['REPORT_WORKERS'])
+
+@app.before_request
+def start_report_workers():
+    # gunicorn 预加载后 fork 出的工作进程在处理第一个请求时启动自己的工作线程
+    report_workers.start()
+
+def report_job_response(job):
+    """报告任务 -> 接口响应，时间转换为本地时间文本"""
+    def format_time(value):
+        return datetime.fromtimestamp(value).strftime('%Y-%m-%d %H:%M:%S') if value else None
+    return {
+        "job_id": job['id'],
+        "status": job['状态'],
+        "attempts": job['尝试次数'],
+        "content": job['报告'],
+        "raw": job['原文'],
+        "error": job['错误'],
+        "created_at": format_time(job['创建时间']),
+        "finished_at": format_time(job['完成时间']),
+    }
+
+# 管理员生成报告：登记任务后立即返回任务编号，由 /api/admin/report-jobs/<job_id> 查询进度和结果
 @app.route('/api/admin/generate-report', methods=['POST'])
 def admin_generate_report():
     try:
         data = request.json or {}
+        company = data.get('公司名称', '').strip()
         emp_no = data.get('员工工号', '').strip()
-        if not emp_no:
-            return jsonify({"msg": "缺少员工工号"}), 400
-        # 直接复用原 /api/generate-report 的主体逻辑
-        # 复制其内部实现，避免用户端调用
-        conn = sqlite3.connect('new_questions.db')
-        c = conn.cursor()
-        c.execute('''SELECT * FROM employees WHERE 工号 = ?''', (emp_no,))
-        employee = c.fetchone()
-        if not employee:
+        if not company or not emp_no:
+            return jsonify({"msg": "缺少公司名称或员工工号"}), 400
+        # 从主库读取得分：只读副本可能尚未包含刚重新提交的答卷，会误用旧得分的缓存
+        employee_data = repo.get_employee(company, emp_no)
+        if not employee_data:
             return jsonify({"msg": "员工不存在"}), 404
-        columns = [d[0] for d in c.description]
-        employee_data = dict(zip(columns, employee))
-        conn.close()
+        # 得分和模板等都未变化时直接返回缓存的报告，不登记任务
+        cached = get_cached_report(repo.connection(), employee_report_cache_key(employee_data, load_report_template()))
+        if cached is not None:
+            content, raw = (fill_report_dates(text) for text in cached)
+            return jsonify({"job_id": None, "status": "done", "content": content, "raw": raw, "cached": True})
+        # 同一员工已有未完成的任务时返回该任务
+        with repo.transaction(immediate=True) as conn:
+            job_id = enqueue_job(conn, company, emp_no)
+        report_workers.notify()
+        job = get_job(repo.connection(), job_id)
+        return jsonify(dict(report_job_response(job), msg="已加入生成队列")), 202
+    except Exception as e:
+        logger.error(f"管理员生成报告失败: {e}")
+        return jsonify({"msg": "生成报告失败", "error": str(e)}), 500
 
-        def call_deepseek_api(data):
-            api_key = app.config['DEEPSEEK_API_KEY']
-            api_url = "https://api.deepseek.com/v1/chat/completions"
-            
-            logger.info(f"管理员开始调用DeepSeek API，数据长度: {len(data)}")
-            logger.info(f"API Key: {api_key[:20]}...")
-            
-            headers = {"Content-Type": "application/json", "Authorization": f"Bearer {api_key}"}
-            payload = {"model": "deepseek-chat", "messages": [{"role": "user", "content": data}]}
-            
-            try:
-                response = requests.post(api_url, json=payload, headers=headers, timeout=180)
-                logger.info(f"DeepSeek API响应状态码: {response.status_code}")
-                
-                if response.status_code == 200:
-                    result = response.json()
-                    logger.info("DeepSeek API调用成功")
-                    return result
-                else:
-                    error_msg = f"API调用失败，状态码: {response.status_code}, 响应: {response.text}"
-                    logger.error(error_msg)
-                    return f"Error: {response.status_code} - {response.text}"
-                    
-            except requests.exceptions.Timeout:
-                error_msg = "DeepSeek API调用超时"
-                logger.error(error_msg)
-                return f"Error: Timeout - {error_msg}"
-            except requests.exceptions.RequestException as e:
-                error_msg = f"DeepSeek API网络请求异常: {str(e)}"
-                logger.error(error_msg)
-                return f"Error: Network - {error_msg}"
-            except Exception as e:
-                error_msg = f"DeepSeek API调用异常: {str(e)}"
-                logger.error(error_msg)
-                return f"Error: Exception - {error_msg}"
+# 报告任务的状态（queued/running/done/failed），完成后带报告正文
+@app.route('/api/admin/report-jobs/<job_id>', methods=['GET'])
+def admin_report_job(job_id):
+    try:
+        job = get_job(repo.connection(), job_id)
+        if job is None:
+            return jsonify({"msg": "任务不存在"}), 404
+        return jsonify(report_job_response(job))
+    except Exception as e:
+        logger.error(f"获取报告任务失败: {e}")
+        return jsonify({"msg": "获取失败", "error": str(e)}), 500
 
-        try:
-            with open('templates/report.template.md', 'r', encoding='utf-8') as f:
-                template_content = f.read()
-        except FileNotFoundError:
-            template_content = "一、员工基本信息\n姓名：{姓名}\n工号：{工号}\n公司名称：{公司名称}\n"
+# 报告任务的事件流（SSE）：生成过程中逐段推送部分报告，完成或失败后结束
+@app.route('/api/admin/report-jobs/<job_id>/events', methods=['GET'])
+def admin_report_job_events(job_id):
+    try:
+        if get_job(repo.connection(), job_id) is None:
+            return jsonify({"msg": "任务不存在"}), 404
+    except Exception as e:
+        logger.error(f"获取报告任务失败: {e}")
+        return jsonify({"msg": "获取失败", "error": str(e)}), 500
+    events = iter_job_events(repo, job_id, request.headers.get('Last-Event-ID'))
+    # X-Accel-Buffering 关闭 nginx 对该响应的缓冲，事件逐条送达浏览器
+    return Response(events, mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
-        current_time = datetime.now().strftime("%Y年%m月%d日")
-        data_text = f"""
-员工信息：
-姓名：{employee_data['姓名']}
-工号：{employee_data['工号']}
-公司名称：{employee_data['公司名称']}
-测评时间：{current_time}
 
-能力评估结果：
-管理能力总分：{employee_data['管理能力']}分
-- 战略思维：{employee_data['战略思维']}分
-- 团队领导：{employee_data['团队领导']}分  
-- 执行管控：{employee_data['执行管控']}分
-- 跨部门协作：{employee_data['跨部门协作']}分
+# 查看当前评分规则配置
+@app.route('/api/admin/scoring-config', methods=['GET'])
+def admin_get_scoring_config():
+    try:
+        version, config = load_raw_config(repo.connection())
+        return jsonify({"version": version, "config": config})
+    except Exception as e:
+        logger.error(f"获取评分配置失败: {e}")
+        return jsonify({"msg": "获取失败", "error": str(e)}), 500
 
-性格特质总分：{employee_data['性格特质分数']}分
-- 外向性：{employee_data['外向性']}分
-- 宜人性：{employee_data['宜人性']}分
-- 开放性：{employee_data['开放性']}分
-- 责任心：{employee_data['责任心']}分
+# 发布新版本评分规则，所有工作进程在下一次请求时自动生效
+@app.route('/api/admin/scoring-config', methods=['POST'])
+def admin_publish_scoring_config():
+    try:
+        data = request.json or {}
+        config = data.get('config')
+        if not config:
+            return jsonify({"msg": "缺少评分配置"}), 400
+        try:
+            version = publish_scoring_config(repo.connection(), config, data.get('说明'))
+        except ValueError as e:
+            return jsonify({"msg": "评分配置无效", "error": str(e)}), 400
+        logger.info(f"已发布评分配置版本 {version}")
+        return jsonify({"msg": "发布成功", "version": version})
+    except Exception as e:
+        logger.error(f"发布评分配置失败: {e}")
+        return jsonify({"msg": "发布失败", "error": str(e)}), 500
 
-DISC行为模式：
-- 类型：{employee_data['行为模式类型']}
-- 总分：{employee_data['行为模式分数']}分
+# 按当前评分规则重新计算全部已保存答卷
+@app.route('/api/admin/rescore', methods=['POST'])
+def admin_rescore():
+    try:
+        data = request.json or {}
+        dry_run = bool(data.get('dry_run', False))
+        start = datetime.now()
+        # 按公司分片时逐个分片重算，题库和评分配置取自主库
+        count = sum(rescore_all(shard.connection(), dry_run=dry_run, catalog=repo.connection())
+                    for shard in repo.shards())
+        if snapshot is not None and not dry_run:
+            snapshot.refresh()
+        elapsed = (datetime.now() - start).total_seconds()
+        logger.info(f"重新评分完成：{count} 份答卷，耗时 {elapsed:.2f} 秒")
+        return jsonify({"msg": "重新评分完成", "count": count, "dry_run": dry_run, "elapsed": elapsed})
+    except Exception as e:
+        logger.error(f"重新评分失败: {e}")
+        return jsonify({"msg": "重新评分失败", "error": str(e)}), 500
 
-通用能力总分：{employee_data['通用能力']}分
-- 言语理解：{employee_data['言语理解']}分
-- 数量分析：{employee_data['数量分析']}分
-- 逻辑推理：{employee_data['逻辑推理']}分
-- 空间认知：{employee_data['空间认知']}分
-"""
-        template_with_time = template_content.replace("[测评时间]", current_time).replace("[生成时间]", current_time)
-        input_data = f"现在我需要你来按以下模板，生成报告：{data_text}\n\n模板：{template_with_time}"
-        result = call_deepseek_api(input_data)
-
-        def strip_markdown(md: str) -> str:
-            if not isinstance(md, str):
-                return ''
-            text = md
-            text = re.sub(r"(?m)^\s{0,3}#{1,6}\s*", "", text)
-            text = re.sub(r"\*\*(.*?)\*\*", r"\1", text)
-            text = re.sub(r"\*(.*?)\*", r"\1", text)
-            text = re.sub(r"_(.*?)_", r"\1", text)
-            text = re.sub(r"(?m)^\s*[-•]\s*", "", text)
-            text = re.sub(r"`{1,3}(.*?)`{1,3}", r"\1", text)
-            text = re.sub(r"(?s)```.*?```", "", text)
-            text = re.sub(r"(?m)^---+$", "", text)
-            text = re.sub(r"\r", "", text)
-            text = re.sub(r"\n{3,}", "\n\n", text)
-            return text.strip()
-
-        if isinstance(result, dict) and result.get('choices'):
-            raw = result['choices'][0]['message'].get('content', '')
-            clean = strip_markdown(raw)
-            return jsonify({"content": clean, "raw": raw})
-        return jsonify({"msg": "调用DeepSeek失败", "error": str(result)}), 500
+# 写入队列指标：组提交的队列深度、批大小分布及逐题答案队列长度
+@app.route('/api/admin/write-metrics', methods=['GET'])
+def admin_write_metrics():
+    try:
+        metrics = group_writer.metrics()
+        metrics['enabled'] = app.config['GROUP_COMMIT']
+        if app.config['SHARD_DIR']:
+            with shard_writers_lock:
+                writers = dict(shard_writers)
+            metrics['shards'] = {name: writer.metrics() for name, writer in writers.items()}
+        metrics['answer_queue_depth'] = answer_writer.pending()
+        return jsonify(metrics)
     except Exception as e:
-        logger.error(f"管理员生成报告失败: {e}")
-        return jsonify({"msg": "生成报告失败", "error": str(e)}), 500
+        logger.error(f"获取写入指标失败: {e}")
+        return jsonify({"msg": "获取失败", "error": str(e)}), 500
+
+# 只读快照状态（GET）与立即刷新（POST）
+@app.route('/api/admin/snapshot', methods=['GET', 'POST'])
+def admin_snapshot():
+    try:
+        if snapshot is None:
+            return jsonify({"enabled": False})
+        if request.method == 'POST':
+            snapshot.refresh()
+        return jsonify(dict(snapshot.status(), enabled=True))
+    except Exception as e:
+        logger.error(f"刷新只读快照失败: {e}")
+        return jsonify({"msg": "刷新失败", "error": str(e)}), 500
+
+# 员工历次测评得分，按提交先后排序，用于对比多次测评的变化
+@app.route('/api/admin/attempts', methods=['GET'])
+def admin_list_attempts():
+    try:
+        company = request.args.get('公司名称', '').strip()
+        emp_no = request.args.get('员工工号', '').strip()
+        if not company or not emp_no:
+            return jsonify({"msg": "缺少公司名称或员工工号"}), 400
+        shard = read_repo.existing_shard(company)
+        attempts = shard.list_attempts(company, emp_no) if shard is not None else []
+        return jsonify({"attempts": attempts})
+    except Exception as e:
+        logger.error(f"获取测评记录失败: {e}")
+        return jsonify({"msg": "获取失败", "error": str(e)}), 500
 
 # 导出Excel
 @app.route('/api/admin/export', methods=['GET'])
 def admin_export():
     try:
-        conn = sqlite3.connect('new_questions.db')
-        c = conn.cursor()
-        c.execute('''SELECT 工号, 姓名, 管理能力, 性格特质分数, 行为模式分数, 通用能力 FROM employees''')
-        headers = ['工号','姓名','管理能力得分','性格特质得分','行为模式得分','通用能力得分']
-        rows = c.fetchall()
-        conn.close()
+        headers = ['公司名称','工号','姓名','管理能力得分','性格特质得分','行为模式得分','通用能力得分']
+        rows = read_repo.export_employees()
 
         # 创建DataFrame
         df = pd.DataFrame(rows, columns=headers)
@@ -792,12 +842,16 @@ def admin_export():
             df.to_excel(writer, sheet_name='员工测评数据', index=False)
         
         output.seek(0)
-        return send_file(
+        response = send_file(
             output,
             mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
             as_attachment=True,
             download_name='员工测评数据.xlsx'
         )
+        # 导出读取只读快照时，告知数据落后的秒数
+        if snapshot is not None:
+            response.headers['X-Snapshot-Age'] = str(snapshot.status()['age_seconds'])
+        return response
     except Exception as e:
         logger.error(f"导出失败: {e}")
         return jsonify({"msg": "导出失败", "error": str(e)}), 500
@@ -806,11 +860,16 @@ def admin_export():
 @app.route('/api/admin/clear', methods=['POST'])
 def admin_clear():
     try:
-        conn = sqlite3.connect('new_questions.db')
-        c = conn.cursor()
-        c.execute('DELETE FROM employees')
-        conn.commit()
-        conn.close()
+        # 按公司分片时逐个分片清空，各自一个事务
+        for shard in repo.shards():
+            with shard.transaction(immediate=True) as conn:
+                shard.clear_assessments(conn)
+        # 报告任务和缓存的报告含员工数据，一并删除
+        with repo.transaction(immediate=True) as conn:
+            clear_jobs(conn)
+            clear_report_cache(conn)
+        if snapshot is not None:
+            snapshot.refresh()
         return jsonify({"msg": "已清空"})
     except Exception as e:
         logger.error(f"清空失败: {e}")
@@ -821,7 +880,6 @@ def manage():
     return render_template('manage.html')
 
 if __name__ == '__main__':
-    init_db()
     # 生产环境使用环境变量配置端口
     port = int(os.environ.get('PORT', 5000))
     app.run(host='0.0.0.0', port=port) 
\ No newline at end of file
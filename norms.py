@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+常模与百分位
+每次提交时增量更新各维度得分的固定分箱直方图（全体及按公司名称），
+分数保留两位小数，按 0.01 分箱即为精确分布；查询百分位时只需读取缓存的累计分布，
+不再扫描 employees 表。
+提交答卷只更新直方图，不改动 norm_state：读取方的缓存最多每 NORM_RELOAD_INTERVAL 秒重新读取一次，
+百分位可能略落后于最近的提交；重建或清空常模时版本递增，缓存立即失效
+
+用法：python norms.py rebuild [--db new_questions.db]   # 按现有得分重建常模
+"""
+
+import argparse
+import json
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from database import database_key, is_postgres
+from scoring import EMPLOYEE_SCORE_FIELDS
+
+DB_NAME = 'new_questions.db'
+
+# 参与常模统计的数值型评分列
+NORM_COLUMNS = tuple(col for col, _, dim in EMPLOYEE_SCORE_FIELDS if dim is not None)
+# 全体常模使用空公司名称
+ALL_COMPANIES = ''
+# 分箱：0.00 ~ 5.00 每 0.01 一箱
+BIN_SCALE = 100
+MAX_BIN = 5 * BIN_SCALE
+# 常模缓存重新读取直方图的最短间隔（秒）
+NORM_RELOAD_INTERVAL = 30
+
+_cache_lock = threading.Lock()
+# 数据库标识 -> (常模版本, 读取时间, {(维度, 公司名称): NormTable})，按公司分片时每个分片各一份
+_cache = {}
+
+
+def ensure_norm_tables(conn):
+    """创建常模相关表（幂等）；PostgreSQL 的表结构见 postgres_schema.sql"""
+    c = conn.cursor()
+    if is_postgres(conn):
+        c.execute('INSERT INTO norm_state (id, version) VALUES (1, 0) ON CONFLICT DO NOTHING')
+        conn.commit()
+        return
+    c.execute('''CREATE TABLE IF NOT EXISTS norm_histograms (
+        维度 TEXT NOT NULL,
+        公司名称 TEXT NOT NULL,
+        分箱 INTEGER NOT NULL,
+        人数 INTEGER NOT NULL,
+        PRIMARY KEY (维度, 公司名称, 分箱)
+    ) WITHOUT ROWID''')
+    # 早期的成员表以工号为主键：改为 (公司名称, 员工工号) 后按现有答卷重建
+    primary_key = [row[1] for row in c.execute('PRAGMA table_info(norm_members)') if row[5]]
+    legacy = primary_key == ['员工工号']
+    if legacy:
+        c.execute('DROP TABLE norm_members')
+    # 每位员工当前计入常模的分箱，重新提交时据此扣除旧分数
+    c.execute('''CREATE TABLE IF NOT EXISTS norm_members (
+        公司名称 TEXT NOT NULL,
+        员工工号 TEXT NOT NULL,
+        分箱 TEXT NOT NULL,
+        PRIMARY KEY (公司名称, 员工工号)
+    )''')
+    c.execute('''CREATE TABLE IF NOT EXISTS norm_state (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        version INTEGER NOT NULL
+    )''')
+    c.execute('INSERT INTO norm_state (id, version) VALUES (1, 0) ON CONFLICT DO NOTHING')
+    # 早期成员表删除后，常模由第 12 个迁移按测评记录重建
+    conn.commit()
+
+
+def score_bin(value):
+    """得分 -> 分箱编号"""
+    try:
+        return max(0, min(MAX_BIN, int(round(float(value) * BIN_SCALE))))
+    except (TypeError, ValueError):
+        return 0
+
+
+def _bins_from_values(values_by_column):
+    return [score_bin(values_by_column.get(col, 0)) for col in NORM_COLUMNS]
+
+
+def record_scores(conn, company, emp_no, values_by_column):
+    """把一位员工的最新得分计入常模，替换其之前计入的分数（不提交事务）
+
+    不递增常模版本：并发提交不必排队等待 norm_state 同一行的行锁，读取方按时间重新加载
+    """
+    company = company or ''
+    c = conn.cursor()
+    row = c.execute('SELECT 分箱 FROM norm_members WHERE 公司名称 = ? AND 员工工号 = ?', (company, emp_no)).fetchone()
+    if row is not None:
+        c.executemany('UPDATE norm_histograms SET 人数 = 人数 - 1 WHERE 维度 = ? AND 公司名称 = ? AND 分箱 = ?',
+                      _histogram_keys(company, json.loads(row[0])))
+
+    bins = _bins_from_values(values_by_column)
+    c.executemany('''INSERT INTO norm_histograms (维度, 公司名称, 分箱, 人数) VALUES (?, ?, ?, 1)
+        ON CONFLICT (维度, 公司名称, 分箱) DO UPDATE SET 人数 = norm_histograms.人数 + 1''',
+                  _histogram_keys(company, bins))
+    c.execute('''INSERT INTO norm_members (公司名称, 员工工号, 分箱) VALUES (?, ?, ?)
+        ON CONFLICT (公司名称, 员工工号) DO UPDATE SET 分箱 = excluded.分箱''',
+              (company, emp_no, json.dumps(bins)))
+
+
+def _histogram_keys(company, bins):
+    keys = []
+    for col, b in zip(NORM_COLUMNS, bins):
+        keys.append((col, ALL_COMPANIES, b))
+        if company:
+            keys.append((col, company, b))
+    return keys
+
+
+def rebuild_norms(conn):
+    """按各员工最新一次测评的得分重建常模（不提交事务）"""
+    columns = ', '.join(f'a.{col}' for col in NORM_COLUMNS)
+    rows = conn.execute(f'''SELECT e.工号, e.公司名称, {columns} FROM employees e
+        JOIN assessment_attempts a ON a.id = e.最新测评ID''').fetchall()
+
+    counts = {}
+    members = []
+    for row in rows:
+        emp_no, company = row[0], row[1] or ''
+        bins = [score_bin(v) for v in row[2:]]
+        members.append((company, emp_no, json.dumps(bins)))
+        for key in _histogram_keys(company, bins):
+            counts[key] = counts.get(key, 0) + 1
+
+    c = conn.cursor()
+    c.execute('DELETE FROM norm_histograms')
+    c.execute('DELETE FROM norm_members')
+    c.executemany('INSERT INTO norm_histograms (维度, 公司名称, 分箱, 人数) VALUES (?, ?, ?, ?)',
+                  [key + (n,) for key, n in counts.items()])
+    c.executemany('INSERT INTO norm_members (公司名称, 员工工号, 分箱) VALUES (?, ?, ?)', members)
+    c.execute('UPDATE norm_state SET version = version + 1 WHERE id = 1')
+    return len(members)
+
+
+def clear_norms(conn):
+    """清空常模（不提交事务）"""
+    conn.execute('DELETE FROM norm_histograms')
+    conn.execute('DELETE FROM norm_members')
+    conn.execute('UPDATE norm_state SET version = version + 1 WHERE id = 1')
+
+
+class NormTable:
+    """单个维度、单个常模群体的累计分布"""
+
+    __slots__ = ('total', 'below', 'counts')
+
+    def __init__(self, counts):
+        self.counts = counts
+        self.total = int(counts.sum())
+        # below[b] 为分箱小于 b 的人数
+        self.below = np.concatenate(([0], np.cumsum(counts)[:-1]))
+
+    def percentile(self, value):
+        """百分位等级：低于该分数的人数加上同分人数的一半，占总人数的百分比"""
+        if not self.total:
+            return None
+        b = score_bin(value)
+        return round((int(self.below[b]) + int(self.counts[b]) / 2) / self.total * 100, 1)
+
+
+def _load_tables(conn):
+    """读取全部直方图 {(维度, 公司名称): NormTable}"""
+    hist = {}
+    for col, company, b, n in conn.execute(
+            'SELECT 维度, 公司名称, 分箱, 人数 FROM norm_histograms WHERE 人数 > 0'):
+        counts = hist.get((col, company))
+        if counts is None:
+            counts = hist[(col, company)] = np.zeros(MAX_BIN + 1, dtype=np.int64)
+        counts[b] = n
+    return {key: NormTable(counts) for key, counts in hist.items()}
+
+
+def get_versioned_norm_tables(conn):
+    """返回 (缓存标识, 常模缓存)：常模重建或清空（版本变化）后立即重新读取，否则缓存最多保留
+    NORM_RELOAD_INTERVAL 秒。缓存标识为 (常模版本, 读取时间)，重新读取后随之变化"""
+    key = database_key(conn)
+    version = conn.execute('SELECT version FROM norm_state WHERE id = 1').fetchone()[0]
+    cached = _cache.get(key)
+    if not _is_fresh(cached, version):
+        with _cache_lock:
+            cached = _cache.get(key)
+            if not _is_fresh(cached, version):
+                cached = _cache[key] = (version, time.monotonic(), _load_tables(conn))
+    return cached[:2], cached[2]
+
+
+def _is_fresh(cached, version):
+    return cached is not None and cached[0] == version and time.monotonic() - cached[1] < NORM_RELOAD_INTERVAL
+
+
+def get_norm_tables(conn):
+    """返回当前版本的常模缓存，常模有更新时才重新读取"""
+    return get_versioned_norm_tables(conn)[1]
+
+
+def merge_norm_tables(tables_list):
+    """合并多个数据库（分片）的常模：同一维度、同一群体的直方图相加"""
+    merged = {}
+    for tables in tables_list:
+        for key, table in tables.items():
+            counts = merged.get(key)
+            merged[key] = table.counts.copy() if counts is None else counts + table.counts
+    return {key: NormTable(counts) for key, counts in merged.items()}
+
+
+def percentile_ranks(tables, values_by_column, company=None):
+    """返回 (全体百分位, 本公司百分位) 两个 {维度: 百分位} 字典"""
+    overall = {}
+    within = {}
+    for col in NORM_COLUMNS:
+        if col not in values_by_column:
+            continue
+        value = values_by_column[col]
+        table = tables.get((col, ALL_COMPANIES))
+        overall[col] = table.percentile(value) if table else None
+        if company:
+            table = tables.get((col, company))
+            within[col] = table.percentile(value) if table else None
+    return overall, within
+
+
+def describe_percentiles(conn, employee, tables=None):
+    """报告用的常模百分位文本；员工尚未提交答卷时返回空字符串。
+    tables 默认为 conn 所在数据库的常模，按公司分片时传入合并后的常模"""
+    if tables is None:
+        tables = get_norm_tables(conn)
+    row = conn.execute('SELECT 1 FROM norm_members WHERE 公司名称 = ? AND 员工工号 = ?',
+                       (employee.get('公司名称') or '', employee['工号'])).fetchone()
+    if row is None:
+        return ''
+    company = employee.get('公司名称')
+    overall, within = percentile_ranks(tables, employee, company)
+    lines = ['', '常模百分位（超过全体测评者 / 本公司测评者的百分比）：']
+    for col in NORM_COLUMNS:
+        if col not in overall:
+            continue
+        own = within.get(col)
+        lines.append(f"- {col}：{_format_rank(overall[col])} / {_format_rank(own)}")
+    return '\n'.join(lines) + '\n'
+
+
+def _format_rank(rank):
+    return '-' if rank is None else f'{rank}%'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='常模维护')
+    parser.add_argument('command', choices=['rebuild'], help='rebuild：按现有得分重建常模')
+    parser.add_argument('--db', default=DB_NAME, help='数据库文件路径')
+    args = parser.parse_args()
+
+    from migrations import migrate
+
+    conn = sqlite3.connect(args.db)
+    try:
+        migrate(conn)
+        count = rebuild_norms(conn)
+        conn.commit()
+        print(f'✓ 常模重建完成，共 {count} 人')
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
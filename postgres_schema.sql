@@ -0,0 +1,142 @@
+-- PostgreSQL 表结构（幂等，需要 PostgreSQL 14 及以上）
+-- 与各模块中 SQLite 的建表语句一一对应，由 migrations.py 的第 1 个迁移执行，此后的结构变更追加为新的迁移；
+-- 版本号、默认评分配置等初始数据由各模块的 ensure_* 函数写入，两种数据库共用
+
+-- 题库
+CREATE TABLE IF NOT EXISTS questions (
+    id INTEGER PRIMARY KEY,
+    题目 TEXT NOT NULL,
+    选项 TEXT NOT NULL,
+    题目类型 TEXT NOT NULL,
+    正确答案 TEXT,
+    选项结构 TEXT
+);
+
+-- 员工，(公司名称, 工号) 唯一
+-- SQLite 的 INTEGER 列实际按 REAL 保存小数得分，这里统一用 DOUBLE PRECISION 保持一致
+CREATE TABLE IF NOT EXISTS employees (
+    id BIGSERIAL PRIMARY KEY,
+    姓名 TEXT NOT NULL,
+    工号 TEXT NOT NULL,
+    公司名称 TEXT NOT NULL DEFAULT '',
+    管理能力 DOUBLE PRECISION DEFAULT 0,
+    战略思维 DOUBLE PRECISION DEFAULT 0,
+    团队领导 DOUBLE PRECISION DEFAULT 0,
+    执行管控 DOUBLE PRECISION DEFAULT 0,
+    跨部门协作 DOUBLE PRECISION DEFAULT 0,
+    性格特质分数 DOUBLE PRECISION DEFAULT 0,
+    外向性 DOUBLE PRECISION DEFAULT 0,
+    宜人性 DOUBLE PRECISION DEFAULT 0,
+    开放性 DOUBLE PRECISION DEFAULT 0,
+    责任心 DOUBLE PRECISION DEFAULT 0,
+    性格特质类型 TEXT,
+    行为模式类型 TEXT,
+    行为模式分数 DOUBLE PRECISION DEFAULT 0,
+    通用能力 DOUBLE PRECISION DEFAULT 0,
+    言语理解 DOUBLE PRECISION DEFAULT 0,
+    数量分析 DOUBLE PRECISION DEFAULT 0,
+    逻辑推理 DOUBLE PRECISION DEFAULT 0,
+    空间认知 DOUBLE PRECISION DEFAULT 0,
+    创建时间 TIMESTAMP DEFAULT (now() AT TIME ZONE 'utc'),
+    CONSTRAINT uq_employees_company_gonghao UNIQUE (公司名称, 工号)
+);
+
+-- 管理员
+CREATE TABLE IF NOT EXISTS admins (
+    id BIGSERIAL PRIMARY KEY,
+    username TEXT UNIQUE NOT NULL,
+    password TEXT NOT NULL
+);
+
+-- 题库版本（question_bank.py），版本号为毫秒时间戳起步
+CREATE TABLE IF NOT EXISTS question_bank_version (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    version BIGINT NOT NULL,
+    更新时间 TIMESTAMP DEFAULT (now() AT TIME ZONE 'utc')
+);
+
+CREATE OR REPLACE FUNCTION bump_question_bank_version() RETURNS trigger AS $$
+BEGIN
+    UPDATE question_bank_version
+    SET version = version + 1, 更新时间 = now() AT TIME ZONE 'utc'
+    WHERE id = 1;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE TRIGGER trg_questions_version
+    AFTER INSERT OR UPDATE OR DELETE ON questions
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_question_bank_version();
+
+-- 选项、题型或答案被修改后清空结构化结果，下次载入时重新解析（question_options.py）
+CREATE OR REPLACE FUNCTION reset_question_options() RETURNS trigger AS $$
+BEGIN
+    NEW.选项结构 := NULL;
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE TRIGGER trg_questions_options_reset
+    BEFORE UPDATE OF 选项, 题目类型, 正确答案 ON questions
+    FOR EACH ROW EXECUTE FUNCTION reset_question_options();
+
+-- 原始答卷及题序布局（answer_store.py）
+CREATE TABLE IF NOT EXISTS answer_sheets (
+    id BIGSERIAL PRIMARY KEY,
+    公司名称 TEXT NOT NULL DEFAULT '',
+    员工工号 TEXT NOT NULL,
+    题库版本 BIGINT NOT NULL,
+    评分版本 INTEGER,
+    答案 BYTEA NOT NULL,
+    创建时间 TIMESTAMP DEFAULT (now() AT TIME ZONE 'utc')
+);
+
+CREATE INDEX IF NOT EXISTS idx_answer_sheets_employee ON answer_sheets(公司名称, 员工工号);
+
+CREATE TABLE IF NOT EXISTS answer_sheet_layouts (
+    题库版本 BIGINT PRIMARY KEY,
+    题号 TEXT NOT NULL,
+    评分题 TEXT NOT NULL
+);
+
+-- 版本化评分配置（scoring_config.py）
+CREATE TABLE IF NOT EXISTS scoring_configs (
+    版本 INTEGER PRIMARY KEY,
+    配置 TEXT NOT NULL,
+    说明 TEXT,
+    创建时间 TIMESTAMP DEFAULT (now() AT TIME ZONE 'utc')
+);
+
+-- 逐题答题进度（answer_capture.py）
+CREATE TABLE IF NOT EXISTS answer_sessions (
+    公司名称 TEXT NOT NULL,
+    员工工号 TEXT NOT NULL,
+    题库版本 BIGINT NOT NULL,
+    评分版本 INTEGER NOT NULL,
+    答案 BYTEA NOT NULL,
+    维度分数 TEXT NOT NULL,
+    维度题数 TEXT NOT NULL,
+    更新时间 TIMESTAMP DEFAULT (now() AT TIME ZONE 'utc'),
+    PRIMARY KEY (公司名称, 员工工号)
+);
+
+-- 常模直方图（norms.py）
+CREATE TABLE IF NOT EXISTS norm_histograms (
+    维度 TEXT NOT NULL,
+    公司名称 TEXT NOT NULL,
+    分箱 INTEGER NOT NULL,
+    人数 INTEGER NOT NULL,
+    PRIMARY KEY (维度, 公司名称, 分箱)
+);
+
+CREATE TABLE IF NOT EXISTS norm_members (
+    公司名称 TEXT NOT NULL,
+    员工工号 TEXT NOT NULL,
+    分箱 TEXT NOT NULL,
+    PRIMARY KEY (公司名称, 员工工号)
+);
+
+CREATE TABLE IF NOT EXISTS norm_state (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    version BIGINT NOT NULL
+);
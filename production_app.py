@@ -21,6 +21,10 @@ import multiprocessing
 from pathlib import Path
 from logging.handlers import RotatingFileHandler
 
+from database import connect
+from migrations import migrate
+from question_options import ensure_structured_options, option_texts, read_structured_questions
+
 # 创建Flask应用
 app = Flask(__name__)
 CORS(app)
@@ -108,7 +112,8 @@ logger = setup_logging()
 def get_db_connection():
     """获取数据库连接"""
     try:
-        conn = sqlite3.connect(app.config['DATABASE_PATH'])
+        # WAL、synchronous=NORMAL 等连接设置与 new_app 一致
+        conn = connect(app.config['DATABASE_PATH'])
         conn.row_factory = sqlite3.Row
         return conn
     except Exception as e:
@@ -127,65 +132,24 @@ def init_db():
     c = conn.cursor()
     
     try:
-        # 创建问题表
-        c.execute('''CREATE TABLE IF NOT EXISTS questions (
-            id INTEGER PRIMARY KEY,
-            题目 TEXT NOT NULL,
-            选项 TEXT NOT NULL,
-            题目类型 TEXT NOT NULL,
-            正确答案 TEXT
-        )''')
-        
-        # 创建人员表
-        c.execute('''CREATE TABLE IF NOT EXISTS employees (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            姓名 TEXT NOT NULL,
-            工号 TEXT NOT NULL,
-            公司名称 TEXT,
-            管理能力 REAL DEFAULT 0,
-            战略思维 REAL DEFAULT 0,
-            团队领导 REAL DEFAULT 0,
-            执行管控 REAL DEFAULT 0,
-            跨部门协作 REAL DEFAULT 0,
-            性格特质分数 REAL DEFAULT 0,
-            外向性 REAL DEFAULT 0,
-            宜人性 REAL DEFAULT 0,
-            开放性 REAL DEFAULT 0,
-            责任心 REAL DEFAULT 0,
-            性格特质类型 TEXT,
-            行为模式类型 TEXT,
-            行为模式分数 REAL DEFAULT 0,
-            通用能力 INTEGER DEFAULT 0,
-            言语理解 INTEGER DEFAULT 0,
-            数量分析 INTEGER DEFAULT 0,
-            逻辑推理 INTEGER DEFAULT 0,
-            空间认知 INTEGER DEFAULT 0,
-            创建时间 TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )''')
-
-        # 管理员表
-        c.execute('''CREATE TABLE IF NOT EXISTS admins (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            username TEXT UNIQUE NOT NULL,
-            password TEXT NOT NULL
-        )''')
+        # 表结构与索引由迁移统一维护，多个工作进程同时启动时只有一个执行
+        migrate(conn)
         
         # 初始化默认管理员
         c.execute('SELECT COUNT(*) FROM admins')
         count = c.fetchone()[0]
         if count == 0:
-            c.execute('INSERT INTO admins (username, password) VALUES (?, ?)', (
+            # 多个工作进程可能同时走到这里，用户名冲突时跳过
+            c.execute('INSERT INTO admins (username, password) VALUES (?, ?) ON CONFLICT (username) DO NOTHING', (
                 app.config['ADMIN_USERNAME'], 
                 app.config['ADMIN_PASSWORD']
             ))
             logger.info("已创建默认管理员账户")
         
-        # 添加数据库索引优化查询性能
-        c.execute('CREATE INDEX IF NOT EXISTS idx_employees_gonghao ON employees(工号)')
-        c.execute('CREATE INDEX IF NOT EXISTS idx_employees_create_time ON employees(创建时间)')
-        c.execute('CREATE INDEX IF NOT EXISTS idx_questions_type ON questions(题目类型)')
-        
         conn.commit()
+        
+        # 解析题目选项，格式错误的题目在启动时即报错
+        ensure_structured_options(conn)
         logger.info("数据库初始化完成")
         
     except Exception as e:
@@ -239,18 +203,10 @@ def login():
         conn = get_db_connection()
         c = conn.cursor()
         
-        # 检查是否已存在该员工
-        c.execute('SELECT id FROM employees WHERE 工号 = ?', (员工工号,))
-        existing = c.fetchone()
-        
-        if existing:
-            # 更新现有记录
-            c.execute('''UPDATE employees SET 姓名 = ?, 公司名称 = ? WHERE 工号 = ?''', 
-                     (员工名称, 公司名称, 员工工号))
-        else:
-            # 创建新记录
-            c.execute('''INSERT INTO employees (姓名, 工号, 公司名称) VALUES (?, ?, ?)''', 
-                     (员工名称, 员工工号, 公司名称))
+        # 员工以 (公司名称, 工号) 唯一确定：不存在时新建，已存在时更新姓名（与 repository.upsert_employee 一致）
+        c.execute('''INSERT INTO employees (姓名, 工号, 公司名称) VALUES (?, ?, ?)
+            ON CONFLICT (公司名称, 工号) DO UPDATE SET 姓名 = excluded.姓名''',
+                  (员工名称, 员工工号, 公司名称))
         
         conn.commit()
         conn.close()
@@ -266,43 +222,15 @@ def get_questions():
     """获取所有题目"""
     try:
         conn = get_db_connection()
-        c = conn.cursor()
-        c.execute('SELECT id, 题目, 选项, 题目类型, 正确答案 FROM questions ORDER BY id')
-        
+        # 选项已在启动时结构化，这里只读取，不写库
         all_data = []
-        for row in c.fetchall():
-            question_type = row[3]
-            options_text = row[2]
-            
-            # 根据题目类型处理选项格式
-            if question_type in ['情境题', '双向选择题']:
-                if ';' in options_text:
-                    options = options_text.split(';')
-                else:
-                    options = [options_text]
-            elif question_type == '反向题':
-                if '，' in options_text:
-                    options = options_text.split('，')
-                elif ',' in options_text:
-                    options = options_text.split(',')
-                else:
-                    options = [options_text]
-            else:
-                if ';' in options_text:
-                    options = options_text.split(';')
-                elif '，' in options_text:
-                    options = options_text.split('，')
-                elif ',' in options_text:
-                    options = options_text.split(',')
-                else:
-                    options = [options_text]
-            
+        for q_id, content, question_type, correct, options in read_structured_questions(conn):
             all_data.append({
-                "id": row[0],
-                "content": row[1],
-                "options": options,
-                "question_type": row[3],
-                "correct_answer": row[4]
+                "id": q_id,
+                "content": content,
+                "options": option_texts(question_type, options),
+                "question_type": question_type,
+                "correct_answer": correct
             })
         
         conn.close()
@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+题库版本管理
+通过触发器在 questions 表发生任何增删改时自动递增版本号，
+供评分计划、题目缓存等按题库版本失效（PostgreSQL 的表和触发器见 postgres_schema.sql）
+"""
+
+import time
+
+from database import is_postgres
+
+
+def ensure_version_tracking(conn):
+    """创建题库版本表及触发器（幂等）"""
+    c = conn.cursor()
+    if not is_postgres(conn):
+        c.execute('''CREATE TABLE IF NOT EXISTS question_bank_version (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL,
+            更新时间 TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )''')
+        for event in ('INSERT', 'UPDATE', 'DELETE'):
+            c.execute(f'''CREATE TRIGGER IF NOT EXISTS trg_questions_version_{event.lower()}
+                AFTER {event} ON questions
+                BEGIN
+                    UPDATE question_bank_version
+                    SET version = version + 1, 更新时间 = CURRENT_TIMESTAMP
+                    WHERE id = 1;
+                END''')
+    # 初始版本取当前毫秒时间戳，避免重建数据库后版本号与旧进程缓存撞车
+    c.execute('INSERT INTO question_bank_version (id, version) VALUES (1, ?) ON CONFLICT DO NOTHING',
+              (int(time.time() * 1000),))
+    conn.commit()
+
+
+def get_bank_version(conn):
+    """读取当前题库版本号（版本表由 migrations.py 创建）"""
+    return conn.execute('SELECT version FROM question_bank_version WHERE id = 1').fetchone()[0]
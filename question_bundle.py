@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+题库静态文件
+把当前题库导出为带内容哈希的静态文件 static/questions/questions.<hash>.json（紧凑列格式，
+不含正确答案），同时写出 .gz/.br 预压缩版本。文件名随内容变化，nginx 可以直接以长期缓存
+提供，不经过 Python 进程；主页把当前文件地址内联到 index.html 中。
+题库版本变化后首次访问主页时自动重新导出，旧文件保留最近几份供仍在答题的页面使用
+
+用法：python question_bundle.py export [--db new_questions.db] [--out static/questions]
+"""
+
+import argparse
+import logging
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+
+from migrations import migrate
+from question_payload import get_question_payload
+
+logger = logging.getLogger(__name__)
+
+DB_NAME = 'new_questions.db'
+BUNDLE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static', 'questions')
+BUNDLE_URL_PREFIX = '/static/questions/'
+# 文件名中内容哈希的长度
+HASH_LENGTH = 16
+# 保留的历史版本数（含当前版本）
+KEEP_BUNDLES = 5
+
+# 内容编码 -> 文件后缀，与 nginx gzip_static / brotli_static 的约定一致
+_SUFFIXES = {None: '', 'gzip': '.gz', 'br': '.br'}
+
+_bundle_lock = threading.Lock()
+# 输出目录 -> QuestionBundle
+_bundles = {}
+
+
+class QuestionBundle:
+    """某个题库版本导出的静态文件"""
+
+    __slots__ = ('version', 'hash', 'filename', 'url')
+
+    def __init__(self, version, digest):
+        self.version = version
+        self.hash = digest
+        self.filename = f'questions.{digest}.json'
+        self.url = BUNDLE_URL_PREFIX + self.filename
+
+
+def _write_atomic(path, data):
+    """先写临时文件再改名，多个进程同时导出时不会读到半个文件"""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+def _prune(out_dir, current):
+    """删除较早的导出文件，保留最近 KEEP_BUNDLES 份"""
+    bundles = {}
+    for name in os.listdir(out_dir):
+        if name.startswith('questions.') and name.endswith('.json'):
+            bundles[name] = os.path.getmtime(os.path.join(out_dir, name))
+    stale = sorted((name for name in bundles if name != current), key=bundles.get, reverse=True)
+    for name in stale[KEEP_BUNDLES - 1:]:
+        for suffix in _SUFFIXES.values():
+            try:
+                os.unlink(os.path.join(out_dir, name + suffix))
+            except FileNotFoundError:
+                pass
+
+
+def export_question_bundle(conn, out_dir=BUNDLE_DIR):
+    """导出当前题库，文件已存在时不重写；返回 QuestionBundle"""
+    payload = get_question_payload(conn, compact=True)
+    bundle = QuestionBundle(payload.version, payload.etag[:HASH_LENGTH])
+    os.makedirs(out_dir, exist_ok=True)
+    path = os.path.join(out_dir, bundle.filename)
+    # 先写压缩版本，未压缩文件出现时各版本均已就绪
+    for encoding in ('br', 'gzip', None):
+        if encoding in payload.variants:
+            target = path + _SUFFIXES[encoding]
+            if not os.path.exists(target):
+                _write_atomic(target, payload.variants[encoding][0])
+    _prune(out_dir, bundle.filename)
+    return bundle
+
+
+def get_question_bundle(conn, out_dir=BUNDLE_DIR):
+    """返回当前题库版本的静态文件，题库变化时重新导出；目录不可写时返回 None"""
+    bundle = _bundles.get(out_dir)
+    payload = get_question_payload(conn, compact=True)
+    if bundle is not None and bundle.version == payload.version:
+        return bundle
+    with _bundle_lock:
+        bundle = _bundles.get(out_dir)
+        if bundle is None or bundle.version != payload.version:
+            try:
+                bundle = _bundles[out_dir] = export_question_bundle(conn, out_dir)
+            except OSError as e:
+                logger.warning(f"导出题库静态文件失败: {e}")
+                return None
+        return bundle
+
+
+def main():
+    parser = argparse.ArgumentParser(description='导出题库静态文件')
+    parser.add_argument('command', choices=['export'], help='export：导出当前题库')
+    parser.add_argument('--db', default=DB_NAME, help='数据库文件路径')
+    parser.add_argument('--out', default=BUNDLE_DIR, help='输出目录')
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db)
+    try:
+        migrate(conn)
+        bundle = export_question_bundle(conn, args.out)
+    except (OSError, ValueError) as e:
+        print(f'✗ {e}')
+        sys.exit(1)
+    finally:
+        conn.close()
+    print(f'✓ 已导出 {os.path.join(args.out, bundle.filename)}（题库版本 {bundle.version}）')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+题目选项结构化
+选项在题目导入题库时（以及迁移、应用启动和 migrate 命令中）解析一次，保存到 questions.选项结构
+（JSON：[{key, label, score}, ...]），格式错误的题目在导入时即被拒绝；接口只读取结构化结果，不写库
+
+score 为选项本身的分值：评分题/反向题为 1-5 的原始分（反向计分由评分计划处理），
+单选题正确为1、错误为0；情境题和双向选择题的分值由版本化评分配置决定，这里为 null
+
+用法：python question_options.py migrate [--db new_questions.db]   # 为已有数据库补全选项结构
+"""
+
+import argparse
+import json
+import logging
+import re
+import sqlite3
+import sys
+
+from database import is_postgres
+
+logger = logging.getLogger(__name__)
+
+DB_NAME = 'new_questions.db'
+
+# 各题目类型的选项分隔符与单个选项格式
+KEYED_OPTION = re.compile(r'^\s*([A-Z])\s*=\s*(.+?)\s*$')
+RATING_OPTION = re.compile(r'^\s*([1-5])\s*=\s*(.+?)\s*$')
+LETTER_OPTION = re.compile(r'^\s*([A-Z])\)\s*(.+?)\s*$')
+RATING_SEPARATOR = re.compile(r'[，,]')
+
+
+def _parse_pieces(pieces, pattern, first_key):
+    options = []
+    for i, piece in enumerate(pieces):
+        match = pattern.match(piece)
+        if not match:
+            raise ValueError(f'第{i + 1}个选项格式错误: {piece!r}')
+        key, label = match.groups()
+        expected = chr(ord(first_key) + i)
+        if key != expected:
+            raise ValueError(f'第{i + 1}个选项应为 {expected}，实际为 {key}')
+        options.append((key, label))
+    if len(options) < 2:
+        raise ValueError('选项少于2个')
+    return options
+
+
+def parse_options(question_type, options_text, correct=None):
+    """把选项文本解析为 [{key, label, score}, ...]，格式错误时抛出 ValueError"""
+    if not options_text or not options_text.strip():
+        raise ValueError('选项为空')
+    if question_type in ('情境题', '双向选择题'):
+        # 格式：A=内容;B=内容;C=内容;D=内容
+        pairs = _parse_pieces(options_text.split(';'), KEYED_OPTION, 'A')
+        return [{'key': key, 'label': label, 'score': None} for key, label in pairs]
+    if question_type in ('反向题', '评分'):
+        # 格式：1=非常不符合，2=不太符合，3=一般，4=较符合，5=非常符合
+        pairs = _parse_pieces(RATING_SEPARATOR.split(options_text), RATING_OPTION, '1')
+        return [{'key': key, 'label': label, 'score': int(key)} for key, label in pairs]
+    if question_type == '单选':
+        # 格式：A) 内容;B) 内容;C) 内容;D) 内容
+        pairs = _parse_pieces(options_text.split(';'), LETTER_OPTION, 'A')
+        answer = (correct or 'A').strip().upper()
+        if answer not in {key for key, _ in pairs}:
+            raise ValueError(f'正确答案 {answer} 不在选项中')
+        return [{'key': key, 'label': label, 'score': 1 if key == answer else 0} for key, label in pairs]
+    raise ValueError(f'未知题目类型: {question_type}')
+
+
+def option_texts(question_type, options):
+    """结构化选项 -> 前端显示用的选项文本（与原始格式一致）"""
+    if question_type == '单选':
+        return [f"{opt['key']}) {opt['label']}" for opt in options]
+    return [f"{opt['key']}={opt['label']}" for opt in options]
+
+
+def dump_options(options):
+    return json.dumps(options, ensure_ascii=False, separators=(',', ':'))
+
+
+def structure_rows(rows):
+    """题目行 [(id, 题目, 选项, 题目类型, 正确答案), ...] -> 末尾加上选项结构 JSON 的新行；
+    有格式错误的题目时抛出 ValueError 并列出全部题号"""
+    structured = []
+    errors = []
+    for row in rows:
+        q_id, _, options_text, question_type, correct = row
+        try:
+            structured.append(tuple(row) + (dump_options(parse_options(question_type, options_text, correct)),))
+        except ValueError as e:
+            errors.append(f'题目 {q_id}: {e}')
+    if errors:
+        raise ValueError('选项格式错误：' + '；'.join(errors))
+    return structured
+
+
+def read_structured_questions(conn):
+    """只读地读取全部题目 [(id, 题目, 题目类型, 正确答案, 选项列表), ...]，按题号排序
+
+    直接修改题库后尚未重新解析（选项结构为空）的题目在内存中解析，不写库；其中格式错误的题目
+    记录日志后跳过，运行 python question_options.py migrate 可列出并修复
+    """
+    rows = conn.execute('SELECT id, 题目, 选项, 题目类型, 正确答案, 选项结构 FROM questions ORDER BY id').fetchall()
+    questions = []
+    for q_id, content, options_text, question_type, correct, structured in rows:
+        if structured is not None:
+            options = json.loads(structured)
+        else:
+            try:
+                options = parse_options(question_type, options_text, correct)
+            except ValueError as e:
+                logger.error(f"题目 {q_id} 选项格式错误，已跳过: {e}")
+                continue
+        questions.append((q_id, content, question_type, correct, options))
+    return questions
+
+
+def ensure_structured_options(conn):
+    """补全尚未解析的题目选项（幂等），有格式错误的题目时整体回滚并抛出 ValueError"""
+    c = conn.cursor()
+    # PostgreSQL 的选项结构列和触发器见 postgres_schema.sql
+    if not is_postgres(conn):
+        columns = [row[1] for row in c.execute('PRAGMA table_info(questions)')]
+        if '选项结构' not in columns:
+            c.execute('ALTER TABLE questions ADD COLUMN 选项结构 TEXT')
+        # 选项、题型或答案被修改后清空结构化结果，下次载入时重新解析
+        c.execute('''CREATE TRIGGER IF NOT EXISTS trg_questions_options_reset
+            AFTER UPDATE OF 选项, 题目类型, 正确答案 ON questions
+            BEGIN
+                UPDATE questions SET 选项结构 = NULL WHERE id = NEW.id;
+            END''')
+
+    rows = c.execute('SELECT id, 选项, 题目类型, 正确答案 FROM questions WHERE 选项结构 IS NULL').fetchall()
+    updates = []
+    errors = []
+    for q_id, options_text, question_type, correct in rows:
+        try:
+            updates.append((dump_options(parse_options(question_type, options_text, correct)), q_id))
+        except ValueError as e:
+            errors.append(f'题目 {q_id}: {e}')
+    if errors:
+        conn.rollback()
+        raise ValueError('选项格式错误：' + '；'.join(errors))
+    c.executemany('UPDATE questions SET 选项结构 = ? WHERE id = ?', updates)
+    conn.commit()
+    return len(updates)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='题目选项结构化')
+    parser.add_argument('command', choices=['migrate'], help='migrate：解析尚未结构化的题目选项')
+    parser.add_argument('--db', default=DB_NAME, help='数据库文件路径')
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db)
+    try:
+        count = ensure_structured_options(conn)
+    except ValueError as e:
+        print(f'✗ {e}')
+        sys.exit(1)
+    finally:
+        conn.close()
+    print(f'✓ 已解析 {count} 道题目的选项')
+
+
+if __name__ == '__main__':
+    main()
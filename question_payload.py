@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+题目接口响应缓存
+/api/questions 的响应体按题库版本只序列化一次并保存为字节串，同时预先生成 gzip 和 brotli
+压缩版本；配合强 ETag 与 Last-Modified，客户端已有最新题目时直接返回 304。
+分段模式按测评类别逐段返回题目，前端先显示第一段，其余段在答题时后台预取。
+每种响应都另有不含正确答案的紧凑列格式（见 wire_format.py）
+"""
+
+import gzip
+import hashlib
+import json
+import threading
+from datetime import datetime, timezone
+
+try:
+    import brotli
+except ImportError:  # 未安装 brotli 时只提供 gzip
+    brotli = None
+
+from answer_store import read_sheet_layout
+from question_bank import get_bank_version
+from question_options import option_texts, read_structured_questions
+from scoring_config import get_scoring_config
+from wire_format import compact_body
+
+# 未归入任何测评类别的题目所在分段
+OTHER_SECTION = '其他'
+
+_cache_lock = threading.Lock()
+# 是否紧凑格式 -> QuestionPayload
+_payloads = {}
+_sections = None
+
+
+class QuestionPayload:
+    """某个题库版本的 /api/questions 响应：原始及压缩后的字节串"""
+
+    __slots__ = ('version', 'etag', 'last_modified', 'variants')
+
+    def __init__(self, version, body, last_modified):
+        self.version = version
+        self.last_modified = last_modified
+        digest = hashlib.sha256(body).hexdigest()[:32]
+        self.etag = digest
+        # 内容编码 -> (响应体, ETag)；强 ETag 要求不同编码的表示使用不同的值
+        self.variants = {None: (body, digest)}
+        self.variants['gzip'] = (gzip.compress(body, compresslevel=9, mtime=0), f'{digest}-gz')
+        if brotli is not None:
+            self.variants['br'] = (brotli.compress(body, quality=11), f'{digest}-br')
+
+    def matches(self, if_none_match):
+        """客户端缓存的任一编码版本与当前版本一致"""
+        return any(if_none_match.contains_weak(tag) for _, tag in self.variants.values())
+
+    def select(self, accept_encodings):
+        """按 Accept-Encoding 选择编码，返回 (内容编码, 响应体, ETag)"""
+        for encoding in ('br', 'gzip'):
+            if encoding in self.variants and accept_encodings[encoding]:
+                return (encoding,) + self.variants[encoding]
+        return (None,) + self.variants[None]
+
+
+class QuestionSections:
+    """按测评类别分段的题目响应，分段由题库版本和评分配置版本共同决定"""
+
+    __slots__ = ('key', 'prefix', 'names', 'payloads', 'compact_payloads')
+
+    def __init__(self, key, blocks, last_modified, positions, slots, type_names):
+        self.key = key
+        # 游标形如 "题库版本.评分版本.分段序号"
+        self.prefix = f'{key[0]}.{key[1]}'
+        self.names = list(blocks)
+        summary = [{"name": name, "count": len(block)} for name, block in blocks.items()]
+        total = sum(len(block) for block in blocks.values())
+        self.payloads = []
+        self.compact_payloads = []
+        for index, (name, block) in enumerate(blocks.items()):
+            meta = {
+                "version": self.prefix,
+                "section": name,
+                "index": index,
+                "sections": summary,
+                "total": total,
+                "next_cursor": self.cursor(index + 1) if index + 1 < len(blocks) else None
+            }
+            self.payloads.append(QuestionPayload(key, _dumps(dict(meta, questions=block)), last_modified))
+            compact = compact_body(key[0], block, positions, type_names, slots=slots, **meta)
+            self.compact_payloads.append(QuestionPayload(key, _dumps(compact), last_modified))
+
+    def cursor(self, index):
+        return f'{self.prefix}.{index}'
+
+    def locate(self, section=None, cursor=None):
+        """按类别名或游标定位分段，返回分段序号；类别不存在时返回 None
+
+        游标来自其他题库或评分配置版本时抛出 ValueError，客户端应从头重新加载
+        """
+        if section:
+            return self.names.index(section) if section in self.names else None
+        if not cursor:
+            return 0
+        prefix, _, index = cursor.rpartition('.')
+        if prefix != self.prefix or not index.isdigit() or int(index) >= len(self.names):
+            raise ValueError('题库已更新，请重新加载')
+        return int(index)
+
+
+def _dumps(data):
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def _load_questions(conn):
+    """读取全部题目及题库更新时间（只读）"""
+    all_data = [{
+        "id": q_id,
+        "content": content,
+        "options": option_texts(question_type, options),
+        "question_type": question_type,
+        "correct_answer": correct
+    } for q_id, content, question_type, correct, options in read_structured_questions(conn)]
+
+    row = conn.execute('SELECT 更新时间 FROM question_bank_version WHERE id = 1').fetchone()
+    try:
+        # CURRENT_TIMESTAMP 为 UTC 时间；SQLite 读出为字符串，PostgreSQL 读出为 datetime
+        updated = row[0] if isinstance(row[0], datetime) else datetime.strptime(row[0], '%Y-%m-%d %H:%M:%S')
+        last_modified = updated.replace(tzinfo=timezone.utc, microsecond=0)
+    except (TypeError, ValueError):
+        last_modified = datetime.now(timezone.utc).replace(microsecond=0)
+    return all_data, last_modified
+
+
+def _positions(conn, questions):
+    """题号 -> 在答卷布局中的位置、答卷位置数，以及按出现顺序排列的题型列表
+
+    位置取自提交时解码紧凑答案所用的同一答卷布局：读取时被跳过的题目仍占据其位置，
+    之后各题的位置不会错开
+    """
+    layout = read_sheet_layout(conn)
+    type_names = list(dict.fromkeys(q["question_type"] for q in questions))
+    return layout.index, len(layout.ids), type_names
+
+
+def build_question_payload(conn, version, compact=False):
+    questions, last_modified = _load_questions(conn)
+    if compact:
+        positions, slots, type_names = _positions(conn, questions)
+        body = compact_body(version, questions, positions, type_names, slots=slots)
+    else:
+        body = questions
+    return QuestionPayload(version, _dumps(body), last_modified)
+
+
+def build_question_sections(conn, version, config):
+    """按题号顺序把连续属于同一评分类别的题目划为一段，保持与整卷加载相同的出题顺序
+
+    未归入任何类别的题目跟随前一段（位于开头时放入“其他”）；同一类别被其他类别隔开时，
+    后出现的段名加序号区分
+    """
+    questions, last_modified = _load_questions(conn)
+    categories = {}
+    for category, dims in config.dimension_maps.items():
+        for ids in dims.values():
+            for q_id in ids:
+                categories.setdefault(q_id, category)
+    blocks = {}
+    current = None
+    current_category = None
+    for question in questions:
+        category = categories.get(question["id"], current_category or OTHER_SECTION)
+        if category != current_category:
+            name = category
+            k = 1
+            while name in blocks:
+                k += 1
+                name = f'{category}{k}'
+            current = blocks[name] = []
+            current_category = category
+        current.append(question)
+    return QuestionSections((version, config.version), blocks, last_modified, *_positions(conn, questions))
+
+
+def get_question_payload(conn, compact=False):
+    """返回当前题库版本的响应缓存（compact 为真时为紧凑格式），题库变化时才重新生成"""
+    version = get_bank_version(conn)
+    payload = _payloads.get(compact)
+    if payload is not None and payload.version == version:
+        return payload
+    with _cache_lock:
+        payload = _payloads.get(compact)
+        if payload is None or payload.version != version:
+            payload = _payloads[compact] = build_question_payload(conn, version, compact)
+        return payload
+
+
+def get_question_sections(conn):
+    """返回当前题库与评分配置版本对应的分段响应缓存"""
+    global _sections
+    version = get_bank_version(conn)
+    config = get_scoring_config(conn)
+    sections = _sections
+    if sections is not None and sections.key == (version, config.version):
+        return sections
+    with _cache_lock:
+        if _sections is None or _sections.key != (version, config.version):
+            _sections = build_question_sections(conn, version, config)
+        return _sections
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+分析报告缓存
+同一员工的得分、报告模板、提示词和模型都没有变化时，再次生成报告直接返回上次的结果，不再调用
+DeepSeek。缓存按内容寻址：键为上述内容的 SHA-256，任一项变化都会得到新的键，旧结果不会再被读到，
+无需主动失效。表结构由 migrations.py 的第 14 个迁移创建
+"""
+
+import hashlib
+import json
+import time
+
+from scoring import EMPLOYEE_SCORE_COLUMNS
+
+# 缓存的报告保留的时间（秒），得分或模板变化后旧键不再命中，到期后删除
+CACHE_RETENTION = 30 * 24 * 3600
+
+
+def report_cache_key(employee, template, model, prompt_version):
+    """报告缓存键：员工身份（提示词中包含姓名、工号、公司名称）、各得分列、报告模板内容、
+    提示词版本和模型名称的 SHA-256"""
+    content = json.dumps({
+        '员工': [employee['公司名称'], employee['工号'], employee['姓名']],
+        '得分': [employee[col] for col in EMPLOYEE_SCORE_COLUMNS],
+        '模板': hashlib.sha256(template.encode('utf-8')).hexdigest(),
+        '提示词版本': prompt_version,
+        '模型': model,
+    }, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+def get_cached_report(conn, key):
+    """缓存的 (报告, 原文)，未命中时返回 None"""
+    row = conn.execute('SELECT 报告, 原文 FROM report_cache WHERE 缓存键 = ?', (key,)).fetchone()
+    return tuple(row) if row is not None else None
+
+
+def save_cached_report(conn, key, 报告, 原文, 模型):
+    """写入一份生成的报告，并删除过期的缓存（不提交事务）"""
+    now = time.time()
+    conn.execute('DELETE FROM report_cache WHERE 创建时间 < ?', (now - CACHE_RETENTION,))
+    conn.execute('''INSERT INTO report_cache (缓存键, 报告, 原文, 模型, 创建时间) VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT (缓存键) DO NOTHING''', (key, 报告, 原文, 模型, now))
+
+
+def clear_report_cache(conn):
+    """删除全部缓存的报告（不提交事务）"""
+    conn.execute('DELETE FROM report_cache')
@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+报告生成任务队列
+管理端生成分析报告要调用 DeepSeek（最长 180 秒），在请求线程中同步等待会长时间占住 gunicorn 的同步
+工作进程。请求改为只在 report_jobs 表中登记任务并立即返回任务编号；每个工作进程有一组后台线程领取
+任务、生成报告并把结果写回表中，管理页面轮询任务状态。生成过程中工作线程在收到完整的行时、每隔
+数秒把已去除 Markdown 的部分报告写入任务，管理页面通过事件流（SSE）边生成边显示。
+
+任务保存在主库中，进程重启后未完成的任务仍在：领取任务时写入租约到期时间，执行中的进程退出后
+租约到期，其他进程的工作线程重新领取；同一任务最多执行 MAX_ATTEMPTS 次。表结构由 migrations.py
+的第 13 个迁移创建
+"""
+
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+
+from database import lock_key
+
+logger = logging.getLogger(__name__)
+
+QUEUED, RUNNING, DONE, FAILED = 'queued', 'running', 'done', 'failed'
+# 每个工作进程的报告生成线程数
+REPORT_WORKERS = 2
+# 空闲时查询新任务的间隔（秒）；本进程登记的任务会立即唤醒工作线程
+POLL_INTERVAL = 2.0
+# 领取后的租约（秒），需长于 DeepSeek 调用的超时时间；到期仍未完成的任务可被重新领取
+JOB_LEASE = 300
+# 同一任务最多执行的次数，超过后标记为失败
+MAX_ATTEMPTS = 3
+# 已完成和失败的任务保留的时间（秒）
+JOB_RETENTION = 7 * 24 * 3600
+# 生成过程中写入部分报告的最短间隔（秒），每次写入同时延长租约；每次写入都要获取主库的写锁，
+# 间隔过短会与答卷提交争用
+PROGRESS_INTERVAL = 2.0
+# 事件流检查任务进度的间隔（秒），以及每个连接最长保持的时间（秒）：到时关闭，浏览器带上
+# Last-Event-ID 自动重连后从断开处继续。连接保持期间占用一个请求线程（start_production.py 以 gthread
+# 工作进程运行，每个进程 THREADS 个线程），整个生成过程中每个打开的事件流都持续占用一个线程；
+# 窗口须明显短于 gunicorn 的超时时间（默认 30 秒），以同步工作进程运行时也不会被当作卡死而重启
+STREAM_POLL = 0.5
+STREAM_WINDOW = 10
+
+JOB_COLUMNS = ('id', '公司名称', '员工工号', '状态', '尝试次数', '报告', '原文', '错误', '创建时间', '完成时间')
+
+
+def enqueue_job(conn, 公司名称, 员工工号):
+    """登记一个报告生成任务并返回任务编号；该员工已有排队或执行中的任务时直接返回其编号（不提交事务）"""
+    lock_key(conn, 'report_jobs', 公司名称, 员工工号)
+    row = conn.execute('''SELECT id FROM report_jobs WHERE 公司名称 = ? AND 员工工号 = ? AND 状态 IN (?, ?)
+        ORDER BY 创建时间 LIMIT 1''', (公司名称, 员工工号, QUEUED, RUNNING)).fetchone()
+    if row is not None:
+        return row[0]
+    now = time.time()
+    # 顺带清理过期的任务结果
+    conn.execute('DELETE FROM report_jobs WHERE 状态 IN (?, ?) AND 完成时间 < ?',
+                 (DONE, FAILED, now - JOB_RETENTION))
+    job_id = uuid.uuid4().hex
+    conn.execute('''INSERT INTO report_jobs (id, 公司名称, 员工工号, 状态, 创建时间)
+        VALUES (?, ?, ?, ?, ?)''', (job_id, 公司名称, 员工工号, QUEUED, now))
+    return job_id
+
+
+def get_job(conn, job_id):
+    """任务 {列名: 值}，不存在时返回 None"""
+    row = conn.execute(f'SELECT {", ".join(JOB_COLUMNS)} FROM report_jobs WHERE id = ?', (job_id,)).fetchone()
+    return dict(zip(JOB_COLUMNS, row)) if row is not None else None
+
+
+def has_claimable_job(conn):
+    """是否有可领取的任务；空闲的工作线程先用这一只读查询检查，不必每次轮询都获取写锁"""
+    return conn.execute('''SELECT 1 FROM report_jobs WHERE 状态 = ? OR (状态 = ? AND 租约到期 < ?) LIMIT 1''',
+                        (QUEUED, RUNNING, time.time())).fetchone() is not None
+
+
+def claim_job(conn, worker):
+    """领取最早的一个排队任务（或租约已到期的执行中任务），返回 (任务编号, 公司名称, 员工工号)，
+    没有任务时返回 None（不提交事务）"""
+    now = time.time()
+    # 已执行 MAX_ATTEMPTS 次仍中断的任务不再重试
+    conn.execute('''UPDATE report_jobs SET 状态 = ?, 错误 = ?, 完成时间 = ?
+        WHERE 状态 = ? AND 租约到期 < ? AND 尝试次数 >= ?''',
+                 (FAILED, '任务多次执行中断', now, RUNNING, now, MAX_ATTEMPTS))
+    row = conn.execute('''SELECT id, 公司名称, 员工工号, 状态 FROM report_jobs
+        WHERE 状态 = ? OR (状态 = ? AND 租约到期 < ?) ORDER BY 创建时间 LIMIT 1''',
+                       (QUEUED, RUNNING, now)).fetchone()
+    if row is None:
+        return None
+    job_id, company, emp_no, state = row
+    # 带上原状态和租约作条件：PostgreSQL 下多个进程同时领取同一任务时只有一个更新成功
+    claimed = conn.execute('''UPDATE report_jobs SET 状态 = ?, 领取者 = ?, 租约到期 = ?, 尝试次数 = 尝试次数 + 1,
+        报告 = NULL WHERE id = ? AND 状态 = ? AND (租约到期 IS NULL OR 租约到期 < ?)''',
+                           (RUNNING, worker, now + JOB_LEASE, job_id, state, now)).rowcount
+    if not claimed:
+        return None
+    if state == RUNNING:
+        logger.warning(f"报告任务 {job_id} 的租约已到期，重新执行")
+    return job_id, company, emp_no
+
+
+def update_job_progress(conn, job_id, worker, 报告):
+    """写入生成中的部分报告并延长租约；任务已被其他工作线程重新领取时不写入（不提交事务）"""
+    conn.execute('''UPDATE report_jobs SET 报告 = ?, 租约到期 = ? WHERE id = ? AND 状态 = ? AND 领取者 = ?''',
+                 (报告, time.time() + JOB_LEASE, job_id, RUNNING, worker))
+
+
+def finish_job(conn, job_id, worker, 报告=None, 原文=None, 错误=None):
+    """写回任务结果，错误 非空时标记为失败；任务已被其他工作线程重新领取时不写入（不提交事务）"""
+    conn.execute('''UPDATE report_jobs SET 状态 = ?, 报告 = ?, 原文 = ?, 错误 = ?, 完成时间 = ?
+        WHERE id = ? AND 状态 = ? AND 领取者 = ?''',
+                 (FAILED if 错误 else DONE, 报告, 原文, 错误, time.time(), job_id, RUNNING, worker))
+
+
+def clear_jobs(conn):
+    """删除全部报告任务（不提交事务）"""
+    conn.execute('DELETE FROM report_jobs')
+
+
+def _event(name, data, event_id=None):
+    lines = [f'id: {event_id}'] if event_id is not None else []
+    lines += [f'event: {name}', f'data: {json.dumps(data, ensure_ascii=False)}']
+    return '\n'.join(lines) + '\n\n'
+
+
+def iter_job_events(db, job_id, last_event_id=None, window=STREAM_WINDOW):
+    """任务进度的 SSE 事件流：delta 为新增的部分报告，reset 为整体替换（任务重新执行或已显示的部分被改写），
+    done/failed 带最终结果后结束；连接保持 window 秒后结束，浏览器自动重连
+
+    事件编号为 "尝试次数:已发送字数"，重连时由 Last-Event-ID 带回，从断开处继续发送
+    """
+    # 浏览器已收到的部分：尝试次数、字数，以及内容（重连时未知）
+    attempts, offset, sent = None, 0, None
+    try:
+        attempts, offset = (int(part) for part in (last_event_id or '').split(':'))
+    except ValueError:
+        pass
+    deadline = time.monotonic() + window
+    # 浏览器断开后 0.5 秒重连
+    yield 'retry: 500\n\n'
+    try:
+        while True:
+            job = get_job(db.connection(), job_id)
+            if job is None:
+                yield _event(FAILED, {'error': '任务不存在'})
+                return
+            if job['状态'] == DONE:
+                yield _event(DONE, {'content': job['报告'], 'raw': job['原文']})
+                return
+            if job['状态'] == FAILED:
+                yield _event(FAILED, {'error': job['错误']})
+                return
+            text = job['报告'] or ''
+            event_id = f"{job['尝试次数']}:{len(text)}"
+            if job['尝试次数'] == attempts and len(text) >= offset and (sent is None or text.startswith(sent)):
+                if len(text) > offset:
+                    yield _event('delta', {'text': text[offset:]}, event_id)
+            else:
+                yield _event('reset', {'text': text}, event_id)
+            attempts, offset, sent = job['尝试次数'], len(text), text
+            if time.monotonic() >= deadline:
+                return
+            # 不在两次检查之间占用连接（PostgreSQL 归还连接池）
+            db.release()
+            time.sleep(STREAM_POLL)
+    finally:
+        db.release()
+
+
+class ReportWorkerPool:
+    """本进程的报告生成线程：循环领取任务，调用 handler(公司名称, 员工工号, progress) 得到 (报告, 原文) 后写回
+
+    handler 在生成过程中可以反复调用 progress(get_text)（通常在收到完整的行时），get_text 返回当前的
+    部分报告；距上次写入不足 PROGRESS_INTERVAL 秒时不调用 get_text，部分报告与上次写入的相同时也不写入
+    """
+
+    def __init__(self, db, handler, workers=REPORT_WORKERS, poll_interval=POLL_INTERVAL):
+        # db 为任务表所在的存储仓库（主库），每个工作线程使用各自的连接
+        self.db = db
+        self.handler = handler
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self._wake = threading.Event()
+        self._start_lock = threading.Lock()
+        self._threads = []
+        self._pid = None
+
+    def start(self):
+        """启动工作线程（每次请求前调用，已启动时只做一次判断）"""
+        # fork 出的子进程中没有父进程的工作线程，需要重新启动
+        if self._pid == os.getpid() or not self.workers:
+            return
+        with self._start_lock:
+            if self._pid != os.getpid():
+                self._threads = [threading.Thread(target=self._run, name=f'report-worker-{i}', daemon=True)
+                                 for i in range(self.workers)]
+                for thread in self._threads:
+                    thread.start()
+                self._pid = os.getpid()
+
+    def notify(self):
+        """本进程登记了新任务，唤醒空闲的工作线程"""
+        self._wake.set()
+
+    def _run(self):
+        worker = f'{socket.gethostname()}:{os.getpid()}:{threading.current_thread().name}'
+        while True:
+            job = None
+            try:
+                if has_claimable_job(self.db.connection()):
+                    with self.db.transaction(immediate=True) as conn:
+                        job = claim_job(conn, worker)
+            except Exception as e:
+                logger.error(f"领取报告任务失败: {e}")
+            if job is None:
+                self.db.release()
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+                continue
+            job_id, company, emp_no = job
+            start = time.perf_counter()
+            try:
+                content, raw = self.handler(company, emp_no, self._progress(job_id, worker))
+                result = {'报告': content, '原文': raw}
+                logger.info(f"报告任务 {job_id} 完成，耗时 {time.perf_counter() - start:.1f} 秒")
+            except Exception as e:
+                result = {'错误': str(e) or type(e).__name__}
+                logger.error(f"报告任务 {job_id} 失败: {e}")
+            try:
+                with self.db.transaction(immediate=True) as conn:
+                    finish_job(conn, job_id, worker, **result)
+            except Exception as e:
+                # 写回失败时任务保持执行中，租约到期后重新执行
+                logger.error(f"写回报告任务 {job_id} 失败: {e}")
+            finally:
+                self.db.release()
+
+    def _progress(self, job_id, worker):
+        """任务 job_id 的进度回调：按 PROGRESS_INTERVAL 节流写入部分报告"""
+        last, written = None, None
+
+        def progress(get_text):
+            nonlocal last, written
+            now = time.monotonic()
+            if last is not None and now - last < PROGRESS_INTERVAL:
+                return
+            last = now
+            text = get_text()
+            if text == written:
+                return
+            try:
+                with self.db.transaction(immediate=True) as conn:
+                    update_job_progress(conn, job_id, worker, text)
+                written = text
+            except Exception as e:
+                # 部分报告只用于显示，写入失败不影响生成
+                logger.error(f"写入报告任务 {job_id} 的进度失败: {e}")
+            finally:
+                self.db.release()
+
+        return progress
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+流式报告
+以 stream=true 调用 DeepSeek 时，生成的文字按 SSE（data: {...} 行）逐段返回。这里解析流式响应，
+并在接收过程中增量去除 Markdown 标记，得到随时可以显示的部分报告：报告任务把它写入 report_jobs，
+管理页面通过 /api/admin/report-jobs/<job_id>/events 边生成边显示（见 report_jobs.py）
+"""
+
+import json
+import re
+
+
+def _strip_inline(text):
+    """去除标题、加粗、列表和行内代码标记；除标题、列表行首的空白外都不跨行"""
+    text = re.sub(r"(?m)^\s{0,3}#{1,6}\s*", "", text)
+    text = re.sub(r"\*\*(.*?)\*\*", r"\1", text)
+    text = re.sub(r"\*(.*?)\*", r"\1", text)
+    text = re.sub(r"_(.*?)_", r"\1", text)
+    text = re.sub(r"(?m)^\s*[-•]\s*", "", text)
+    text = re.sub(r"`{1,3}(.*?)`{1,3}", r"\1", text)
+    return text
+
+
+def _strip_blocks(text):
+    """去除代码块和分隔线"""
+    text = re.sub(r"(?s)```.*?```", "", text)
+    text = re.sub(r"(?m)^---+$", "", text)
+    text = re.sub(r"\r", "", text)
+    return text
+
+
+def strip_markdown(md: str) -> str:
+    """去除报告中的 Markdown 标记（标题、加粗、列表、代码、分隔线），保留纯文本"""
+    if not isinstance(md, str):
+        return ''
+    text = _strip_blocks(_strip_inline(md))
+    text = re.sub(r"\n{3,}", "\n\n", text)
+    return text.strip()
+
+
+# 只有空白和标记符号的行：去除标记后可能成为空行，标题、列表规则中的 \s* 会越过行尾，与下一行一起处理
+_MARKER_ONLY = re.compile(r'[\s#\-•*_`]*')
+
+
+def _open_marker(line):
+    """行中第一个尚未闭合的成对标记（** * _ `）的位置，都已闭合时返回 None"""
+    opened = {}
+    i = 0
+    while i < len(line):
+        mark = '**' if line.startswith('**', i) else line[i]
+        if mark in ('**', '*', '_', '`'):
+            if mark in opened:
+                del opened[mark]
+            else:
+                opened[mark] = i
+        i += len(mark)
+    return min(opened.values()) if opened else None
+
+
+class MarkdownStripper:
+    """增量去除 Markdown：feed() 追加收到的原文，text 为当前可以显示的部分报告
+
+    已接收完整的行在可以安全断开处（不在代码块中，且末行不是只有标记的行）一次性去除标记并保留结果，
+    之后只处理新收到的部分，不再重复处理整篇原文。正在接收的一行中有尚未闭合的成对标记时只处理到
+    该标记之前，避免标记先显示出来、闭合后又消失。结果始终等于对已处理原文执行 strip_markdown，
+    因此与最终报告一致且通常是逐步追加的；个别跨行的规则（代码块）可能改写已显示的部分，接收方遇到
+    不是前缀的新结果时整体替换
+    """
+
+    def __init__(self):
+        # 已处理的原文、对应的纯文本（已合并空行），以及纯文本末尾暂不输出的空白
+        self._raw = []
+        self._done = []
+        self._tail = ''
+        # 尚未处理的原文
+        self._pending = ''
+
+    def feed(self, delta):
+        self._pending += delta
+
+    @property
+    def raw(self):
+        """已收到的全部原文"""
+        return ''.join(self._raw) + self._pending
+
+    def _normalize(self, text):
+        """接在已输出的纯文本之后的部分：合并多余空行，开头和末尾的空白留待后续文字决定"""
+        text = self._tail + text
+        if not self._done:
+            text = text.lstrip()
+        body = text.rstrip()
+        return re.sub(r"\n{3,}", "\n\n", body), text[len(body):]
+
+    def _commit(self):
+        """处理未处理原文中的完整行"""
+        end = self._pending.rfind('\n') + 1
+        if not end:
+            return
+        segment = self._pending[:end]
+        if _MARKER_ONLY.fullmatch(segment, segment.rfind('\n', 0, end - 1) + 1):
+            return
+        marked = _strip_inline(segment)
+        # 代码块尚未闭合
+        if marked.count('```') % 2:
+            return
+        body, self._tail = self._normalize(_strip_blocks(marked))
+        if body:
+            self._done.append(body)
+        self._raw.append(segment)
+        self._pending = self._pending[end:]
+
+    @property
+    def text(self):
+        self._commit()
+        pending = self._pending
+        start = pending.rfind('\n') + 1
+        pos = _open_marker(pending[start:])
+        if pos is not None:
+            pending = pending[:start + pos]
+        body, _ = self._normalize(_strip_blocks(_strip_inline(pending)))
+        return ''.join(self._done) + body
+
+
+def iter_chat_deltas(response):
+    """逐段产出流式 chat completions 响应（requests 以 stream=True 发出）中新生成的文字"""
+    response.encoding = 'utf-8'
+    for line in response.iter_lines(decode_unicode=True):
+        # 空行分隔事件，冒号开头的是保活注释
+        if not line or not line.startswith('data:'):
+            continue
+        data = line[len('data:'):].strip()
+        if data == '[DONE]':
+            break
+        choices = json.loads(data).get('choices') or []
+        if choices:
+            content = (choices[0].get('delta') or {}).get('content')
+            if content:
+                yield content
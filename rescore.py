@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+批量重新评分
+评分规则调整后，把已保存的答卷载入 NumPy 矩阵（人数 × 题数），
+用查表和掩码均值一次性重算所有维度与类别得分，并在单个事务内写回各次测评记录并重建常模
+
+用法：python rescore.py [--db new_questions.db] [--dry-run]
+"""
+
+import argparse
+import logging
+import sqlite3
+import time
+
+import numpy as np
+
+from answer_store import UNANSWERED, decode_answer, load_sheet_layouts
+from attempts import sync_filter_columns
+from migrations import migrate
+from norms import rebuild_norms
+from scoring import EMPLOYEE_SCORE_FIELDS, EMPLOYEE_SCORE_COLUMNS, get_scoring_plan
+
+logger = logging.getLogger(__name__)
+
+DB_NAME = 'new_questions.db'
+
+
+def _build_tables(plan, layout):
+    """为某个答卷布局生成 逐题逐字节得分表 与 题目-维度归属矩阵"""
+    n_items = len(layout.ids)
+    lut = np.zeros((n_items, 256), dtype=np.int64)
+    membership = np.zeros((n_items, len(plan.slots)), dtype=np.int64)
+    for pos, (q_id, is_rating) in enumerate(zip(layout.ids, layout.rating)):
+        entry = plan.lookup(q_id)
+        if entry is None:
+            continue
+        q_slots, scorer = entry
+        for slot in q_slots:
+            membership[pos, slot] += 1
+        for code in range(1, 256):
+            value = scorer(decode_answer(code, is_rating))
+            if not isinstance(value, int):
+                raise ValueError(f"题目 {q_id} 的分值不是整数，无法精确向量化: {value!r}")
+            lut[pos, code] = value
+    return lut, membership
+
+
+def _round_table(sums, counts, by_rate):
+    """逐元素计算与 ScoringPlan 完全一致的四舍五入均值
+
+    (分数和, 题数) 的组合很少，先去重再用 Python round 计算，保证结果逐位一致
+    """
+    empty = 1.0 if by_rate else 0.0
+    # 把 (分数和, 题数) 编码成单个整数后去重
+    base = int(counts.max(initial=0)) + 1
+    offset = int(sums.min(initial=0))
+    unique, inverse = np.unique((sums - offset) * base + counts, return_inverse=True)
+    values = np.empty(len(unique), dtype=np.float64)
+    for i, key in enumerate(unique.tolist()):
+        total, count = divmod(key, base)
+        total += offset
+        if not count:
+            values[i] = empty
+        elif by_rate:
+            values[i] = round(1 + total / count * 4, 2)
+        else:
+            values[i] = round(total / count, 2)
+    return values[inverse.reshape(sums.shape)]
+
+
+def _dominant_types(values, names):
+    """向量化的 get_max_type：取最高分维度，并列时最多取前两个"""
+    ties = values == values.max(axis=1, keepdims=True)
+    codes = ties.astype(np.int64) @ (1 << np.arange(len(names), dtype=np.int64))
+    labels = {}
+    for code in np.unique(codes).tolist():
+        keys = [name for bit, name in enumerate(names) if code >> bit & 1]
+        labels[code] = '/'.join(keys[:2]) if keys else '综合型'
+    return [labels[code] for code in codes.tolist()]
+
+
+def score_matrix(plan, layout, matrix):
+    """对同一布局的答卷矩阵评分，返回按 EMPLOYEE_SCORE_COLUMNS 顺序排列的列数组"""
+    lut, membership = _build_tables(plan, layout)
+    answered = (matrix != UNANSWERED).astype(np.int64)
+    item_scores = lut[np.arange(matrix.shape[1]), matrix]
+    sums = item_scores @ membership
+    counts = answered @ membership
+
+    category_scores = {}
+    for category, dim_slots, by_rate in plan.categories:
+        slots = list(dim_slots)
+        dims = {plan.slots[slot][1]: _round_table(sums[:, slot], counts[:, slot], by_rate)
+                for slot in slots}
+        total = _round_table(sums[:, slots].sum(axis=1), counts[:, slots].sum(axis=1), by_rate)
+        category_scores[category] = (dims, total)
+
+    n = matrix.shape[0]
+    columns = []
+    for _, category, dim in EMPLOYEE_SCORE_FIELDS:
+        if category not in category_scores:
+            columns.append(['综合型'] * n if dim is None else np.zeros(n))
+            continue
+        dims, total = category_scores[category]
+        if dim is None:
+            if dims:
+                names = list(dims)
+                columns.append(_dominant_types(np.stack([dims[k] for k in names], axis=1), names))
+            else:
+                columns.append(['综合型'] * n)
+        elif dim == 'total':
+            columns.append(total)
+        else:
+            columns.append(dims.get(dim, np.zeros(n)))
+    return columns
+
+
+def load_attempt_sheets(conn):
+    """读取每次测评所评的答卷，按题库版本分组 {题库版本: ([(测评记录id,), ...], 答卷矩阵)}"""
+    rows = conn.execute('''SELECT a.id, s.题库版本, s.答案 FROM assessment_attempts a
+        JOIN answer_sheets s ON s.id = a.答卷ID''').fetchall()
+    groups = {}
+    for attempt_id, version, blob in rows:
+        keys, blobs = groups.setdefault(version, ([], []))
+        keys.append((attempt_id,))
+        blobs.append(blob)
+    return {
+        version: (keys, np.frombuffer(b''.join(blobs), dtype=np.uint8).reshape(len(blobs), -1))
+        for version, (keys, blobs) in groups.items()
+    }
+
+
+def rescore_all(conn, dry_run=False, catalog=None):
+    """按当前评分规则重新计算每次测评的答卷，单事务写回测评记录（同时记下评分版本），返回处理的答卷数
+
+    历次测评都按同一规则重算，前后对比不受评分规则调整影响。
+    catalog 为题库、评分配置和答卷布局所在的连接，默认与 conn 相同；按公司分片时为主库连接
+    """
+    catalog = catalog or conn
+    plan = get_scoring_plan(catalog)
+    layouts = load_sheet_layouts(catalog)
+    groups = load_attempt_sheets(conn)
+
+    updates = []
+    for version, (keys, matrix) in groups.items():
+        layout = layouts.get(version)
+        if layout is None or matrix.shape[1] != len(layout.ids):
+            logger.warning(f"题库版本 {version} 缺少答卷布局，跳过 {len(keys)} 份答卷")
+            continue
+        columns = score_matrix(plan, layout, matrix)
+        values = [col.tolist() if isinstance(col, np.ndarray) else col for col in columns]
+        updates.extend(row + (plan.config_version,) + key for row, key in zip(zip(*values), keys))
+
+    if dry_run or not updates:
+        return len(updates)
+
+    assignments = ', '.join(f'{col} = ?' for col in EMPLOYEE_SCORE_COLUMNS)
+    try:
+        conn.executemany(f'UPDATE assessment_attempts SET {assignments}, 评分版本 = ? WHERE id = ?', updates)
+        # 行为模式类型可能随评分规则变化，同步员工行上的冗余列
+        sync_filter_columns(conn)
+        # 得分整体变化，常模直接按新得分重建
+        rebuild_norms(conn)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return len(updates)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='按当前评分规则重新计算全部已保存答卷')
+    parser.add_argument('--db', default=DB_NAME, help='数据库文件路径')
+    parser.add_argument('--dry-run', action='store_true', help='只计算不写回数据库')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    conn = sqlite3.connect(args.db)
+    try:
+        migrate(conn)
+        start = time.perf_counter()
+        count = rescore_all(conn, dry_run=args.dry_run)
+        logger.info(f"重新评分完成：{count} 份答卷，耗时 {time.perf_counter() - start:.2f} 秒")
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测评评分核心
+根据题库和评分配置预编译不可变的评分计划（题号 -> 类别/维度/计分函数），
+一次遍历答案即可得出全部维度得分；题库或评分配置版本变化时才重新构建
+"""
+
+import threading
+
+from question_bank import get_bank_version
+from scoring_config import get_scoring_config
+
+# 按1-5分制作答的题目类型
+RATING_TYPES = ('反向题', '评分')
+
+
+def _choice_scorer(table, default):
+    """选项 -> 预设分值"""
+    def score(answer_value):
+        return table.get(str(answer_value).strip().upper(), default)
+    return score
+
+
+def _constant_scorer(value):
+    def score(answer_value):
+        return value
+    return score
+
+
+def _rating_scorer(reverse):
+    """1-5分制评分，反向题计分：1→5, 2→4, 3→3, 4→2, 5→1"""
+    def score(answer_value):
+        try:
+            value = max(1, min(5, int(answer_value)))
+        except (TypeError, ValueError, OverflowError):
+            return 3  # 默认分数
+        return 6 - value if reverse else value
+    return score
+
+
+def _single_choice_scorer(correct):
+    """单选题：正确得1分，错误得0分"""
+    correct = str(correct).strip().upper()
+
+    def score(answer_value):
+        try:
+            return 1 if str(answer_value).strip().upper() == correct else 0
+        except Exception:
+            return 0
+    return score
+
+
+def build_scorer(q_id, q_type, correct, config):
+    """根据题目类型及评分配置生成计分函数"""
+    if q_type == '情境题':
+        if q_id in config.situation_scores:
+            return _choice_scorer(config.situation_scores[q_id], 1)
+        return _constant_scorer(3)
+    if q_type == '双向选择题':
+        if q_id in config.dual_choice_scores:
+            return _choice_scorer(config.dual_choice_scores[q_id], 3)
+        return _constant_scorer(3)
+    if q_type == '反向题':
+        return _rating_scorer(reverse=True)
+    if q_type == '评分':
+        return _rating_scorer(reverse=False)
+    if q_type == '单选':
+        return _single_choice_scorer(correct if correct and correct.strip() else 'A')
+    return _constant_scorer(0)
+
+
+class ScoringPlan:
+    """不可变评分计划：题号直接映射到所属维度槽位及计分函数"""
+
+    __slots__ = ('version', 'config_version', 'categories', 'slots', '_entries')
+
+    def __init__(self, version, question_rows, config):
+        """version: 题库版本；question_rows: [(id, 题目类型, 正确答案), ...]；config: ScoringConfig"""
+        question_info = {row[0]: (row[1], row[2]) for row in question_rows}
+
+        categories = []
+        slots = []
+        targets = {}
+        for category, dims in config.dimension_maps.items():
+            dim_slots = []
+            for dim, ids in dims.items():
+                slot = len(slots)
+                slots.append((category, dim))
+                dim_slots.append(slot)
+                for q_id in ids:
+                    targets.setdefault(q_id, []).append(slot)
+            categories.append((category, tuple(dim_slots), category in config.rate_categories))
+
+        entries = {}
+        for q_id, q_slots in targets.items():
+            q_type, correct = question_info.get(q_id, ('', None))
+            entries[q_id] = (tuple(q_slots), build_scorer(q_id, q_type, correct, config))
+
+        object.__setattr__(self, 'version', version)
+        object.__setattr__(self, 'config_version', config.version)
+        object.__setattr__(self, 'categories', tuple(categories))
+        object.__setattr__(self, 'slots', tuple(slots))
+        object.__setattr__(self, '_entries', entries)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('ScoringPlan 不可修改')
+
+    def lookup(self, q_id):
+        """返回题目的 (维度槽位, 计分函数)，不参与评分的题目返回 None"""
+        return self._entries.get(q_id)
+
+    def score(self, answers):
+        """单次遍历计算各类别、维度得分，返回 {类别: {维度: 分, 'total': 分}}"""
+        return self.aggregate(*self.tally(answers))
+
+    def tally(self, answers):
+        """统计各维度槽位的分数和与题数"""
+        n = len(self.slots)
+        sums = [0] * n
+        counts = [0] * n
+        entries = self._entries
+        for ans in answers:
+            entry = entries.get(ans['id'])
+            if entry is None:
+                continue
+            q_slots, scorer = entry
+            value = scorer(ans['answer'])
+            for slot in q_slots:
+                sums[slot] += value
+                counts[slot] += 1
+        return sums, counts
+
+    def aggregate(self, sums, counts):
+        """由各维度的分数和与题数汇总出最终得分"""
+        scores = {}
+        for category, dim_slots, by_rate in self.categories:
+            empty = 1 if by_rate else 0
+            cat_scores = {}
+            cat_sum = 0
+            cat_count = 0
+            for slot in dim_slots:
+                dim_sum = sums[slot]
+                dim_count = counts[slot]
+                cat_sum += dim_sum
+                cat_count += dim_count
+                cat_scores[self.slots[slot][1]] = _average(dim_sum, dim_count, by_rate, empty)
+            cat_scores['total'] = _average(cat_sum, cat_count, by_rate, empty)
+            scores[category] = cat_scores
+        return scores
+
+
+def _average(total, count, by_rate, empty):
+    if not count:
+        return empty
+    if by_rate:
+        # 通用能力改为5分制：将0-1的正确率映射到1-5分制
+        return round(1 + total / count * 4, 2)
+    return round(total / count, 2)
+
+
+_plan_lock = threading.Lock()
+_plan = None
+
+
+def get_scoring_plan(conn):
+    """返回当前题库版本与评分配置版本对应的评分计划，任一版本变化时才重新构建"""
+    global _plan
+    version = get_bank_version(conn)
+    config = get_scoring_config(conn)
+    plan = _plan
+    if plan is not None and plan.version == version and plan.config_version == config.version:
+        return plan
+    with _plan_lock:
+        plan = _plan
+        if plan is None or plan.version != version or plan.config_version != config.version:
+            rows = conn.execute('SELECT id, 题目类型, 正确答案 FROM questions').fetchall()
+            plan = ScoringPlan(version, rows, config)
+            _plan = plan
+        return plan
+
+
+def get_max_type(data_dict):
+    """确定最高分的维度类型"""
+    try:
+        if not data_dict:
+            return '综合型'
+        # 只考虑数值类型的键值对
+        numeric_items = {}
+        for k, v in data_dict.items():
+            if k != 'total' and isinstance(v, (int, float)):
+                numeric_items[k] = v
+
+        if not numeric_items:
+            return '综合型'
+
+        max_val = max(numeric_items.values())
+        max_keys = [k for k, v in numeric_items.items() if v == max_val]
+        return '/'.join(max_keys[:2]) if max_keys else '综合型'
+    except Exception:
+        return '综合型'
+
+
+# employees 表评分列 -> (类别, 维度)；维度为 'total' 表示类别总分，为 None 表示取最高分的维度类型
+EMPLOYEE_SCORE_FIELDS = (
+    ('管理能力', '管理能力', 'total'),
+    ('战略思维', '管理能力', '战略与决策'),
+    ('团队领导', '管理能力', '团队领导'),
+    ('执行管控', '管理能力', '执行管控'),
+    ('跨部门协作', '管理能力', '沟通影响'),
+    ('性格特质分数', '性格特质', 'total'),
+    ('外向性', '性格特质', '外向性'),
+    ('宜人性', '性格特质', '宜人性'),
+    ('开放性', '性格特质', '开放性'),
+    ('责任心', '性格特质', '责任心'),
+    ('性格特质类型', '性格特质', None),
+    ('行为模式类型', 'DISC行为模式', None),
+    ('行为模式分数', 'DISC行为模式', 'total'),
+    ('通用能力', '通用能力', 'total'),
+    ('言语理解', '通用能力', '言语理解'),
+    ('数量分析', '通用能力', '数量分析'),
+    ('逻辑推理', '通用能力', '逻辑推理'),
+    ('空间认知', '通用能力', '空间认知'),
+)
+
+# employees 表中由评分写入的列
+EMPLOYEE_SCORE_COLUMNS = tuple(field[0] for field in EMPLOYEE_SCORE_FIELDS)
+
+
+def employee_score_values(scores):
+    """将得分转换为 employees 表评分列的取值（与 EMPLOYEE_SCORE_COLUMNS 顺序一致）"""
+    values = []
+    for _, category, dim in EMPLOYEE_SCORE_FIELDS:
+        cat_scores = scores.get(category, {})
+        values.append(get_max_type(cat_scores) if dim is None else cat_scores.get(dim, 0))
+    return tuple(values)
@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+评分规则配置
+维度映射、情境题/双向选择题分值表保存在 scoring_configs 表中，按版本号递增发布。
+每个进程按版本缓存解析后的配置，每次请求只做一次轻量的版本号查询，
+因此发布新版本后所有 gunicorn 工作进程无需重启即可生效
+
+用法：
+    python scoring_config.py show [--version N]      # 查看配置（默认当前版本）
+    python scoring_config.py publish config.json     # 发布新版本
+"""
+
+import argparse
+import json
+import sqlite3
+import sys
+import threading
+from collections import namedtuple
+
+from database import is_postgres
+
+DB_NAME = 'new_questions.db'
+
+# 初始评分规则（首次建表时写入为版本1）
+DEFAULT_SCORING_CONFIG = {
+    # 维度映射 - 删除职业兴趣部分
+    'dimension_maps': {
+        '管理能力': {
+            '战略与决策': [1, 2, 3, 4, 5],
+            '团队领导': [6, 7, 8, 9, 10],
+            '沟通影响': [11, 12, 13, 14, 15],
+            '执行管控': [16, 17, 18, 19, 20],
+            '学习创新': [21, 22, 23, 24, 25]
+        },
+        '性格特质': {
+            '外向性': [26, 32, 34],
+            '宜人性': [35, 37, 44],
+            '开放性': [28, 42],
+            '责任心': [27, 29, 30, 31, 36, 40, 43, 45]
+        },
+        'DISC行为模式': {
+            'D型支配型': [46, 47, 48, 49, 50],
+            'I型影响型': [51, 52, 53, 54, 55],
+            'S型稳健型': [56, 57, 58, 59, 60],
+            'C型谨慎型': [61, 62, 63, 64, 65]
+        },
+        '通用能力': {
+            '言语理解': list(range(66, 81)),
+            '数量分析': list(range(81, 96)),
+            '逻辑推理': list(range(96, 111)),
+            '空间认知': list(range(111, 126))
+        }
+    },
+    # 情境题分值映射 - 根据新设计文档
+    'situation_scores': {
+        1: {'A': 2, 'B': 5, 'C': 3, 'D': 1},  # 战略主动性
+        4: {'A': 3, 'B': 5, 'C': 2, 'D': 1},  # 问题洞察力
+        6: {'A': 3, 'B': 5, 'C': 2, 'D': 1},  # 激励与辅导
+        9: {'A': 2, 'B': 5, 'C': 3, 'D': 1},  # 冲突处理
+        11: {'A': 3, 'B': 5, 'C': 4, 'D': 1}, # 沟通策略
+        14: {'A': 5, 'B': 3, 'C': 2, 'D': 1}, # 跨部门沟通
+        16: {'A': 3, 'B': 5, 'C': 2, 'D': 1}, # 执行判断
+        19: {'A': 5, 'B': 4, 'C': 2, 'D': 3}, # 规则意识
+        21: {'A': 4, 'B': 5, 'C': 3, 'D': 1}, # 学习意愿
+        24: {'A': 2, 'B': 5, 'C': 1, 'D': 4}  # 复原力
+    },
+    # 双向选择题分值映射 - 根据新设计文档
+    'dual_choice_scores': {
+        2: {'A': 3, 'B': 5},   # 战略敏感度
+        8: {'A': 5, 'B': 4},   # 领导风格
+        13: {'A': 4, 'B': 5},  # 沟通方式
+        18: {'A': 4, 'B': 5},  # 执行灵活度
+        23: {'A': 4, 'B': 5}   # 创新倾向
+    },
+    # 按正确率折算为1-5分制的类别
+    'rate_categories': ['通用能力']
+}
+
+ScoringConfig = namedtuple('ScoringConfig', [
+    'version', 'dimension_maps', 'situation_scores', 'dual_choice_scores', 'rate_categories'
+])
+
+# 早期版本配置中的反向题列表：反向计分一直由题库中的题目类型（反向题）决定，该列表从未参与评分。
+# 读取已发布的旧版本时忽略，发布新版本时拒绝，避免发布一个不改变任何得分的版本
+IGNORED_KEYS = ('reverse_questions',)
+
+_cache_lock = threading.Lock()
+_cache = {}
+
+
+def ensure_scoring_config_tables(conn):
+    """创建评分配置表，表为空时写入默认配置作为版本1（幂等）"""
+    c = conn.cursor()
+    # PostgreSQL 的表结构见 postgres_schema.sql
+    if not is_postgres(conn):
+        c.execute('''CREATE TABLE IF NOT EXISTS scoring_configs (
+            版本 INTEGER PRIMARY KEY,
+            配置 TEXT NOT NULL,
+            说明 TEXT,
+            创建时间 TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )''')
+    c.execute('INSERT INTO scoring_configs (版本, 配置, 说明) VALUES (1, ?, ?) ON CONFLICT DO NOTHING',
+              (json.dumps(DEFAULT_SCORING_CONFIG, ensure_ascii=False), '默认评分规则'))
+    conn.commit()
+
+
+def parse_scoring_config(version, raw):
+    """校验并解析配置，格式错误时抛出 ValueError"""
+    if not isinstance(raw, dict):
+        raise ValueError('评分配置必须是 JSON 对象')
+    try:
+        dimension_maps = {
+            str(category): {str(dim): tuple(int(q_id) for q_id in ids) for dim, ids in dims.items()}
+            for category, dims in raw['dimension_maps'].items()
+        }
+        situation_scores = _parse_option_scores(raw.get('situation_scores', {}))
+        dual_choice_scores = _parse_option_scores(raw.get('dual_choice_scores', {}))
+        rate_categories = frozenset(str(category) for category in raw.get('rate_categories', []))
+    except (KeyError, TypeError, ValueError, AttributeError) as e:
+        raise ValueError(f'评分配置格式错误: {e!r}') from e
+    unknown = rate_categories - set(dimension_maps)
+    if unknown:
+        raise ValueError(f'rate_categories 中的类别不存在: {sorted(unknown)}')
+    return ScoringConfig(version, dimension_maps, situation_scores, dual_choice_scores, rate_categories)
+
+
+def _parse_option_scores(table):
+    """{题号: {选项: 分值}}，分值必须为整数"""
+    parsed = {}
+    for q_id, options in table.items():
+        scores = {}
+        for key, value in options.items():
+            if isinstance(value, bool) or not isinstance(value, int):
+                raise ValueError(f'题目 {q_id} 选项 {key} 的分值必须是整数')
+            scores[str(key).strip().upper()] = value
+        parsed[int(q_id)] = scores
+    return parsed
+
+
+def get_config_version(conn):
+    """读取当前生效的配置版本号（最大版本）"""
+    return conn.execute('SELECT MAX(版本) FROM scoring_configs').fetchone()[0]
+
+
+def get_scoring_config(conn, version=None):
+    """返回指定版本（默认当前版本）的评分配置，解析结果按版本缓存"""
+    if version is None:
+        version = get_config_version(conn)
+    config = _cache.get(version)
+    if config is not None:
+        return config
+    with _cache_lock:
+        config = _cache.get(version)
+        if config is None:
+            row = conn.execute('SELECT 配置 FROM scoring_configs WHERE 版本 = ?', (version,)).fetchone()
+            if row is None:
+                raise ValueError(f'评分配置版本不存在: {version}')
+            config = parse_scoring_config(version, json.loads(row[0]))
+            _cache[version] = config
+        return config
+
+
+def publish_scoring_config(conn, raw, 说明=None):
+    """校验后发布新版本配置，返回新版本号"""
+    parse_scoring_config(None, raw)
+    for key in IGNORED_KEYS:
+        if key in raw:
+            raise ValueError(f'评分配置不支持 {key}：反向计分由题目类型（反向题）决定，请修改题库')
+    c = conn.cursor()
+    c.execute('''INSERT INTO scoring_configs (版本, 配置, 说明)
+        SELECT COALESCE(MAX(版本), 0) + 1, ?, ? FROM scoring_configs''',
+              (json.dumps(raw, ensure_ascii=False), 说明))
+    conn.commit()
+    return c.execute('SELECT MAX(版本) FROM scoring_configs').fetchone()[0]
+
+
+def load_raw_config(conn, version=None):
+    """读取配置原始 JSON"""
+    if version is None:
+        version = get_config_version(conn)
+    row = conn.execute('SELECT 配置 FROM scoring_configs WHERE 版本 = ?', (version,)).fetchone()
+    if row is None:
+        raise ValueError(f'评分配置版本不存在: {version}')
+    # 导出后编辑再发布时不带上已忽略的项
+    raw = json.loads(row[0])
+    for key in IGNORED_KEYS:
+        raw.pop(key, None)
+    return version, raw
+
+
+def main():
+    parser = argparse.ArgumentParser(description='评分规则配置管理')
+    parser.add_argument('--db', default=DB_NAME, help='数据库文件路径')
+    sub = parser.add_subparsers(dest='command', required=True)
+    show = sub.add_parser('show', help='查看配置')
+    show.add_argument('--version', type=int, help='配置版本，默认当前版本')
+    publish = sub.add_parser('publish', help='发布新版本配置')
+    publish.add_argument('file', help='配置 JSON 文件')
+    publish.add_argument('--note', help='版本说明')
+    args = parser.parse_args()
+
+    from migrations import migrate
+
+    conn = sqlite3.connect(args.db)
+    try:
+        migrate(conn)
+        if args.command == 'show':
+            version, raw = load_raw_config(conn, args.version)
+            print(f'# 评分配置版本 {version}')
+            print(json.dumps(raw, ensure_ascii=False, indent=2))
+        else:
+            with open(args.file, 'r', encoding='utf-8') as f:
+                raw = json.load(f)
+            try:
+                version = publish_scoring_config(conn, raw, args.note)
+            except ValueError as e:
+                print(f'✗ {e}')
+                sys.exit(1)
+            print(f'✓ 已发布评分配置版本 {version}，如需更新历史得分请运行 python rescore.py')
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+按公司分片（SQLite）
+设置环境变量 SHARD_DIR 后，每个公司名称的员工、答卷、答题进度和常模存放在该目录下各自的
+SQLite 文件中，各公司的写入不再争抢同一把写锁；题库、评分配置、答卷布局和管理员仍在主库
+（DATABASE_PATH）中。分片文件名由公司名称的哈希确定，只在员工首次登录时由 repo.shard(公司名称)
+创建；其余读写通过 repo.existing_shard(公司名称) 取得员工所在的分片，尚无分片的公司视为没有数据，
+任意公司名称的查询不会生成新文件。管理端的员工列表、导出、清空和重新评分逐个分片执行后合并
+
+用法：
+    python sharding.py split [--db new_questions.db] [--shard-dir shards]   # 把现有数据库按公司拆分为分片
+    python sharding.py list [--shard-dir shards]                            # 查看各分片的公司和员工数
+"""
+
+import argparse
+import hashlib
+import heapq
+import os
+import sys
+import threading
+
+from database import DATABASE_ERRORS, DB_NAME, begin, connect
+from migrations import migrate
+from norms import get_versioned_norm_tables, merge_norm_tables, rebuild_norms
+from repository import EMPLOYEE_PAGE_SIZE, SQLiteRepository, decode_cursor, encode_cursor
+
+SHARD_DIR = 'shards'
+SHARD_PREFIX = 'company_'
+SHARD_SUFFIX = '.db'
+# 随员工一起存放在分片中的表，均以 公司名称 列归属；按原 id 复制，员工的最新测评指针保持有效
+SHARDED_TABLES = ('employees', 'answer_sheets', 'answer_sessions', 'assessment_attempts')
+
+
+def shard_filename(公司名称):
+    """公司名称 -> 分片文件名，所有进程和拆分工具按同一规则计算"""
+    digest = hashlib.sha1((公司名称 or '').encode('utf-8')).hexdigest()[:16]
+    return f'{SHARD_PREFIX}{digest}{SHARD_SUFFIX}'
+
+
+class ShardedRepository(SQLiteRepository):
+    """按公司分片的存储仓库：自身为主库，员工数据路由到各公司的分片"""
+
+    def __init__(self, path=DB_NAME, shard_dir=SHARD_DIR):
+        super().__init__(path)
+        self.shard_dir = shard_dir
+        os.makedirs(shard_dir, exist_ok=True)
+        # 文件名 -> 分片仓库，每个进程打开过的分片
+        self._shards = {}
+        self._shards_lock = threading.Lock()
+        self._norms = ((), {})
+
+    def _open(self, name):
+        shard = self._shards.get(name)
+        if shard is not None:
+            return shard
+        with self._shards_lock:
+            shard = self._shards.get(name)
+            if shard is None:
+                shard = SQLiteRepository(os.path.join(self.shard_dir, name))
+                shard.name = name
+                # 新建的分片在这里建表，已有分片在本进程首次打开时补齐新增的迁移
+                conn = shard.connect()
+                try:
+                    migrate(conn)
+                finally:
+                    conn.close()
+                self._shards[name] = shard
+            return shard
+
+    def ensure_schema(self, admin_username, admin_password):
+        super().ensure_schema(admin_username, admin_password)
+        # 启动时即对全部已有分片执行迁移
+        self.shards()
+
+    def release(self):
+        super().release()
+        for shard in list(self._shards.values()):
+            shard.release()
+
+    def close(self):
+        super().close()
+        for shard in list(self._shards.values()):
+            shard.close()
+
+    # 分片路由
+    def shard(self, 公司名称):
+        """公司名称所在的分片，不存在时创建；只在新建员工时使用，其他读写用 existing_shard()"""
+        return self._open(shard_filename(公司名称))
+
+    def existing_shard(self, 公司名称):
+        """公司名称所在的分片，尚无该公司的数据时返回 None（只读查询和后台写入不创建分片）"""
+        name = shard_filename(公司名称)
+        if name in self._shards or os.path.exists(os.path.join(self.shard_dir, name)):
+            return self._open(name)
+        return None
+
+    def shards(self):
+        """分片目录下的全部分片，按文件名排序；其他进程新建的分片在下次调用时即可看到"""
+        names = sorted(name for name in os.listdir(self.shard_dir)
+                       if name.startswith(SHARD_PREFIX) and name.endswith(SHARD_SUFFIX))
+        return [self._open(name) for name in names]
+
+    def norm_tables(self):
+        """各分片常模合并后的全体常模，任一分片的常模缓存重新读取（或分片增加）后重新合并，
+        即最多每 NORM_RELOAD_INTERVAL 秒合并一次，提交答卷本身不会使合并结果失效"""
+        versioned = [(shard.name, get_versioned_norm_tables(shard.connection())) for shard in self.shards()]
+        key = tuple((name, version) for name, (version, _) in versioned)
+        cached_key, merged = self._norms
+        if cached_key != key:
+            merged = merge_norm_tables([tables for _, (_, tables) in versioned])
+            self._norms = (key, merged)
+        return merged
+
+    # 员工
+    def get_employee(self, 公司名称, 员工工号):
+        shard = self.existing_shard(公司名称)
+        return shard.get_employee(公司名称, 员工工号) if shard is not None else None
+
+    def list_employees(self, after=None, limit=EMPLOYEE_PAGE_SIZE, **filters):
+        """逐个分片读取游标之后的一页，按 (创建时间, id, 分片) 倒序归并后取前 limit 行
+
+        各分片的 id 独立自增，游标中带上分片名使排序唯一：文件名排在游标分片之前的分片，
+        与游标 (创建时间, id) 相同的行仍排在游标之后
+        """
+        key = decode_cursor(after) if after else None
+        if filters.get('公司名称') is not None:
+            shard = self.existing_shard(filters['公司名称'])
+            shards = [shard] if shard is not None else []
+        else:
+            shards = self.shards()
+        pages = []
+        for shard in shards:
+            inclusive = key is not None and len(key) > 2 and shard.name < key[2]
+            rows = shard.employee_page(key[:2] if key else None, inclusive, limit + 1, **filters)
+            pages.append([((row['创建时间'] or '', row['id'], shard.name), row) for row in rows])
+        merged = list(heapq.merge(*pages, key=lambda item: item[0], reverse=True))[:limit + 1]
+        next_cursor = None
+        if len(merged) > limit:
+            merged.pop()
+            next_cursor = encode_cursor(*merged[-1][0])
+        return [row for _, row in merged], next_cursor
+
+    def export_employees(self):
+        rows = []
+        for shard in self.shards():
+            rows.extend(shard.export_employees())
+        rows.sort(key=lambda row: (row[0] or '', row[1]))
+        return rows
+
+
+def split_database(source, shard_dir):
+    """把单库中的员工、答卷和答题进度按公司复制到分片并重建各分片的常模，返回 {公司名称: 员工数}
+
+    源库保留原有数据，继续作为分片模式下的主库（题库、评分配置、答卷布局、管理员）。
+    可重复执行：分片中该公司的已有数据会先被替换
+    """
+    conn = connect(source)
+    try:
+        migrate(conn)
+        counts = dict(conn.execute(
+            'SELECT 公司名称, COUNT(*) FROM employees GROUP BY 公司名称 ORDER BY 公司名称'))
+    finally:
+        conn.close()
+
+    router = ShardedRepository(source, shard_dir)
+    for company in counts:
+        shard = router.shard(company)
+        conn = shard.connect()
+        try:
+            conn.execute('ATTACH DATABASE ? AS source', (os.path.abspath(source),))
+            begin(conn, immediate=True)
+            for table in SHARDED_TABLES:
+                columns = ', '.join(row[1] for row in conn.execute(f'PRAGMA main.table_info({table})'))
+                conn.execute(f'DELETE FROM main.{table} WHERE 公司名称 = ?', (company,))
+                conn.execute(f'''INSERT INTO main.{table} ({columns})
+                    SELECT {columns} FROM source.{table} WHERE 公司名称 = ?''', (company,))
+            conn.commit()
+            conn.execute('DETACH DATABASE source')
+            begin(conn, immediate=True)
+            rebuild_norms(conn)
+            conn.commit()
+        finally:
+            conn.close()
+    router.close()
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description='按公司分片')
+    parser.add_argument('command', choices=['split', 'list'], help='split：按公司拆分现有数据库；list：查看分片')
+    parser.add_argument('--db', default=DB_NAME, help='主库文件路径')
+    parser.add_argument('--shard-dir', default=os.environ.get('SHARD_DIR', SHARD_DIR), help='分片目录')
+    args = parser.parse_args()
+
+    try:
+        if args.command == 'split':
+            counts = split_database(args.db, args.shard_dir)
+            for company, n in counts.items():
+                print(f'  {shard_filename(company)}  {company or "（无公司）"}  {n} 人')
+            print(f'✓ 已拆分为 {len(counts)} 个分片：{args.shard_dir}')
+            return
+        router = ShardedRepository(args.db, args.shard_dir)
+        for shard in router.shards():
+            for company, n in shard.connection().execute(
+                    'SELECT 公司名称, COUNT(*) FROM employees GROUP BY 公司名称 ORDER BY 公司名称'):
+                print(f'  {shard.name}  {company or "（无公司）"}  {n} 人')
+        router.close()
+    except DATABASE_ERRORS + (OSError,) as e:
+        print(f'✗ {e}')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
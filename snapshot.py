@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+只读快照库（SQLite）
+管理端的员工列表、导出和报告生成读取的是考生正在写入的同一个数据库文件。设置 SNAPSHOT_PATH 后，
+后台线程用 SQLite 在线备份接口定期（或每累计 N 次写入后）把主库复制为只读副本，管理端的分析类
+读取改为打开副本（immutable、query_only），大批量导出不再与提交争用主库。
+
+备份在 WAL 模式下只持有读事务，不阻塞写入；先写入临时文件，完成后原子替换副本，读连接在下一次
+请求时发现副本已更换并重新打开。副本文件的修改时间记为快照时间，据此报告副本落后多久。
+多个工作进程共用同一个副本：刷新时加文件锁，其他进程刚刷新过时跳过本次定时刷新
+
+用法：
+    python snapshot.py refresh [--db new_questions.db] [--out new_questions.snapshot.db]   # 立即刷新一次（可放入 cron）
+    python snapshot.py status [--out new_questions.snapshot.db]                            # 查看快照时间
+"""
+
+import argparse
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime
+from urllib.parse import quote
+
+from database import CACHED_STATEMENTS, DB_NAME, MMAP_SIZE, ConnectionManager, connect
+from repository import Repository
+
+try:
+    import fcntl
+except ImportError:  # Windows 开发环境只有单进程，不加锁
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_NAME = 'new_questions.snapshot.db'
+# 定时刷新的间隔（秒）
+SNAPSHOT_INTERVAL = 60
+
+
+def snapshot_time(path):
+    """副本的快照时间（时间戳），副本不存在时返回 None"""
+    try:
+        return os.stat(path).st_mtime
+    except FileNotFoundError:
+        return None
+
+
+def refresh_snapshot(source, path, wait=True):
+    """用在线备份接口把 source 复制为只读副本 path，返回是否刷新；
+    wait 为假且其他进程正在刷新时直接返回 False"""
+    with open(f'{path}.lock', 'a') as lock_file:
+        if fcntl is not None:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | (0 if wait else fcntl.LOCK_NB))
+            except BlockingIOError:
+                return False
+        started = time.time()
+        tmp = f'{path}.tmp'
+        # 上次中断留下的临时文件
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        src = connect(source)
+        dst = sqlite3.connect(tmp)
+        try:
+            # 一次复制全部页面：整个备份在同一个读事务中完成，得到一致的快照
+            src.backup(dst)
+            # 副本改为回滚日志模式，以 immutable 打开时不需要 -wal/-shm 文件
+            dst.execute('PRAGMA journal_mode = DELETE')
+        finally:
+            dst.close()
+            src.close()
+        # 快照时间取备份开始的时刻
+        os.utime(tmp, (started, started))
+        os.replace(tmp, path)
+    return True
+
+
+class SnapshotConnectionManager(ConnectionManager):
+    """只读副本的连接管理器：以 immutable、query_only 打开，副本被替换后重新打开"""
+
+    def _open(self):
+        # immutable：副本不会被原地修改，读取时不加文件锁；query_only：拒绝任何写入
+        conn = sqlite3.connect(f'file:{quote(os.path.abspath(self.path))}?immutable=1', uri=True,
+                               cached_statements=CACHED_STATEMENTS)
+        conn.execute('PRAGMA query_only = 1')
+        conn.execute(f'PRAGMA mmap_size = {MMAP_SIZE}')
+        return conn
+
+    def connect(self):
+        return self._open()
+
+    def connection(self):
+        local = self._local
+        conn = getattr(local, 'conn', None)
+        if conn is not None and local.pid != os.getpid():
+            self._inherited.append(conn)
+            conn = None
+        # 副本每次刷新都是新文件，以 (inode, 修改时间) 判断是否已更换
+        stat = os.stat(self.path)
+        identity = (stat.st_ino, stat.st_mtime_ns)
+        if conn is not None and local.identity != identity:
+            conn.close()
+            conn = None
+        if conn is None:
+            conn = local.conn = self._open()
+            local.pid = os.getpid()
+            local.identity = identity
+        return conn
+
+
+class SnapshotRepository(Repository):
+    """只读副本上的存储仓库，供管理端的列表、导出和报告读取"""
+
+    dialect = 'sqlite'
+
+    def __init__(self, path=SNAPSHOT_NAME):
+        super().__init__(SnapshotConnectionManager(path))
+
+
+class SnapshotReplica:
+    """只读副本的刷新线程：每隔 interval 秒，或本进程累计 every_writes 次写入后刷新"""
+
+    def __init__(self, source, path=SNAPSHOT_NAME, interval=SNAPSHOT_INTERVAL, every_writes=0):
+        self.source = source
+        self.path = path
+        self.interval = interval
+        self.every_writes = every_writes
+        self.repo = SnapshotRepository(path)
+        self._wake = threading.Event()
+        self._start_lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._writes_lock = threading.Lock()
+        self._writes = 0
+        self._refreshes = 0
+        self._failures = 0
+
+    def ensure_snapshot(self):
+        """副本不存在时立即生成（应用启动时调用）"""
+        if snapshot_time(self.path) is None:
+            refresh_snapshot(self.source, self.path)
+
+    def refresh(self):
+        """立即刷新副本（清空、重新评分等批量修改之后调用）"""
+        with self._writes_lock:
+            writes = self._writes
+        refresh_snapshot(self.source, self.path)
+        self._refreshes += 1
+        with self._writes_lock:
+            self._writes -= writes
+
+    def note_write(self):
+        """记录一次写入，达到 every_writes 次时唤醒刷新线程"""
+        self._ensure_thread()
+        with self._writes_lock:
+            self._writes += 1
+            writes = self._writes
+        if self.every_writes and writes >= self.every_writes:
+            self._wake.set()
+
+    def _ensure_thread(self):
+        # fork 出的子进程中没有父进程的刷新线程，需要重新启动
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or self._pid != os.getpid() or not self._thread.is_alive():
+                self._pid = os.getpid()
+                self._writes = 0
+                self._thread = threading.Thread(target=self._run, name='snapshot-refresh', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            woken = self._wake.wait(self.interval)
+            self._wake.clear()
+            age = self.age()
+            # 定时刷新时，其他进程刚刷新过的副本不再重复复制
+            if not woken and age is not None and age < self.interval:
+                continue
+            writes = self._writes
+            try:
+                if refresh_snapshot(self.source, self.path, wait=False):
+                    self._refreshes += 1
+                with self._writes_lock:
+                    self._writes -= writes
+            except Exception as e:
+                self._failures += 1
+                logger.error(f"刷新只读快照失败: {e}")
+
+    def age(self):
+        """副本落后的秒数，副本不存在时返回 None"""
+        taken = snapshot_time(self.path)
+        return None if taken is None else max(0.0, time.time() - taken)
+
+    def status(self):
+        self._ensure_thread()
+        taken = snapshot_time(self.path)
+        age = self.age()
+        return {
+            'snapshot_time': datetime.fromtimestamp(taken).strftime('%Y-%m-%d %H:%M:%S') if taken else None,
+            'age_seconds': round(age, 1) if age is not None else None,
+            'writes_since': self._writes,
+            'interval': self.interval,
+            'every_writes': self.every_writes,
+            'refreshes': self._refreshes,
+            'failures': self._failures,
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='只读快照库')
+    parser.add_argument('command', choices=['refresh', 'status'], help='refresh：立即刷新副本；status：查看快照时间')
+    parser.add_argument('--db', default=DB_NAME, help='主库文件路径')
+    parser.add_argument('--out', default=os.environ.get('SNAPSHOT_PATH', SNAPSHOT_NAME), help='只读副本文件路径')
+    args = parser.parse_args()
+
+    try:
+        if args.command == 'refresh':
+            start = time.perf_counter()
+            refresh_snapshot(args.db, args.out)
+            print(f'✓ 已刷新只读快照：{args.out}，耗时 {time.perf_counter() - start:.2f} 秒')
+            return
+        taken = snapshot_time(args.out)
+        if taken is None:
+            print(f'✗ 快照不存在：{args.out}')
+            sys.exit(1)
+        print(f'快照时间：{datetime.fromtimestamp(taken):%Y-%m-%d %H:%M:%S}，已落后 {time.time() - taken:.0f} 秒')
+    except (sqlite3.Error, OSError) as e:
+        print(f'✗ {e}')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
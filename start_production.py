@@ -47,11 +47,14 @@ def main():
     port = int(os.environ.get('PORT', 8000))
     host = os.environ.get('HOST', '0.0.0.0')
     workers = int(os.environ.get('WORKERS', 4))
+    # 每个工作进程的请求线程数：管理页面的报告事件流在生成期间各占一个线程，不再占住整个进程
+    threads = int(os.environ.get('THREADS', 8))
 
     print(f"启动配置：")
     print(f"  主机: {host}")
     print(f"  端口: {port}")
     print(f"  工作进程数: {workers}")
+    print(f"  每进程线程数: {threads}")
     print(f"  调试模式: {app.config['DEBUG']}")
     print()
 
@@ -64,6 +67,8 @@ def main():
             'gunicorn',
             'new_app:app',
             '-w', str(workers),
+            '-k', 'gthread',
+            '--threads', str(threads),
             '-b', f'{host}:{port}',
             '--log-level', 'info',
             '--access-logfile', 'access.log',
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+"""
+测试公共夹具：在临时目录中用 init_database.py 建好题库，new_app 指向该数据库
+"""
+
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+@pytest.fixture(scope='session')
+def question_db(tmp_path_factory):
+    """已初始化题库的 SQLite 数据库文件路径"""
+    import init_database
+    workdir = tmp_path_factory.mktemp('db')
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        init_database.init_database()
+    finally:
+        os.chdir(cwd)
+    return str(workdir / 'new_questions.db')
+
+
+@pytest.fixture(scope='session')
+def new_app(question_db):
+    """指向测试数据库的 new_app 模块（模块导入时读取配置并完成迁移，整个测试会话共用）"""
+    os.environ['DATABASE_URL'] = question_db
+    os.environ['REPORT_WORKERS'] = '0'
+    # 日志文件写在测试数据库所在目录
+    cwd = os.getcwd()
+    os.chdir(os.path.dirname(question_db))
+    try:
+        import new_app
+    finally:
+        os.chdir(cwd)
+    return new_app
+
+
+@pytest.fixture
+def client(new_app):
+    return new_app.app.test_client()
+
+
+@pytest.fixture(scope='session')
+def questions(new_app):
+    """题目列表（/api/questions 的完整格式）"""
+    data = new_app.app.test_client().get('/api/questions').get_json()
+    return data['questions'] if isinstance(data, dict) else data
+
+
+def make_answers(questions, seed=0):
+    """为每道题选一个合法答案，seed 不同时答案不同"""
+    answers = []
+    for k, q in enumerate(questions):
+        option = q['options'][(seed + k) % len(q['options'])]
+        answers.append({'id': q['id'], 'answer': option[0] if q['question_type'] == '单选' else option.split('=')[0]})
+    return answers
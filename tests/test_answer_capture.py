@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+"""逐题上报答案与提交：答案确认前已写入数据库，任一工作进程都能汇总；提交后迟到的答案不再写入"""
+
+import pytest
+
+from answer_capture import AnswerWriteBehind
+from conftest import make_answers
+
+
+def session_count(new_app, company, emp_no):
+    """未提交的答题进度条数"""
+    return new_app.repo.shard(company).connection().execute(
+        'SELECT COUNT(*) FROM answer_sessions WHERE 公司名称 = ? AND 员工工号 = ? AND 已提交 = 0',
+        (company, emp_no)).fetchone()[0]
+
+
+@pytest.fixture
+def writers(new_app):
+    """两个写后队列，模拟另外两个 gunicorn 工作进程"""
+    return AnswerWriteBehind(new_app.repo), AnswerWriteBehind(new_app.repo)
+
+
+def login(client, company, emp_no):
+    assert client.post('/api/login', json={'公司名称': company, '员工名称': '张三', '员工工号': emp_no}).status_code == 200
+
+
+@pytest.mark.parametrize('run', range(3))
+def test_incremental_submit_sees_answers_from_other_writers(new_app, client, questions, writers, run):
+    company, emp_no = '测试公司', f'W{run}'
+    login(client, company, emp_no)
+    answers = make_answers(questions, run)
+    # 各批答案由不同的进程接收，确认时均已写入
+    for n, start in enumerate(range(0, len(answers), 40)):
+        assert writers[n % 2].save(company, emp_no, answers[start:start + 40]) is True
+    r = client.post('/api/submit', json={'公司名称': company, '员工工号': emp_no, 'answers': [], 'incremental': True,
+                                         'ids': [a['id'] for a in answers]})
+    assert r.status_code == 200, r.get_json()
+    assert session_count(new_app, company, emp_no) == 0
+
+    expected = client.post('/api/submit', json={'公司名称': company, '员工工号': emp_no, 'answers': answers})
+    assert r.get_json()['scores'] == expected.get_json()['scores']
+
+
+def test_late_batch_after_submit_is_ignored(new_app, client, questions, writers):
+    company, emp_no = '测试公司', 'L1'
+    login(client, company, emp_no)
+    answers = make_answers(questions, 2)
+    assert client.post('/api/answers', json={'公司名称': company, '员工工号': emp_no,
+                                             'answers': answers[:30]}).status_code == 200
+    r = client.post('/api/submit', json={'公司名称': company, '员工工号': emp_no, 'answers': answers})
+    assert r.status_code == 200, r.get_json()
+    # 提交前发出、提交后才由另一进程写入的答案
+    assert writers[1].save(company, emp_no, answers[30:60]) is False
+    r = client.post('/api/answers', json={'公司名称': company, '员工工号': emp_no, 'answers': answers[60:70]})
+    assert r.status_code == 409
+    assert session_count(new_app, company, emp_no) == 0
+    assert client.get('/api/answers', query_string={'公司名称': company, '员工工号': emp_no}).get_json()['count'] == 0
+
+    # 重新登录开始新的测评后重新接收答案
+    login(client, company, emp_no)
+    assert writers[0].save(company, emp_no, answers[:10]) is True
+    assert client.get('/api/answers', query_string={'公司名称': company, '员工工号': emp_no}).get_json()['count'] == 10
+
+
+def test_full_submit_closes_answer_session(new_app, client, questions):
+    company, emp_no = '测试公司', 'F1'
+    login(client, company, emp_no)
+    answers = make_answers(questions, 1)
+    client.post('/api/answers', json={'公司名称': company, '员工工号': emp_no, 'answers': answers[:30]})
+    # 改为整卷提交：逐题上报的进度不再保留
+    r = client.post('/api/submit', json={'公司名称': company, '员工工号': emp_no, 'answers': answers})
+    assert r.status_code == 200, r.get_json()
+    assert session_count(new_app, company, emp_no) == 0
+    assert client.get('/api/answers', query_string={'公司名称': company, '员工工号': emp_no}).get_json()['count'] == 0
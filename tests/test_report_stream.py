@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+"""
+增量去除 Markdown：每一步的部分报告与对已收到原文整体执行 strip_markdown 的结果一致
+"""
+
+import random
+
+import pytest
+
+import report_stream
+from report_stream import MarkdownStripper, _open_marker, strip_markdown
+
+REPORT = '''# 综合分析报告
+
+## 一、管理能力
+**张三**的管理能力得分为 *3.5*，处于 _中等_ 水平。
+
+- 计划能力：较强
+- 沟通能力：`良好`
+  • 执行力：一般
+
+---
+
+
+### 二、行为模式
+```
+D型支配型
+```
+行为模式为 **D型支配型**，
+#
+-
+结论：**建议重点培养**。\r
+'''
+
+
+def expected(raw):
+    """原实现：对已收到的原文（截到当前行第一个未闭合标记之前）整体执行 strip_markdown"""
+    start = raw.rfind('\n') + 1
+    pos = _open_marker(raw[start:])
+    if pos is not None:
+        raw = raw[:start + pos]
+    return strip_markdown(raw)
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_incremental_text_matches_full_strip(seed):
+    rng = random.Random(seed)
+    stripper = MarkdownStripper()
+    received = ''
+    i = 0
+    while i < len(REPORT):
+        size = rng.randint(1, 12)
+        delta = REPORT[i:i + size]
+        i += size
+        stripper.feed(delta)
+        received += delta
+        assert stripper.text == expected(received)
+    assert stripper.raw == REPORT
+    assert stripper.text == strip_markdown(REPORT)
+
+
+def test_completed_lines_are_not_stripped_again(monkeypatch):
+    lengths = []
+    strip_inline = report_stream._strip_inline
+
+    def recording(text):
+        lengths.append(len(text))
+        return strip_inline(text)
+
+    monkeypatch.setattr(report_stream, '_strip_inline', recording)
+    stripper = MarkdownStripper()
+    for n in range(200):
+        for piece in (f'**第{n}段**', '内容\n'):
+            stripper.feed(piece)
+            stripper.text
+    # 每次只处理新收到的一行，而不是整篇原文
+    assert max(lengths) < 20
+    assert stripper.text == strip_markdown(stripper.raw)
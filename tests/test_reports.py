@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+"""分析报告：考生端和管理端共用同一提示词和 DeepSeek 调用，结果按得分缓存"""
+
+import json
+from datetime import datetime
+
+import pytest
+
+from conftest import make_answers
+from report_stream import strip_markdown
+
+REPORT = '# 分析报告\n\n**张三**的管理能力较强。\n\n- 建议：加强协作\n\n报告生成时间：[生成时间]\n'
+
+
+def dated(text, day):
+    return text.replace('[生成时间]', day.strftime('%Y年%m月%d日'))
+
+
+class FixedDay(datetime):
+    """报告日期固定为某一天"""
+    day = datetime(2026, 1, 2)
+
+    @classmethod
+    def now(cls, tz=None):
+        return cls.day
+
+
+class FakeStream:
+    """流式 chat completions 响应"""
+    status_code = 200
+    encoding = None
+    text = ''
+
+    def iter_lines(self, decode_unicode=False):
+        for i in range(0, len(REPORT), 5):
+            yield 'data: ' + json.dumps({'choices': [{'delta': {'content': REPORT[i:i + 5]}}]}, ensure_ascii=False)
+            yield ''
+        yield 'data: [DONE]'
+
+
+@pytest.fixture
+def deepseek(new_app, monkeypatch):
+    """替换 DeepSeek 调用，记录每次请求的载荷"""
+    calls = []
+
+    def post(url, json=None, **kwargs):
+        calls.append(json)
+        return FakeStream()
+
+    monkeypatch.setattr(new_app.requests, 'post', post)
+    with new_app.repo.transaction() as conn:
+        new_app.clear_report_cache(conn)
+    return calls
+
+
+@pytest.fixture
+def employee(client, questions):
+    company, emp_no = '报告公司', 'R1'
+    client.post('/api/login', json={'公司名称': company, '员工名称': '张三', '员工工号': emp_no})
+    assert client.post('/api/submit', json={'公司名称': company, '员工工号': emp_no,
+                                            'answers': make_answers(questions)}).status_code == 200
+    return company, emp_no
+
+
+def test_employee_and_admin_reports_share_generation(new_app, client, deepseek, employee):
+    company, emp_no = employee
+    r = client.post('/api/generate-report', json={'公司名称': company, '员工工号': emp_no})
+    assert r.status_code == 200
+    today = datetime.now()
+    assert r.get_json() == {'content': dated(strip_markdown(REPORT), today), 'raw': dated(REPORT, today)}
+    assert len(deepseek) == 1 and deepseek[0]['stream'] is True
+    # 得分未变化时管理端直接使用缓存
+    assert new_app.generate_admin_report(company, emp_no) == (dated(strip_markdown(REPORT), today), dated(REPORT, today))
+    assert len(deepseek) == 1
+
+
+def test_cached_report_shows_current_date(new_app, client, monkeypatch, deepseek, employee):
+    company, emp_no = employee
+    monkeypatch.setattr(new_app, 'datetime', FixedDay)
+    client.post('/api/generate-report', json={'公司名称': company, '员工工号': emp_no})
+    # 提示词中不含日期，模板中的占位符交给 DeepSeek 原样保留
+    prompt = deepseek[0]['messages'][0]['content']
+    assert '[生成时间]' in prompt and '2026年01月02日' not in prompt
+
+    # 次日命中缓存时显示当天的日期
+    monkeypatch.setattr(FixedDay, 'day', datetime(2026, 1, 3))
+    content, raw = new_app.generate_admin_report(company, emp_no)
+    assert raw == dated(REPORT, FixedDay.day) and '2026年01月03日' in content
+    r = client.post('/api/admin/generate-report', json={'公司名称': company, '员工工号': emp_no})
+    assert r.get_json()['cached'] is True and r.get_json()['raw'] == raw
+    assert len(deepseek) == 1
+
+
+def test_admin_cache_check_uses_latest_scores(new_app, client, monkeypatch, questions, deepseek, employee):
+    company, emp_no = employee
+    client.post('/api/generate-report', json={'公司名称': company, '员工工号': emp_no})
+    stale = new_app.repo.get_employee(company, emp_no)
+    # 重新测评后只读副本尚未刷新，仍是旧得分
+    assert client.post('/api/submit', json={'公司名称': company, '员工工号': emp_no,
+                                            'answers': make_answers(questions, 1)}).status_code == 200
+
+    class Snapshot:
+        def get_employee(self, company, emp_no):
+            return stale
+
+    monkeypatch.setattr(new_app, 'read_repo', Snapshot())
+    r = client.post('/api/admin/generate-report', json={'公司名称': company, '员工工号': emp_no})
+    assert r.status_code == 202 and r.get_json()['status'] == 'queued'
+
+
+def test_report_failure(new_app, client, monkeypatch, employee):
+    class Failed(FakeStream):
+        status_code = 500
+        text = 'busy'
+
+    monkeypatch.setattr(new_app.requests, 'post', lambda *args, **kwargs: Failed())
+    with new_app.repo.transaction() as conn:
+        new_app.clear_report_cache(conn)
+    company, emp_no = employee
+    r = client.post('/api/generate-report', json={'公司名称': company, '员工工号': emp_no})
+    assert r.status_code == 500 and 'busy' in r.get_json()['error']
+    with pytest.raises(RuntimeError, match='调用DeepSeek失败'):
+        new_app.generate_admin_report(company, emp_no)
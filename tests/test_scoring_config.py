@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+"""评分规则配置：发布、导出后重新发布，以及早期版本中未参与评分的项"""
+
+import json
+import sqlite3
+
+import pytest
+
+import scoring_config
+from scoring_config import (DEFAULT_SCORING_CONFIG, ensure_scoring_config_tables, get_scoring_config,
+                            load_raw_config, publish_scoring_config)
+
+
+@pytest.fixture
+def conn(monkeypatch):
+    # 解析结果按版本号缓存在进程内，每个测试使用独立的缓存
+    monkeypatch.setattr(scoring_config, '_cache', {})
+    conn = sqlite3.connect(':memory:')
+    ensure_scoring_config_tables(conn)
+    yield conn
+    conn.close()
+
+
+def test_exported_config_republishes(conn):
+    _, raw = load_raw_config(conn)
+    assert publish_scoring_config(conn, raw, '原样发布') == 2
+    assert get_scoring_config(conn).dimension_maps == get_scoring_config(conn, 1).dimension_maps
+
+
+def test_reverse_questions_rejected(conn):
+    raw = dict(DEFAULT_SCORING_CONFIG, reverse_questions=[3, 5])
+    with pytest.raises(ValueError, match='reverse_questions'):
+        publish_scoring_config(conn, raw)
+
+
+def test_legacy_reverse_questions_ignored(conn):
+    # 早期发布的版本带有反向题列表，仍可读取，导出时不再包含
+    legacy = dict(DEFAULT_SCORING_CONFIG, reverse_questions=[3, 5, 27])
+    conn.execute('INSERT INTO scoring_configs (版本, 配置) VALUES (2, ?)', (json.dumps(legacy, ensure_ascii=False),))
+    assert get_scoring_config(conn, 2).situation_scores == get_scoring_config(conn, 1).situation_scores
+    assert 'reverse_questions' not in load_raw_config(conn, 2)[1]
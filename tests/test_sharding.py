@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+"""按公司分片：只有员工登录时创建分片，读取和后台写入不存在的公司不生成文件"""
+
+import os
+import shutil
+
+import pytest
+
+import norms
+from answer_capture import AnswerWriteBehind
+from conftest import make_answers
+from sharding import ShardedRepository, shard_filename
+
+
+@pytest.fixture
+def sharded(new_app, question_db, tmp_path, monkeypatch):
+    """new_app 改用按公司分片的存储仓库，返回分片目录"""
+    main_db = str(tmp_path / 'main.db')
+    shutil.copy(question_db, main_db)
+    shard_dir = str(tmp_path / 'shards')
+    repo = ShardedRepository(main_db, shard_dir)
+    repo.ensure_schema('admin', 'admin123')
+    monkeypatch.setattr(new_app, 'repo', repo)
+    monkeypatch.setattr(new_app, 'read_repo', repo)
+    monkeypatch.setattr(new_app, 'answer_writer', AnswerWriteBehind(repo))
+    yield shard_dir
+    repo.close()
+
+
+def test_reads_do_not_create_shards(new_app, client, sharded):
+    for company in ('不存在的公司', '../x', 'a' * 200):
+        r = client.get('/api/answers', query_string={'公司名称': company, '员工工号': 'E1'})
+        assert r.status_code == 200 and r.get_json()['count'] == 0
+    r = client.get('/api/admin/attempts', query_string={'公司名称': '不存在的公司', '员工工号': 'E1'})
+    assert r.status_code == 200 and r.get_json()['attempts'] == []
+    r = client.post('/api/answers', json={'公司名称': '不存在的公司', '员工工号': 'E1', 'answers': [{'id': 1, 'answer': 'A'}]})
+    assert r.status_code == 409
+    r = client.post('/api/submit', json={'公司名称': '不存在的公司', '员工工号': 'E1', 'answers': [],
+                                         'incremental': True, 'ids': [1]})
+    assert r.status_code == 409
+    assert os.listdir(sharded) == []
+
+
+def test_login_creates_shard(new_app, client, sharded):
+    assert client.post('/api/login', json={'公司名称': '甲公司', '员工名称': '张三', '员工工号': 'E1'}).status_code == 200
+    assert shard_filename('甲公司') in os.listdir(sharded)
+    r = client.get('/api/answers', query_string={'公司名称': '甲公司', '员工工号': 'E1'})
+    assert r.status_code == 200 and r.get_json()['count'] == 0
+
+
+def test_submit_keeps_merged_norms(new_app, client, questions, sharded, monkeypatch):
+    for company in ('甲公司', '乙公司'):
+        client.post('/api/login', json={'公司名称': company, '员工名称': '张三', '员工工号': 'E1'})
+    merged = new_app.repo.norm_tables()
+    for seed in range(3):
+        assert client.post('/api/submit', json={'公司名称': '甲公司', '员工工号': 'E1',
+                                                'answers': make_answers(questions, seed)}).status_code == 200
+    # 提交不使合并后的常模失效，到重新读取的间隔后才合并新的分布
+    assert new_app.repo.norm_tables() is merged
+    monkeypatch.setattr(norms, 'NORM_RELOAD_INTERVAL', 0)
+    assert new_app.repo.norm_tables()[(norms.NORM_COLUMNS[0], norms.ALL_COMPANIES)].total == 1
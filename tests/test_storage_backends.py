@@ -0,0 +1,276 @@
+# -*- coding: utf-8 -*-
+"""
+存储仓库在 SQLite 与 PostgreSQL 上的同一组测试：占位符转换、员工 upsert、提交、分页和迁移
+
+PostgreSQL 的用例在设置 TEST_DATABASE_URL（postgresql:// 开头）时运行，否则跳过。
+该数据库专用于测试：每个用例开始前清空其 public 模式
+"""
+
+import json
+import os
+import sqlite3
+
+import pytest
+
+import norms
+from answer_store import get_sheet_layout
+from conftest import make_answers
+from database import _postgres_sql
+from migrations import MIGRATIONS, migrate, pending_migrations
+from norms import NORM_COLUMNS, clear_norms, record_scores
+from question_options import read_structured_questions
+from question_payload import build_question_payload, build_question_sections
+from repository import QUESTION_COLUMNS, decode_cursor, open_repository
+from scoring import EMPLOYEE_SCORE_COLUMNS, employee_score_values, get_scoring_plan
+from scoring_config import get_scoring_config
+from wire_format import decode_packed_answers
+
+PG_URL = os.environ.get('TEST_DATABASE_URL')
+
+BACKENDS = [
+    'sqlite',
+    pytest.param('postgresql', marks=pytest.mark.skipif(not PG_URL, reason='未设置 TEST_DATABASE_URL')),
+]
+
+
+@pytest.fixture(params=BACKENDS)
+def target(request, tmp_path):
+    """空数据库的地址"""
+    if request.param == 'sqlite':
+        return str(tmp_path / 'test.db')
+    import psycopg2
+    conn = psycopg2.connect(PG_URL)
+    conn.autocommit = True
+    try:
+        conn.cursor().execute('DROP SCHEMA public CASCADE; CREATE SCHEMA public;')
+    finally:
+        conn.close()
+    return PG_URL
+
+
+@pytest.fixture
+def repo(target, question_db):
+    """已建表并导入题库的存储仓库"""
+    repo = open_repository(target)
+    repo.ensure_schema('admin', 'admin123')
+    source = sqlite3.connect(question_db)
+    try:
+        rows = source.execute(f'SELECT {", ".join(QUESTION_COLUMNS)} FROM questions ORDER BY id').fetchall()
+    finally:
+        source.close()
+    with repo.transaction() as conn:
+        repo.import_questions(conn, rows)
+    yield repo
+    repo.release()
+    repo.close()
+
+
+def submit(repo, company, emp_no, answers):
+    """与 /api/submit 相同的评分和写入，返回写入的得分"""
+    conn = repo.connection()
+    plan, layout = get_scoring_plan(conn), get_sheet_layout(conn)
+    values = employee_score_values(plan.score(answers))
+    with repo.transaction(immediate=True) as conn:
+        repo.save_attempt(conn, company, emp_no, layout, layout.pack(answers), plan.config_version, values)
+    return dict(zip(EMPLOYEE_SCORE_COLUMNS, values))
+
+
+def test_placeholder_translation():
+    assert _postgres_sql('SELECT * FROM t WHERE a = ? AND b = ?') == 'SELECT * FROM t WHERE a = %s AND b = %s'
+    # 原有的 % 需要转义，否则会被 psycopg2 当作占位符
+    assert _postgres_sql("SELECT ? WHERE x LIKE '%a'") == "SELECT %s WHERE x LIKE '%%a'"
+
+
+def test_placeholders_and_percent_literal(repo):
+    conn = repo.connection()
+    assert conn.execute("SELECT ? || '%'", ('50',)).fetchone()[0] == '50%'
+    assert repo.count_questions() == len(repo.list_questions()) > 0
+
+
+def test_import_rejects_malformed_options(repo):
+    rows = [row for row in repo.list_questions() if row[3] == '单选'][:2]
+    bad = (rows[1][0], rows[1][1], rows[1][2], rows[1][3], 'Z')
+    with pytest.raises(ValueError, match=f'题目 {bad[0]}'):
+        with repo.transaction() as conn:
+            repo.import_questions(conn, [rows[0], bad])
+    # 整批不写入，原有题目保持不变
+    assert {row[0]: tuple(row) for row in repo.list_questions()}[bad[0]] == tuple(rows[1])
+
+
+def test_question_read_path_does_not_write(repo):
+    # 模拟直接修改题库后尚未解析：一题格式正确，一题单选答案不在选项中
+    good, bad = [row for row in repo.list_questions() if row[3] == '单选'][:2]
+    with repo.transaction() as conn:
+        conn.execute('UPDATE questions SET 选项结构 = NULL WHERE id = ?', (good[0],))
+        conn.execute("UPDATE questions SET 正确答案 = 'Z', 选项结构 = NULL WHERE id = ?", (bad[0],))
+    conn = repo.connection()
+    questions = {q[0]: q for q in read_structured_questions(conn)}
+    assert bad[0] not in questions and questions[good[0]][4]
+    body = build_question_payload(conn, 0).variants[None][0].decode('utf-8')
+    assert f'"id":{good[0]},' in body and f'"id":{bad[0]},' not in body
+    # 读取路径不回写选项结构
+    assert conn.execute('SELECT COUNT(*) FROM questions WHERE 选项结构 IS NULL').fetchone()[0] == 2
+
+
+def test_compact_positions_follow_sheet_layout(repo):
+    # 靠前的一题格式错误、读取时被跳过，之后各题的位置不能错开
+    bad = [row for row in repo.list_questions() if row[3] == '单选'][0]
+    with repo.transaction() as conn:
+        conn.execute("UPDATE questions SET 正确答案 = 'Z', 选项结构 = NULL WHERE id = ?", (bad[0],))
+    conn = repo.connection()
+    ids = [row[0] for row in conn.execute('SELECT id FROM questions ORDER BY id')]
+    compact = json.loads(build_question_payload(conn, 0, compact=True).variants[None][0])
+    sections = build_question_sections(conn, 0, get_scoring_config(conn))
+    blocks = [json.loads(p.variants[None][0]) for p in sections.compact_payloads]
+    for body in [compact] + blocks:
+        assert body['slots'] == len(ids)
+        assert body['questions']['pos'] == [ids.index(q_id) for q_id in body['questions']['id']]
+    assert bad[0] not in compact['questions']['id']
+    assert sum(len(body['questions']['id']) for body in blocks) == len(ids) - 1
+
+    # 按下发的位置打包的答案与按题号提交的答案一致
+    columns = compact['questions']
+    delivered = [{'id': q_id, 'options': options, 'question_type': compact['type_names'][t]}
+                 for q_id, options, t in zip(columns['id'], columns['options'], columns['type'])]
+    answers = make_answers(delivered, 3)
+    packed = ['.'] * compact['slots']
+    for pos, ans in zip(columns['pos'], answers):
+        packed[pos] = str(ans['answer'])
+    layout = get_sheet_layout(conn)
+    unpacked = layout.unpack(decode_packed_answers(layout, ''.join(packed)))
+    assert {a['id']: str(a['answer']) for a in unpacked} == {a['id']: str(a['answer']) for a in answers}
+
+
+def test_upsert_employee(repo):
+    with repo.transaction(immediate=True) as conn:
+        repo.upsert_employee(conn, '甲公司', 'E1', '张三')
+        repo.upsert_employee(conn, '乙公司', 'E1', '李四')
+    with repo.transaction(immediate=True) as conn:
+        repo.upsert_employee(conn, '甲公司', 'E1', '张三丰')
+    assert repo.get_employee('甲公司', 'E1')['姓名'] == '张三丰'
+    assert repo.get_employee('乙公司', 'E1')['姓名'] == '李四'
+    assert repo.connection().execute('SELECT COUNT(*) FROM employees').fetchone()[0] == 2
+
+
+def test_submit_records_attempts(repo, questions):
+    with repo.transaction(immediate=True) as conn:
+        repo.upsert_employee(conn, '甲公司', 'E1', '张三')
+    submit(repo, '甲公司', 'E1', make_answers(questions, 0))
+    latest = submit(repo, '甲公司', 'E1', make_answers(questions, 1))
+    employee = repo.get_employee('甲公司', 'E1')
+    assert {col: employee[col] for col in EMPLOYEE_SCORE_COLUMNS} == latest
+    assert len(repo.list_attempts('甲公司', 'E1')) == 2
+    # 员工不存在时只保存答卷，不写测评记录
+    submit(repo, '甲公司', 'nobody', make_answers(questions, 0))
+    assert repo.list_attempts('甲公司', 'nobody') == []
+
+
+def test_submit_keeps_norm_version(repo, questions, monkeypatch):
+    conn = repo.connection()
+
+    def version():
+        return conn.execute('SELECT version FROM norm_state WHERE id = 1').fetchone()[0]
+
+    before = version()
+    tables = repo.norm_tables()
+    with repo.transaction(immediate=True) as c:
+        repo.upsert_employee(c, '甲公司', 'E1', '张三')
+    scores = submit(repo, '甲公司', 'E1', make_answers(questions, 0))
+    with repo.transaction(immediate=True) as c:
+        record_scores(c, '甲公司', 'E1', scores)
+    # 提交不写 norm_state，未到重新读取的间隔时沿用缓存
+    assert version() == before
+    assert repo.norm_tables() is tables
+    monkeypatch.setattr(norms, 'NORM_RELOAD_INTERVAL', 0)
+    assert repo.norm_tables()[(NORM_COLUMNS[0], '甲公司')].total == 1
+    # 清空常模递增版本，缓存立即失效
+    monkeypatch.setattr(norms, 'NORM_RELOAD_INTERVAL', 3600)
+    assert repo.norm_tables()
+    with repo.transaction() as c:
+        clear_norms(c)
+    assert version() == before + 1
+    assert repo.norm_tables() == {}
+
+
+def test_employee_pagination(repo, questions):
+    with repo.transaction(immediate=True) as conn:
+        for n in range(7):
+            repo.upsert_employee(conn, '甲公司' if n % 2 else '乙公司', f'E{n}', f'员工{n}')
+    submit(repo, '甲公司', 'E1', make_answers(questions, 0))
+
+    seen, cursor = [], None
+    while True:
+        rows, cursor = repo.list_employees(after=cursor, limit=3)
+        seen.extend(row['工号'] for row in rows)
+        if cursor is None:
+            break
+        assert len(decode_cursor(cursor)) == 2
+    # 同一事务内创建时间相同，按 id 倒序
+    assert seen == [f'E{n}' for n in reversed(range(7))]
+
+    rows, _ = repo.list_employees(公司名称='甲公司')
+    assert [row['工号'] for row in rows] == ['E5', 'E3', 'E1']
+    rows, _ = repo.list_employees(最低分={'管理能力': 0.01})
+    assert [(row['工号'], bool(row['已测评'])) for row in rows] == [('E1', True)]
+
+
+def test_disc_filter_follows_latest_attempt(repo, questions):
+    with repo.transaction(immediate=True) as conn:
+        repo.upsert_employee(conn, '甲公司', 'E1', '张三')
+        repo.upsert_employee(conn, '甲公司', 'E2', '李四')
+    # 提高某一型的各题得分，使行为模式类型确定
+    disc = {q['id'] for q in questions if 46 <= q['id'] <= 65}
+    def answers(favoured):
+        return [dict(a, answer='5' if a['id'] in favoured else '1') if a['id'] in disc else a
+                for a in make_answers(questions)]
+    assert submit(repo, '甲公司', 'E1', answers(range(46, 51)))['行为模式类型'] == 'D型支配型'
+    submit(repo, '甲公司', 'E2', answers(range(46, 51)))
+    assert [row['工号'] for row in repo.list_employees(行为模式类型='D型支配型')[0]] == ['E2', 'E1']
+    # 再次测评后按最新一次的类型筛选
+    assert submit(repo, '甲公司', 'E1', answers(range(61, 66)))['行为模式类型'] == 'C型谨慎型'
+    assert [row['工号'] for row in repo.list_employees(行为模式类型='D型支配型')[0]] == ['E2']
+    assert [row['工号'] for row in repo.list_employees(行为模式类型='C型谨慎型')[0]] == ['E1']
+
+
+def test_disc_filter_uses_index(repo):
+    if repo.dialect != 'sqlite':
+        pytest.skip('查询计划只检查 SQLite')
+    plan = ' '.join(row[-1] for row in repo.connection().execute(
+        'EXPLAIN QUERY PLAN SELECT id FROM employees e WHERE e.行为模式类型 = ? ORDER BY e.创建时间 DESC, e.id DESC',
+        ('D型支配型',)))
+    assert 'idx_employees_disc_created' in plan and 'TEMP B-TREE' not in plan
+
+
+def test_migrations_idempotent(repo):
+    conn = repo.connect()
+    try:
+        assert pending_migrations(conn) == []
+        assert migrate(conn) == []
+        versions = [row[0] for row in conn.execute('SELECT 版本 FROM schema_version ORDER BY 版本')]
+    finally:
+        conn.close()
+    assert versions == [m.version for m in MIGRATIONS]
+
+
+def test_migrate_legacy_employee_scores(target):
+    # 第 12 个迁移之前得分保存在员工表中，迁移后成为该员工的一条测评记录
+    repo = open_repository(target)
+    conn = repo.connect()
+    try:
+        migrate(conn, target=11)
+        conn.execute("INSERT INTO employees (姓名, 工号, 公司名称, 管理能力, 行为模式类型) VALUES (?, ?, ?, ?, ?)",
+                     ('张三', 'E1', '甲公司', 3.5, 'D型支配型'))
+        conn.execute("INSERT INTO employees (姓名, 工号, 公司名称) VALUES (?, ?, ?)", ('李四', 'E2', '甲公司'))
+        conn.commit()
+        assert migrate(conn) == [m.version for m in MIGRATIONS if m.version > 11]
+    finally:
+        conn.close()
+    try:
+        tested = repo.get_employee('甲公司', 'E1')
+        assert (tested['管理能力'], tested['行为模式类型']) == (3.5, 'D型支配型')
+        untested = repo.get_employee('甲公司', 'E2')
+        assert (untested['管理能力'], untested['行为模式类型']) == (0.0, None)
+        assert len(repo.list_attempts('甲公司', 'E1')) == 1
+    finally:
+        repo.release()
+        repo.close()
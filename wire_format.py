@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+紧凑传输格式（版本1）
+题目：按列返回 {"id": [...], "pos": [...], "content": [...], "options": [...], "type": [...]}，
+     题型用 type_names 中的序号表示，不下发正确答案；pos 为答卷布局中的位置，slots 为答卷位置数
+     （格式有误、未下发的题目也占据位置）
+提交：请求头 X-Wire-Format: 1，answers 为按题库位置排列的压缩字符串（每题一个字符，
+     "." 未作答，评分题 1-5，选择题 A-Z）或同样按位置排列的数组（null 未作答）；请求体可用 gzip 压缩。
+     服务器直接把字符串转成答卷字节并按预计算的得分表累计，不构造逐题字典
+
+原有的 JSON 格式保持不变
+"""
+
+import gzip
+import io
+import threading
+
+from answer_store import UNANSWERED, decode_answer, encode_answer
+
+WIRE_FORMAT_VERSION = 1
+WIRE_FORMAT_HEADER = 'X-Wire-Format'
+# 解压后的请求体上限，防止压缩炸弹
+MAX_BODY_SIZE = 1 << 20
+
+# 压缩字符串 -> 答卷字节："." 表示未作答，小写字母按大写处理
+_PACKED_TABLE = bytes.maketrans(b'.abcdefghijklmnopqrstuvwxyz', b'\x00ABCDEFGHIJKLMNOPQRSTUVWXYZ')
+_RATING_CODES = frozenset(b'\x0012345')
+_CHOICE_CODES = frozenset(b'\x00ABCDEFGHIJKLMNOPQRSTUVWXYZ')
+
+_scorer_lock = threading.Lock()
+_scorers = {}
+
+
+def compact_body(layout_version, questions, positions, type_names, **extra):
+    """题目对象列表 -> 紧凑格式响应体；positions 为 {题号: 在整卷中的位置}"""
+    type_index = {name: i for i, name in enumerate(type_names)}
+    columns = {
+        "id": [q["id"] for q in questions],
+        "pos": [positions[q["id"]] for q in questions],
+        "content": [q["content"] for q in questions],
+        "options": [q["options"] for q in questions],
+        "type": [type_index[q["question_type"]] for q in questions],
+    }
+    body = {"format": WIRE_FORMAT_VERSION, "layout": layout_version, "type_names": list(type_names)}
+    body.update(extra)
+    body["questions"] = columns
+    return body
+
+
+def decode_body(raw, content_encoding=None):
+    """按 Content-Encoding 解压请求体，格式或大小不符时抛出 ValueError"""
+    if not content_encoding or content_encoding == 'identity':
+        return raw
+    if content_encoding != 'gzip':
+        raise ValueError(f'不支持的请求体编码: {content_encoding}')
+    try:
+        with gzip.GzipFile(fileobj=io.BytesIO(raw)) as f:
+            data = f.read(MAX_BODY_SIZE + 1)
+    except (OSError, EOFError) as e:
+        raise ValueError(f'请求体解压失败: {e}') from e
+    if len(data) > MAX_BODY_SIZE:
+        raise ValueError('请求体过大')
+    return data
+
+
+def decode_packed_answers(layout, packed):
+    """压缩答案（字符串或数组）-> 答卷字节，长度或字符不合法时抛出 ValueError"""
+    if not isinstance(packed, (str, list)):
+        raise ValueError('answers 必须是字符串或数组')
+    n = len(layout.ids)
+    if len(packed) != n:
+        raise ValueError(f'答案长度应为 {n}，实际为 {len(packed)}')
+    if isinstance(packed, str):
+        try:
+            blob = packed.encode('ascii').translate(_PACKED_TABLE)
+        except UnicodeEncodeError:
+            raise ValueError('答案只能包含 ASCII 字符') from None
+        for pos, (code, is_rating) in enumerate(zip(blob, layout.rating)):
+            if code not in (_RATING_CODES if is_rating else _CHOICE_CODES):
+                raise ValueError(f'第 {pos + 1} 个位置的答案不合法: {packed[pos]!r}')
+        return blob
+    return bytes(UNANSWERED if value is None or value == '' else encode_answer(value, is_rating)
+                 for value, is_rating in zip(packed, layout.rating))
+
+
+class PackedScorer:
+    """对某个答卷布局预计算 每题每字节 的得分，直接对答卷字节累计各维度分数和与题数"""
+
+    __slots__ = ('entries', 'n_slots')
+
+    def __init__(self, plan, layout):
+        self.n_slots = len(plan.slots)
+        entries = []
+        for pos, (q_id, is_rating) in enumerate(zip(layout.ids, layout.rating)):
+            entry = plan.lookup(q_id)
+            if entry is None:
+                continue
+            slots, scorer = entry
+            lut = [0] * 256
+            for code in range(1, 256):
+                lut[code] = scorer(decode_answer(code, is_rating))
+            entries.append((pos, slots, lut))
+        self.entries = tuple(entries)
+
+    def tally(self, blob):
+        sums = [0] * self.n_slots
+        counts = [0] * self.n_slots
+        for pos, slots, lut in self.entries:
+            code = blob[pos]
+            if code == UNANSWERED:
+                continue
+            value = lut[code]
+            for slot in slots:
+                sums[slot] += value
+                counts[slot] += 1
+        return sums, counts
+
+
+def get_packed_scorer(plan, layout):
+    """按 (题库版本, 评分配置版本) 缓存 PackedScorer"""
+    key = (plan.version, plan.config_version, layout.version)
+    scorer = _scorers.get(key)
+    if scorer is not None:
+        return scorer
+    with _scorer_lock:
+        scorer = _scorers.get(key)
+        if scorer is None:
+            scorer = PackedScorer(plan, layout)
+            # 只保留当前版本
+            _scorers.clear()
+            _scorers[key] = scorer
+        return scorer